@@ -0,0 +1,241 @@
+"""
+Field accuracy versus latency of preprocessing and OCR settings.
+
+Sweeps utils.preprocess_image() parameters (resize scale, bilateral filter
+diameter, adaptive threshold block size and constant) and Tesseract page
+segmentation modes over a labelled corpus:
+
+- the sample documents in backend/resources/, labelled in
+  backend/resources/labels.json,
+- synthetic renders from bench_tesseract_vocab, labelled with the fields
+  parsed from their clean source text.
+
+For each setting every page is preprocessed and OCR'd as extract() does
+(extractor.ocr_page() with the document type's vocabulary), the text is parsed
+with PrescriptionParser / PatientDetailsParser and compared with the labels:
+
+- accuracy: share of labelled fields parsed exactly (whitespace and case
+  normalized),
+- similarity: mean difflib ratio of parsed and labelled fields,
+- ms/page: preprocessing plus OCR time, best of ``--repeat`` runs.
+
+Settings no other setting beats on both accuracy and ms/page form the Pareto
+frontier (marked ``*``); the report ends with the fastest frontier setting
+whose accuracy meets ``--min-accuracy``. The production setting is marked
+``default``. Uses the OCR engine selected by RXTRACT_OCR_ENGINE, so run it
+with a real Tesseract install for meaningful numbers; with the stub engine it
+only smoke-tests the plumbing.
+
+Usage:
+    python backend/benchmarks/bench_accuracy_latency.py [--synthetic 4] [--min-accuracy 0.8]
+        [--scales 1.0,1.5,2.0] [--psm 6,4,6+4,11] [--denoise 0,9] [--block-sizes 31,65]
+        [--constants 13] [--json report.json]
+"""
+import argparse
+import difflib
+import itertools
+import json
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(os.path.dirname(BENCH_DIR))
+sys.path.insert(0, os.path.join(REPO_ROOT, "backend", "src"))
+
+os.environ.setdefault("RXTRACT_DEBUG_ARTIFACTS", "0")
+os.environ.setdefault("RXTRACT_OCR_CACHE", "0")
+
+import extractor  # noqa: E402
+import knowledge_base  # noqa: E402
+import tesseract_vocab  # noqa: E402
+import utils  # noqa: E402
+from bench_tesseract_vocab import PARSERS, render, synthetic_document  # noqa: E402
+from word_table import WordTable  # noqa: E402
+
+LABELS_PATH = os.path.join(REPO_ROOT, "backend", "resources", "labels.json")
+
+# Tesseract passes per page segmentation mode choice; "6+4" is extractor.OCR_CONFIGS
+PSM_CONFIGS = {
+    "3": ["--psm 3 --oem 3"],
+    "4": ["--psm 4 --oem 3"],
+    "6": ["--psm 6 --oem 3"],
+    "11": ["--psm 11 --oem 3"],
+    "6+4": list(extractor.OCR_CONFIGS),
+}
+# The setting extract() uses
+DEFAULT_SETTING = {"scale": extractor.OCR_SCALE, "psm": "6+4", "denoise": 9, "block_size": 65, "constant": 13}
+
+
+def load_corpus(labels_path=LABELS_PATH, synthetic=4, seed=0):
+    """Labelled documents as dicts with name, file_format, pages and fields"""
+    documents = []
+    if labels_path:
+        with open(labels_path, "r", encoding="utf-8") as f:
+            labels = json.load(f)
+        resources_dir = os.path.dirname(labels_path)
+        for name, entry in labels.items():
+            path = os.path.join(resources_dir, name)
+            if path.lower().endswith(".pdf"):
+                pages = extractor.convert_pdf_to_images(path)
+            else:
+                pages = extractor.load_image_file(path)
+            documents.append({"name": name, "file_format": entry["file_format"], "pages": pages,
+                              "fields": entry["fields"]})
+
+    if synthetic:
+        kb = knowledge_base.get_knowledge_base()
+        medications = sorted({kb.record(number)["name"] for _, number in kb.names("medication")})
+        conditions = sorted({kb.record(number)["name"] for _, number in kb.names("condition")})
+        rng = random.Random(seed)
+        for file_format, parser_class in PARSERS.items():
+            for i in range(synthetic):
+                lines, _ = synthetic_document(file_format, rng, medications, conditions)
+                documents.append({
+                    "name": f"synthetic/{file_format}_{i + 1}",
+                    "file_format": file_format,
+                    "pages": [render(lines, seed + i)],
+                    "fields": parser_class("\n".join(lines) + "\n").parse(),
+                })
+    return documents
+
+
+def settings_grid(scales, psms, denoise, block_sizes, constants):
+    """Every combination of the given values, as setting dicts"""
+    return [
+        {"scale": scale, "psm": psm, "denoise": diameter, "block_size": block_size, "constant": constant}
+        for scale, psm, diameter, block_size, constant in itertools.product(
+            scales, psms, denoise, block_sizes, constants
+        )
+    ]
+
+
+def ocr_document(pages, setting):
+    """OCR ``pages`` with ``setting`` and return the document text"""
+    configs = [tesseract_vocab.ocr_config(config) for config in PSM_CONFIGS[setting["psm"]]]
+    tables = []
+    for page, img in enumerate(pages, start=1):
+        processed = utils.preprocess_image(img, scale=setting["scale"], denoise=setting["denoise"],
+                                           block_size=setting["block_size"], constant=setting["constant"])
+        tables.append(extractor.ocr_page(processed, page=page, scale=setting["scale"], configs=configs))
+    return WordTable.concat(tables).text
+
+
+def normalize(value):
+    return " ".join(str(value or "").split()).lower()
+
+
+def field_scores(labels, parsed):
+    """(exact matches, summed similarity) of ``parsed`` against the labelled fields"""
+    exact, similarity = 0, 0.0
+    for key, value in labels.items():
+        expected, actual = normalize(value), normalize(parsed.get(key))
+        exact += expected == actual
+        similarity += difflib.SequenceMatcher(None, expected, actual).ratio()
+    return exact, similarity
+
+
+def evaluate(documents, setting, repeat=1):
+    """Accuracy, similarity and ms/page of ``setting`` over ``documents``"""
+    seconds, pages, fields, exact, similarity = 0.0, 0, 0, 0, 0.0
+    for document in documents:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            text = ocr_document(document["pages"], setting)
+            best = min(best, time.perf_counter() - start)
+        seconds += best
+        pages += len(document["pages"])
+        parsed = PARSERS[document["file_format"]](text).parse()
+        document_exact, document_similarity = field_scores(document["fields"], parsed)
+        exact += document_exact
+        similarity += document_similarity
+        fields += len(document["fields"])
+    return dict(
+        setting,
+        ms_per_page=round(seconds * 1000 / max(pages, 1), 1),
+        accuracy=round(exact / max(fields, 1), 4),
+        similarity=round(similarity / max(fields, 1), 4),
+    )
+
+
+def pareto_frontier(results):
+    """Results no other result beats on both accuracy and ms/page, fastest first"""
+    frontier, best_accuracy = [], -1.0
+    for result in sorted(results, key=lambda r: (r["ms_per_page"], -r["accuracy"])):
+        if result["accuracy"] > best_accuracy:
+            frontier.append(result)
+            best_accuracy = result["accuracy"]
+    return frontier
+
+
+def recommend(frontier, min_accuracy):
+    """The fastest frontier result with at least ``min_accuracy``, or None"""
+    return next((result for result in frontier if result["accuracy"] >= min_accuracy), None)
+
+
+def describe(setting):
+    return (f"scale={setting['scale']} psm={setting['psm']} denoise={setting['denoise']} "
+            f"block={setting['block_size']} c={setting['constant']}")
+
+
+def parse_list(value, cast):
+    return [cast(item) for item in value.split(",") if item]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pareto frontier of OCR accuracy versus latency")
+    parser.add_argument("--labels", default=LABELS_PATH, help="labelled documents (empty to skip)")
+    parser.add_argument("--synthetic", type=int, default=4, help="synthetic documents per type")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--scales", default="1.0,1.5,2.0")
+    parser.add_argument("--psm", default="6,4,6+4,11", help=f"any of {', '.join(PSM_CONFIGS)}")
+    parser.add_argument("--denoise", default="0,9", help="bilateral filter diameters (0 skips it)")
+    parser.add_argument("--block-sizes", default="31,65", help="odd adaptive threshold block sizes")
+    parser.add_argument("--constants", default="13", help="adaptive threshold constants")
+    parser.add_argument("--min-accuracy", type=float, default=0.8)
+    parser.add_argument("--json", dest="json_path", help="also write the report as JSON")
+    args = parser.parse_args(argv)
+
+    psms = parse_list(args.psm, str)
+    unknown = [psm for psm in psms if psm not in PSM_CONFIGS]
+    if unknown:
+        parser.error(f"unknown --psm {', '.join(unknown)}")
+    settings = settings_grid(parse_list(args.scales, float), psms, parse_list(args.denoise, int),
+                             parse_list(args.block_sizes, int), parse_list(args.constants, float))
+    if DEFAULT_SETTING not in settings:
+        settings.append(dict(DEFAULT_SETTING))
+
+    documents = load_corpus(args.labels, args.synthetic, args.seed)
+    print(f"OCR engine: {extractor.OCR_ENGINE.name}; {len(documents)} documents, "
+          f"{sum(len(document['pages']) for document in documents)} pages, {len(settings)} settings")
+
+    results = []
+    for setting in settings:
+        results.append(evaluate(documents, setting, args.repeat))
+    frontier = pareto_frontier(results)
+    choice = recommend(frontier, args.min_accuracy)
+
+    print(f"  {'setting':<52}{'ms/page':>10}{'accuracy':>10}{'similarity':>12}")
+    for result in sorted(results, key=lambda r: (r["ms_per_page"], -r["accuracy"])):
+        mark = "*" if result in frontier else " "
+        label = describe(result) + ("  default" if all(result[k] == v for k, v in DEFAULT_SETTING.items()) else "")
+        print(f"{mark} {label:<52}{result['ms_per_page']:>10.1f}{result['accuracy']:>10.3f}"
+              f"{result['similarity']:>12.3f}")
+    if choice is None:
+        print(f"No setting reaches accuracy {args.min_accuracy}")
+    else:
+        print(f"Fastest setting with accuracy >= {args.min_accuracy}: {describe(choice)}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"documents": [document["name"] for document in documents], "results": results,
+                       "frontier": frontier, "min_accuracy": args.min_accuracy, "recommended": choice},
+                      f, indent=2)
+    return {"results": results, "frontier": frontier, "recommended": choice}
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Bytes allocated per page through decode, preprocess and OCR hand-off.
+
+Compares the former pipeline (PIL decode + np.array copies, fresh arrays for
+every preprocessing step, pytesseract-style PNG re-encoding of the page)
+with the current one (single cv2.imdecode, preallocated preprocessing buffers,
+PGM buffer handed to Tesseract's stdin). Tesseract itself is not run, so the
+benchmark works offline and isolates the Python-side copies.
+
+Allocations are measured with tracemalloc, which sees numpy and OpenCV output
+arrays: for each stage the peak of newly allocated memory is recorded. PIL's
+internal buffers are invisible to tracemalloc, so the legacy numbers are a
+lower bound.
+
+Usage:
+    python backend/benchmarks/bench_allocations.py [--pages 10] [--width 1700 --height 2200]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import utils  # noqa: E402
+from extractor import decode_image_bytes  # noqa: E402
+
+
+def synthetic_scan(width, height, seed=0):
+    """A JPEG-encoded colour 'scan' with text lines and paper noise"""
+    rng = np.random.default_rng(seed)
+    page = np.full((height, width, 3), 235, dtype=np.uint8)
+    page += rng.integers(0, 20, size=page.shape, dtype=np.uint8)
+    for i, y in enumerate(range(120, height - 100, 60)):
+        cv2.putText(page, f"Line {i}: Prednisone 20 mg take with food", (80, y),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.2, (20, 20, 20), 2)
+    return cv2.imencode(".jpg", page, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+def legacy_decode(data):
+    return np.array(Image.open(io.BytesIO(data)))
+
+
+def legacy_preprocess(img):
+    gray = cv2.cvtColor(np.array(img), cv2.COLOR_BGR2GRAY)
+    resized = cv2.resize(gray, None, fx=1.5, fy=1.5, interpolation=cv2.INTER_LINEAR)
+    denoised = cv2.bilateralFilter(resized, 9, 75, 75)
+    processed = cv2.adaptiveThreshold(denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 65, 13)
+    return cv2.morphologyEx(processed, cv2.MORPH_CLOSE, np.ones((1, 1), np.uint8))
+
+
+def legacy_ocr_input(processed):
+    # What pytesseract does before calling the binary: PIL copy, then PNG to a temp file
+    buffer = io.BytesIO()
+    Image.fromarray(processed).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def current_ocr_input(processed):
+    return utils.pgm_buffer(processed)
+
+
+PIPELINES = {
+    "legacy": (legacy_decode, legacy_preprocess, legacy_ocr_input),
+    "current": (decode_image_bytes, utils.preprocess_image, current_ocr_input),
+}
+
+
+def measure(pipeline, pages, ocr_calls=2):
+    """
+    Run ``pages`` through ``pipeline`` and return mean bytes allocated and
+    seconds per page for each stage. ``ocr_calls`` OCR hand-offs are made per
+    page, matching the two Tesseract configurations extract() tries.
+    """
+    decode, preprocess, ocr_input = PIPELINES[pipeline]
+    totals = {"decode": [0, 0.0], "preprocess": [0, 0.0], "ocr_input": [0, 0.0]}
+
+    def stage(name, func, *args):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        result = func(*args)
+        totals[name][1] += time.perf_counter() - start
+        totals[name][0] += tracemalloc.get_traced_memory()[1] - before
+        return result
+
+    # Warm-up page so buffers reused across pages are already allocated
+    preprocess(decode(pages[0]))
+
+    tracemalloc.start()
+    try:
+        for data in pages:
+            img = stage("decode", decode, data)
+            processed = stage("preprocess", preprocess, img)
+            for _ in range(ocr_calls):
+                stage("ocr_input", ocr_input, processed)
+            del img, processed
+    finally:
+        tracemalloc.stop()
+
+    count = len(pages)
+    return {name: {"bytes_per_page": int(total[0] / count), "ms_per_page": round(total[1] * 1000 / count, 2)}
+            for name, total in totals.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure bytes allocated per page in the image pipeline")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--width", type=int, default=1700)
+    parser.add_argument("--height", type=int, default=2200)
+    args = parser.parse_args(argv)
+
+    pages = [synthetic_scan(args.width, args.height, seed=i) for i in range(args.pages)]
+    pixels = args.width * args.height
+    print(f"{args.pages} pages of {args.width}x{args.height} ({pixels / 1e6:.1f} MP, "
+          f"{pixels * 3 / 1e6:.1f} MB as BGR)")
+    print(f"{'pipeline':<10}{'stage':<12}{'MB/page':>10}{'x page':>9}{'ms/page':>10}")
+    for pipeline in PIPELINES:
+        results = measure(pipeline, pages)
+        total_bytes = 0
+        for stage_name, result in results.items():
+            total_bytes += result["bytes_per_page"]
+            print(f"{pipeline:<10}{stage_name:<12}{result['bytes_per_page'] / 1e6:>10.1f}"
+                  f"{result['bytes_per_page'] / (pixels * 3):>9.2f}{result['ms_per_page']:>10.1f}")
+        print(f"{pipeline:<10}{'total':<12}{total_bytes / 1e6:>10.1f}{total_bytes / (pixels * 3):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Latency and accuracy of fuzzy medication lookups with a large formulary.
+
+Builds a synthetic formulary (default 50,000 drugs plus synonyms), corrupts
+drug names the way OCR does (confusable characters such as l/1, o/0, rn/m,
+plus dropped and doubled letters) and measures KnowledgeBase.fuzzy_find():
+
+- recall: corrupted names resolved to the right drug,
+- false matches: random non-drug words resolved to any drug above the
+  confidence threshold,
+- mean and p99 latency per token for both.
+
+Usage:
+    python backend/benchmarks/bench_fuzzy_match.py [--drugs 50000] [--tokens 5000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import fuzzy_match  # noqa: E402
+import knowledge_base  # noqa: E402
+from bench_knowledge_base import synthetic_formulary, synthetic_name  # noqa: E402
+
+# Character confusions typical of Tesseract on scanned print
+OCR_CONFUSIONS = {"l": "1", "i": "1", "o": "0", "s": "5", "b": "6", "g": "9", "e": "c", "m": "rn", "rn": "m"}
+
+
+def ocr_corrupt(name, rng, edits):
+    """Apply ``edits`` OCR-style errors to ``name``"""
+    for _ in range(edits):
+        choice = rng.random()
+        confusable = [key for key in OCR_CONFUSIONS if key in name]
+        if choice < 0.6 and confusable:
+            key = rng.choice(confusable)
+            index = name.index(key)
+            name = name[:index] + OCR_CONFUSIONS[key] + name[index + len(key):]
+        elif choice < 0.8 and len(name) > 1:
+            index = rng.randrange(len(name))
+            name = name[:index] + name[index + 1:]
+        else:
+            index = rng.randrange(len(name))
+            name = name[:index] + name[index] + name[index:]
+    return name
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run_lookups(kb, tokens):
+    """Return (results, per-token seconds)"""
+    results, timings = [], []
+    for token in tokens:
+        start = time.perf_counter()
+        results.append(kb.fuzzy_find(token))
+        timings.append(time.perf_counter() - start)
+    return results, timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark fuzzy medication lookups")
+    parser.add_argument("--drugs", type=int, default=50000)
+    parser.add_argument("--tokens", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    formulary = synthetic_formulary(args.drugs, conditions=10)
+    names = list(formulary["medications"])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_path = os.path.join(tmp_dir, "formulary.json")
+        with open(source_path, "w") as f:
+            json.dump(formulary, f)
+        start = time.perf_counter()
+        index_path = knowledge_base.build_index(source_path, os.path.join(tmp_dir, "formulary.idx"))
+        build_seconds = time.perf_counter() - start
+        kb = knowledge_base.KnowledgeBase(index_path)
+        print(f"{len(kb)} records, {kb.key_count} names, {kb.delete_count} deletes; "
+              f"index {os.path.getsize(index_path) / 1e6:.1f} MB built in {build_seconds:.1f} s")
+
+        rng = random.Random(1)
+        print(f"{'tokens':<22}{'resolved':>10}{'mean us':>10}{'p99 us':>10}")
+        for edits in (0, 1, 2):
+            targets = [rng.choice(names) for _ in range(args.tokens)]
+            tokens = [ocr_corrupt(name, rng, edits) for name in targets]
+            results, timings = run_lookups(kb, tokens)
+            correct = sum(1 for target, result in zip(targets, results)
+                          if result is not None and result["confidence"] >= fuzzy_match.MIN_CONFIDENCE
+                          and result["name"] == target)
+            print(f"{f'{edits} OCR errors':<22}{correct / len(tokens):>10.1%}"
+                  f"{sum(timings) / len(timings) * 1e6:>10.1f}{percentile(timings, 0.99) * 1e6:>10.1f}")
+
+        others = [synthetic_name(rng, rng.randint(6, 12)) for _ in range(args.tokens)]
+        results, timings = run_lookups(kb, others)
+        false_matches = sum(1 for result in results
+                            if result is not None and result["confidence"] >= fuzzy_match.MIN_CONFIDENCE)
+        print(f"{'non-drug words':<22}{false_matches / len(others):>10.1%}"
+              f"{sum(timings) / len(timings) * 1e6:>10.1f}{percentile(timings, 0.99) * 1e6:>10.1f}")
+        kb.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Drug-drug interaction lookup latency with a large formulary.
+
+Builds a synthetic 10,000-drug knowledge base with a sparse random
+interaction matrix, then times KnowledgeBase.interactions() for prescriptions
+of k medications against the naive approach of scanning every interaction
+rule for each prescription.
+
+Usage:
+    python backend/benchmarks/bench_interactions.py [--drugs 10000] [--interactions 200000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import knowledge_base  # noqa: E402
+from bench_knowledge_base import synthetic_formulary  # noqa: E402
+
+
+def synthetic_interactions(names, count, seed=0):
+    rng = random.Random(seed)
+    pairs = set()
+    while len(pairs) < count:
+        first, second = rng.sample(names, 2)
+        pairs.add((min(first, second), max(first, second)))
+    return [{"drugs": list(pair), "severity": rng.choice(knowledge_base.SEVERITIES),
+             "description": "Synthetic interaction."} for pair in sorted(pairs)]
+
+
+def scan_rules(rules, medications):
+    """The rule-list baseline: test every rule against the prescription"""
+    present = set(medications)
+    return [rule for rule in rules if rule["drugs"][0] in present and rule["drugs"][1] in present]
+
+
+def time_per_call(func, prescriptions):
+    start = time.perf_counter()
+    for medications in prescriptions:
+        func(medications)
+    return (time.perf_counter() - start) / len(prescriptions)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark drug-drug interaction lookups")
+    parser.add_argument("--drugs", type=int, default=10000)
+    parser.add_argument("--interactions", type=int, default=200000)
+    parser.add_argument("--prescriptions", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    formulary = synthetic_formulary(args.drugs, conditions=10)
+    names = list(formulary["medications"])
+    rules = synthetic_interactions(names, args.interactions)
+    formulary["interactions"] = rules
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_path = os.path.join(tmp_dir, "formulary.json")
+        with open(source_path, "w") as f:
+            json.dump(formulary, f)
+        start = time.perf_counter()
+        index_path = knowledge_base.build_index(source_path, os.path.join(tmp_dir, "formulary.idx"))
+        build_seconds = time.perf_counter() - start
+        kb = knowledge_base.KnowledgeBase(index_path)
+
+        print(f"{args.drugs} drugs, {kb.interaction_count} interacting pairs "
+              f"({kb.interaction_count / (args.drugs * (args.drugs - 1) / 2):.2%} of all pairs); "
+              f"index built in {build_seconds:.1f} s")
+        print(f"{'k meds':>7}{'pairs':>7}{'index us':>11}{'rule scan us':>14}{'found/rx':>10}")
+        rng = random.Random(1)
+        # Prescriptions drawn from drugs with known interactions so some pairs hit
+        interacting = sorted({drug for rule in rules[:2000] for drug in rule["drugs"]})
+        for k in (2, 5, 10, 20, 50):
+            prescriptions = [rng.sample(interacting, k) for _ in range(args.prescriptions)]
+            index_seconds = time_per_call(kb.interactions, prescriptions)
+            scan_seconds = time_per_call(lambda meds: scan_rules(rules, meds), prescriptions[:max(args.prescriptions // 20, 1)])
+            found = sum(len(kb.interactions(meds)) for meds in prescriptions[:200]) / 200
+            print(f"{k:>7}{k * (k - 1) // 2:>7}{index_seconds * 1e6:>11.1f}{scan_seconds * 1e6:>14.1f}{found:>10.2f}")
+        kb.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Build time, load time, lookup latency and per-worker memory of the knowledge base.
+
+Generates a synthetic formulary (default 50,000 drugs with brand and generic
+synonyms), compiles it with knowledge_base.build_index and measures:
+
+- how long compiling and opening the index take,
+- lookup latency by name and synonym (hits and misses) and per document text,
+- private and proportional memory of each of N worker processes after they
+  open the index and touch every record, against workers that json.load()
+  the source file instead. Memory is read from /proc, so that part is Linux only.
+
+Usage:
+    python backend/benchmarks/bench_knowledge_base.py [--drugs 50000] [--workers 4]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import knowledge_base  # noqa: E402
+
+SIDE_EFFECTS = ["nausea", "headache", "dizziness", "diarrhea", "insomnia", "rash", "fatigue", "dry mouth"]
+
+
+def synthetic_name(rng, length):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def synthetic_formulary(drugs, conditions=500, seed=0):
+    """A knowledge base dict shaped like backend/data/knowledge_base.json, with unique names"""
+    rng = random.Random(seed)
+    used = set()
+
+    def unique_name():
+        while True:
+            name = synthetic_name(rng, rng.randint(6, 12))
+            if name not in used:
+                used.add(name)
+                return name
+
+    medications = {}
+    for _ in range(drugs):
+        name = unique_name()
+        medications[name] = {
+            "synonyms": [unique_name() for _ in range(rng.randint(1, 4))],
+            "uses": [f"condition {rng.randrange(conditions)}" for _ in range(2)],
+            "side_effects": rng.sample(SIDE_EFFECTS, 3),
+            "diet": "Take with food. Avoid alcohol.",
+            "routine": "Take at the same time each day.",
+        }
+    condition_records = {
+        f"{unique_name()} {unique_name()}": {"synonyms": [], "diet": "Balanced diet.", "routine": "Rest."}
+        for _ in range(conditions)
+    }
+    return {"version": 1, "medications": medications, "conditions": condition_records}
+
+
+def memory_kb():
+    """(private, proportional) resident kB of this process"""
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Pss:", "Private_Clean:", "Private_Dirty:"):
+                values[parts[0]] = int(parts[1])
+    return values["Private_Clean:"] + values["Private_Dirty:"], values["Pss:"]
+
+
+def _worker(mode, source_path, index_path, ready, results):
+    before = memory_kb()
+    if mode == "mmap":
+        kb = knowledge_base.KnowledgeBase(index_path)
+        for name, _ in kb.names("medication"):
+            kb.lookup(name)
+    else:
+        with open(source_path) as f:
+            data = json.load(f)
+        for name in data["medications"]:
+            data["medications"][name]["uses"]
+    after = memory_kb()
+    results.put((after[0] - before[0], after[1]))
+    ready.wait()
+
+
+def measure_workers(mode, source_path, index_path, workers):
+    """Start ``workers`` processes that all hold the KB at once; return their memory"""
+    context = multiprocessing.get_context("spawn")
+    ready = context.Event()
+    results = context.Queue()
+    processes = [context.Process(target=_worker, args=(mode, source_path, index_path, ready, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    measurements = [results.get() for _ in processes]
+    ready.set()
+    for process in processes:
+        process.join()
+    return measurements
+
+
+def time_per_call(func, args_list):
+    start = time.perf_counter()
+    for args in args_list:
+        func(*args)
+    return (time.perf_counter() - start) / len(args_list)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the memory-mapped knowledge base")
+    parser.add_argument("--drugs", type=int, default=50000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--lookups", type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_path = os.path.join(tmp_dir, "formulary.json")
+        index_path = os.path.join(tmp_dir, "formulary.idx")
+        formulary = synthetic_formulary(args.drugs)
+        with open(source_path, "w") as f:
+            json.dump(formulary, f)
+
+        start = time.perf_counter()
+        knowledge_base.build_index(source_path, index_path)
+        build_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        kb = knowledge_base.KnowledgeBase(index_path)
+        load_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        with open(source_path) as f:
+            json.load(f)
+        json_seconds = time.perf_counter() - start
+
+        print(f"{len(kb)} records, {kb.key_count} names; source {os.path.getsize(source_path) / 1e6:.1f} MB, "
+              f"index {os.path.getsize(index_path) / 1e6:.1f} MB")
+        print(f"build {build_seconds * 1000:.0f} ms, open index {load_seconds * 1000:.3f} ms "
+              f"(json.load of the source: {json_seconds * 1000:.0f} ms)")
+
+        rng = random.Random(1)
+        names = list(formulary["medications"])
+        synonyms = [synonym for record in formulary["medications"].values() for synonym in record["synonyms"]]
+        hits = [(rng.choice(names),) for _ in range(args.lookups)]
+        synonym_hits = [(rng.choice(synonyms),) for _ in range(args.lookups)]
+        misses = [(synthetic_name(rng, 13),) for _ in range(args.lookups)]
+        print(f"find by name      {time_per_call(kb.find, hits) * 1e6:8.2f} us")
+        print(f"find by synonym   {time_per_call(kb.find, synonym_hits) * 1e6:8.2f} us")
+        print(f"find (miss)       {time_per_call(kb.find, misses) * 1e6:8.2f} us")
+        document = " ".join(rng.choice(names + ["take", "daily", "mg", "20"]) for _ in range(200))
+        print(f"find_in_text, 200-word document {time_per_call(kb.find_in_text, [(document,)] * 100) * 1000:.2f} ms")
+
+        if not os.path.exists("/proc/self/smaps_rollup"):
+            print("Per-worker memory needs /proc/self/smaps_rollup (Linux); skipped")
+            return
+        print(f"\n{args.workers} workers holding the knowledge base at once (kB per worker):")
+        print(f"{'mode':<8}{'private':>10}{'pss':>10}")
+        for mode in ("mmap", "json"):
+            measurements = measure_workers(mode, source_path, index_path, args.workers)
+            private = sum(m[0] for m in measurements) / len(measurements)
+            pss = sum(m[1] for m in measurements) / len(measurements)
+            print(f"{mode:<8}{private:>10.0f}{pss:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
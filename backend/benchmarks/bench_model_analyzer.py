@@ -0,0 +1,97 @@
+"""
+Throughput of model-backed analysis with and without request batching.
+
+Runs ``--concurrency`` threads that each analyze ``--requests`` documents
+through model_analyzer.BatchingEngine, once per batch size, and reports
+documents/second, mean batch size and latency percentiles.
+
+With --model the real TransformersBackend is used (needs torch and
+transformers). Without it, a simulated backend sleeps ``--fixed-ms`` per
+batch plus ``--per-item-ms`` per prompt, the cost shape of batched CPU
+generation, so the batching logic can be measured anywhere.
+
+Usage:
+    python backend/benchmarks/bench_model_analyzer.py [--model DIR --precision int8] [--concurrency 8]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import model_analyzer  # noqa: E402
+from ocr_engine import STUB_OCR_TEXT  # noqa: E402
+
+
+class SimulatedBackend:
+    def __init__(self, fixed_ms, per_item_ms):
+        self.fixed_ms = fixed_ms
+        self.per_item_ms = per_item_ms
+
+    def __call__(self, prompts):
+        time.sleep((self.fixed_ms + self.per_item_ms * len(prompts)) / 1000.0)
+        return ["Hypertension\nRoutine: Rest\nDiet: Low sodium"] * len(prompts)
+
+
+def run(backend, max_batch_size, max_wait_ms, concurrency, requests):
+    engine = model_analyzer.BatchingEngine(backend, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    prompt = model_analyzer.build_prompt(STUB_OCR_TEXT, ["prednisone", "lialda"], ["hypertension"])
+    engine.generate(prompt)  # load the model outside the measurement
+    engine.batches = engine.requests = 0
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        for _ in range(requests):
+            start = time.perf_counter()
+            engine.generate(prompt)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "docs_per_second": len(latencies) / elapsed,
+        "mean_batch": engine.requests / max(engine.batches, 1),
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark batched model analysis")
+    parser.add_argument("--model", help="local transformers checkpoint (default: simulated backend)")
+    parser.add_argument("--precision", choices=model_analyzer.PRECISIONS, default="int8")
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--fixed-ms", type=float, default=40.0)
+    parser.add_argument("--per-item-ms", type=float, default=6.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=10, help="documents per client thread")
+    parser.add_argument("--batch-sizes", default="1,4,8")
+    parser.add_argument("--max-wait-ms", type=float, default=20.0)
+    args = parser.parse_args(argv)
+
+    if args.model:
+        backend = model_analyzer.TransformersBackend(args.model, args.precision, args.max_new_tokens)
+        print(f"Model {args.model} ({args.precision}, {args.max_new_tokens} new tokens)")
+    else:
+        backend = SimulatedBackend(args.fixed_ms, args.per_item_ms)
+        print(f"Simulated backend: {args.fixed_ms} ms per batch + {args.per_item_ms} ms per document")
+
+    print(f"{'batch':>6}{'docs/s':>10}{'mean batch':>12}{'p50 ms':>10}{'p95 ms':>10}")
+    for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+        result = run(backend, batch_size, args.max_wait_ms, args.concurrency, args.requests)
+        print(f"{batch_size:>6}{result['docs_per_second']:>10.1f}{result['mean_batch']:>12.1f}"
+              f"{result['p50_ms']:>10.0f}{result['p95_ms']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
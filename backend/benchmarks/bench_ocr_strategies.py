@@ -0,0 +1,119 @@
+"""
+Time per page and output agreement of the OCR strategies in extract().
+
+``full`` preprocesses every page at 1.5x and OCRs it once per configuration in
+extractor.OCR_CONFIGS (currently two full-page passes). ``coarse_to_fine``
+OCRs a 0.75x page once and re-OCRs only low-confidence lines at 1.5x.
+
+For each document the strategies' page text is compared with difflib (1.0 is
+identical text) and the parsed fields are compared key by key, using ``full``
+as the reference. Uses the OCR engine selected by RXTRACT_OCR_ENGINE, so run
+it with a real Tesseract install for meaningful numbers; with the stub engine
+it only smoke-tests the plumbing.
+
+Usage:
+    python backend/benchmarks/bench_ocr_strategies.py [FILE ...] [--repeat 3]
+"""
+import argparse
+import difflib
+import glob
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(os.path.dirname(BENCH_DIR))
+sys.path.insert(0, os.path.join(REPO_ROOT, "backend", "src"))
+
+os.environ.setdefault("RXTRACT_DEBUG_ARTIFACTS", "0")
+os.environ.setdefault("RXTRACT_OCR_CACHE", "0")
+
+import coarse_to_fine  # noqa: E402
+import extractor  # noqa: E402
+import utils  # noqa: E402
+from parser_patient_details import PatientDetailsParser  # noqa: E402
+from parser_prescription import PrescriptionParser  # noqa: E402
+
+PARSERS = {"prescription": PrescriptionParser, "patient_details": PatientDetailsParser}
+
+
+def default_documents():
+    """The sample documents in backend/resources/, with the document type implied by their names"""
+    documents = []
+    for path in sorted(glob.glob(os.path.join(REPO_ROOT, "backend", "resources", "*", "*.pdf"))):
+        file_format = "patient_details" if os.path.basename(path).startswith("pd") else "prescription"
+        documents.append((path, file_format))
+    return documents
+
+
+def load_pages(path):
+    if path.lower().endswith(".pdf"):
+        return extractor.convert_pdf_to_images(path)
+    return [extractor.load_image_file(path)]
+
+
+def ocr_full(img):
+    return extractor.ocr_page(utils.preprocess_image(img, scale=extractor.OCR_SCALE)).text
+
+
+def ocr_coarse_to_fine(img):
+    coarse = utils.preprocess_image(img, buffers=utils.thread_buffers("coarse"), scale=coarse_to_fine.COARSE_SCALE)
+    words, _ = coarse_to_fine.coarse_to_fine_ocr(
+        extractor.OCR_ENGINE, img, coarse, lang=extractor.OCR_LANG, config=extractor.OCR_CONFIGS[0]
+    )
+    return words.text
+
+
+STRATEGIES = {"full": ocr_full, "coarse_to_fine": ocr_coarse_to_fine}
+
+
+def run_strategy(strategy, pages, repeat):
+    """Return (document text, best seconds per page over ``repeat`` runs)"""
+    ocr = STRATEGIES[strategy]
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text = "\n\n".join(ocr(img) for img in pages)
+        best = min(best, (time.perf_counter() - start) / len(pages))
+    return text, best
+
+
+def field_agreement(reference, candidate):
+    """Fraction of the reference's fields the candidate parsed identically"""
+    if not reference:
+        return 1.0
+    same = sum(1 for key, value in reference.items() if candidate.get(key) == value)
+    return same / len(reference)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare full-page and coarse-to-fine OCR")
+    parser.add_argument("files", nargs="*", help="documents to OCR (default: backend/resources/*/*.pdf)")
+    parser.add_argument("--format", dest="file_format", choices=sorted(PARSERS),
+                        help="document type of FILES (default: prescription)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.files:
+        documents = [(path, args.file_format or "prescription") for path in args.files]
+    else:
+        documents = default_documents()
+
+    print(f"OCR engine: {extractor.OCR_ENGINE.name}")
+    print(f"{'document':<28}{'strategy':<16}{'ms/page':>10}{'speedup':>9}{'text sim':>10}{'fields':>8}")
+    for path, file_format in documents:
+        pages = load_pages(path)
+        reference_text, reference_fields = None, None
+        for strategy in STRATEGIES:
+            text, seconds = run_strategy(strategy, pages, args.repeat)
+            fields = PARSERS[file_format](text).parse()
+            if reference_text is None:
+                reference_text, reference_fields, reference_seconds = text, fields, seconds
+            similarity = difflib.SequenceMatcher(None, reference_text, text).ratio()
+            print(f"{os.path.basename(path):<28}{strategy:<16}{seconds * 1000:>10.1f}"
+                  f"{reference_seconds / seconds:>9.2f}{similarity:>10.3f}"
+                  f"{field_agreement(reference_fields, fields):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
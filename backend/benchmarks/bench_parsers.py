@@ -0,0 +1,275 @@
+"""
+Parser throughput and worst-case latency on realistic and adversarial text.
+
+Generates a deterministic corpus of OCR-like documents of these kinds:
+
+- clean: well-formed prescriptions and patient records,
+- noisy: the same with OCR errors (confusable characters, dropped and doubled
+  letters, stray punctuation, split and merged lines),
+- long: dozens of documents concatenated, as from a long multi-page scan,
+- anchorless: OCR-like words without any of the field labels,
+- repeated_headings: field labels repeated many times with missing values,
+- blank_runs: field labels followed by long runs of empty lines,
+
+and times PrescriptionParser, PatientDetailsParser and the rule-based analyzer
+(SmolDoclingAnalyzer.analyze_prescription()) on every document. Each document
+is timed ``--repeat`` times and its best time kept. Reports docs/sec, p99 and
+worst-case ms per parser and per kind.
+
+With ``--baseline`` the run is compared to an earlier ``--json`` report and
+the script exits with status 1 if a parser's docs/sec dropped or its
+worst-case ms grew by more than ``--max-regression`` (default 25%). Any
+document slower than ``--max-worst-ms`` fails the run regardless of the
+baseline: that catches catastrophic regex backtracking on any machine.
+
+Usage:
+    python backend/benchmarks/bench_parsers.py [--documents 2000] [--repeat 3]
+        [--json report.json] [--baseline report.json] [--max-regression 0.25]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(os.path.dirname(BENCH_DIR))
+sys.path.insert(0, os.path.join(REPO_ROOT, "backend", "src"))
+
+os.environ.setdefault("RXTRACT_DEBUG_ARTIFACTS", "0")
+os.environ.setdefault("RXTRACT_OCR_CACHE", "0")
+# Every corpus document repeats across runs; cached analyses would time dict lookups
+os.environ.setdefault("RXTRACT_ANALYSIS_CACHE_SIZE", "0")
+
+import logging  # noqa: E402
+
+from parser_patient_details import PatientDetailsParser  # noqa: E402
+from parser_prescription import PrescriptionParser  # noqa: E402
+from smoldocling_analyzer import SmolDoclingAnalyzer  # noqa: E402
+
+KINDS = ["clean", "noisy", "long", "anchorless", "repeated_headings", "blank_runs"]
+FORMATS = ["prescription", "patient_details"]
+
+FIRST_NAMES = ["Marta", "Virat", "Jerry", "Grace", "Omar", "Lena", "Kenji", "Aisha"]
+LAST_NAMES = ["Sharapova", "Kohli", "Lucas", "Okafor", "Haddad", "Novak", "Sato", "Bello"]
+STREETS = ["tennis court", "cricket blvd", "Wheeler Ridge Dr", "Elm Street", "Harbor Road"]
+MEDICATIONS = ["Prednisone", "Lialda", "Omeprazole", "Metformin", "Losartan", "Levothyroxine",
+               "Azithromycin", "Lisinopril", "Amlodipine", "Atorvastatin"]
+CONDITIONS = ["Hypertension", "Type 2 diabetes", "Hypothyroidism", "Migraine", "Asthma"]
+HEADINGS = ["Name:", "Address:", "Directions:", "Refill:", "Medical Problems:", "Medication",
+            "Patient Information", "Instructions:", "Phone:", "Insurance:"]
+FILLER = ["the", "and", "tablet", "daily", "take", "with", "food", "clinic", "record", "page",
+          "signature", "weight", "height", "emergency", "contact", "mg", "ml", "per", "week"]
+# Character confusions typical of Tesseract on scanned print
+OCR_CONFUSIONS = {"l": "1", "i": "l", "o": "0", "s": "5", "e": "c", "m": "rn", "a": "o", "D": "O", ":": ";"}
+NOISE = ["|", "~", "_", "'", ".", ",", "-", "«"]
+
+# Parsers timed per document, by name
+TARGETS = {
+    "prescription": lambda analyzer, text: PrescriptionParser(text).parse(),
+    "patient_details": lambda analyzer, text: PatientDetailsParser(text).parse(),
+    "analyzer": lambda analyzer, text: analyzer.analyze_prescription(text),
+}
+
+
+def clean_document(file_format, rng):
+    """Lines of a well-formed document"""
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    phone = f"({rng.randint(200, 999)}) {rng.randint(200, 999)}-{rng.randint(1000, 9999)}"
+    meds = rng.sample(MEDICATIONS, rng.randint(1, 3))
+    if file_format == "prescription":
+        return [
+            "Dr John Smith, M.D", "2 Non-Important Street,", f"New York, Phone {phone}", "",
+            f"Name: {name} Date: {rng.randint(1, 12)}/{rng.randint(1, 28)}/2022", "",
+            f"Address: {rng.randint(1, 99)} {rng.choice(STREETS)}, New York", "",
+            *[f"{med} {rng.choice([5, 10, 20, 40])} mg" for med in meds], "",
+            "Directions:",
+            *[f"{med}, take {rng.randint(1, 2)} tablet every {rng.randint(1, 4)} days" for med in meds], "",
+            f"Refill: {rng.randint(1, 5)} times",
+        ]
+    return [
+        f"{rng.randint(1, 28)}/{rng.randint(1, 12)}/2020", "", "Patient Medical Record", "",
+        "Patient Information Birth Date", f"{name} May {rng.randint(1, 28)} {rng.randint(1940, 2005)}",
+        phone, "",
+        "Current Medications", *[f"{med} {rng.choice([50, 250, 1000])}mg tablet" for med in meds], "",
+        "Medical Problems (including past accidents or injuries)", *rng.sample(CONDITIONS, 2), "",
+        "Have you had a flu vaccination?", rng.choice(["Yes", "No"]), "",
+        "Do you have health insurance?", rng.choice(["Yes", "No"]),
+    ]
+
+
+def ocr_noise(lines, rng, rate=0.08):
+    """Corrupt lines the way OCR does"""
+    noisy = []
+    for line in lines:
+        chars = []
+        for char in line:
+            roll = rng.random()
+            if roll < rate / 2 and char in OCR_CONFUSIONS:
+                chars.append(OCR_CONFUSIONS[char])
+            elif roll < rate * 0.7:
+                continue
+            elif roll < rate * 0.85:
+                chars.append(char * 2)
+            elif roll < rate:
+                chars.append(char + rng.choice(NOISE))
+            else:
+                chars.append(char)
+        line = "".join(chars)
+        roll = rng.random()
+        if roll < 0.1 and noisy:
+            noisy[-1] += " " + line
+        elif roll < 0.2 and len(line) > 4:
+            cut = rng.randrange(1, len(line))
+            noisy.extend([line[:cut], line[cut:]])
+        else:
+            noisy.append(line)
+    return noisy
+
+
+def document(kind, file_format, rng, scale=1.0):
+    """Text of one document of ``kind``; ``scale`` sizes the long and adversarial kinds"""
+    size = max(1, int(scale * rng.randint(20, 40)))
+    if kind == "clean":
+        lines = clean_document(file_format, rng)
+    elif kind == "noisy":
+        lines = ocr_noise(clean_document(file_format, rng), rng)
+    elif kind == "long":
+        lines = []
+        for _ in range(size):
+            lines.extend(ocr_noise(clean_document(file_format, rng), rng, rate=0.03))
+    elif kind == "anchorless":
+        lines = [" ".join(rng.choice(FILLER) for _ in range(rng.randint(3, 12))) for _ in range(size * 10)]
+    elif kind == "repeated_headings":
+        lines = [rng.choice(HEADINGS) for _ in range(size * 10)]
+    elif kind == "blank_runs":
+        lines = []
+        for _ in range(rng.randint(1, 3)):
+            lines.append(rng.choice(HEADINGS) + rng.choice(["", " x", " 12"]))
+            lines.extend([""] * size * 50)
+        lines.append(rng.choice(["", "Dr", "Directions:", "Refill: 2"]))
+    else:
+        raise ValueError(f"Unknown document kind: {kind}")
+    return "\n".join(lines)
+
+
+def corpus(count, seed=0, scale=1.0):
+    """``count`` documents as dicts with kind, file_format and text, every kind in turn"""
+    rng = random.Random(seed)
+    documents = []
+    for i in range(count):
+        kind, file_format = KINDS[i % len(KINDS)], FORMATS[(i // len(KINDS)) % len(FORMATS)]
+        documents.append({"kind": kind, "file_format": file_format,
+                          "text": document(kind, file_format, rng, scale)})
+    return documents
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def summarize(documents, timings):
+    """docs/sec, p99 and worst-case ms of per-document ``timings`` (seconds)"""
+    worst = max(range(len(timings)), key=timings.__getitem__)
+    return {
+        "documents": len(timings),
+        "docs_per_sec": round(len(timings) / sum(timings), 1),
+        "p99_ms": round(percentile(timings, 0.99) * 1e3, 3),
+        "worst_ms": round(timings[worst] * 1e3, 3),
+        "worst_kind": documents[worst]["kind"],
+        "worst_chars": len(documents[worst]["text"]),
+    }
+
+
+def run(documents, repeat=3, targets=None):
+    """Time every target on every document; returns the report"""
+    analyzer = SmolDoclingAnalyzer(mode="rules")
+    report = {}
+    for name in targets or TARGETS:
+        parse = TARGETS[name]
+        timings = []
+        for doc in documents:
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                parse(analyzer, doc["text"])
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            timings.append(best)
+        report[name] = summarize(documents, timings)
+        report[name]["kinds"] = {
+            kind: summarize([doc for doc in documents if doc["kind"] == kind],
+                            [t for doc, t in zip(documents, timings) if doc["kind"] == kind])
+            for kind in KINDS if any(doc["kind"] == kind for doc in documents)
+        }
+    return report
+
+
+def compare(report, baseline=None, max_regression=0.25, max_worst_ms=None):
+    """Failure messages for regressions of ``report`` against ``baseline``"""
+    failures = []
+    for name, result in report.items():
+        if max_worst_ms is not None and result["worst_ms"] > max_worst_ms:
+            failures.append(f"{name}: a {result['worst_kind']} document took {result['worst_ms']} ms "
+                            f"(limit {max_worst_ms} ms)")
+        if not baseline or name not in baseline:
+            continue
+        before = baseline[name]
+        if result["docs_per_sec"] < before["docs_per_sec"] * (1 - max_regression):
+            failures.append(f"{name}: {result['docs_per_sec']} docs/sec, "
+                            f"baseline {before['docs_per_sec']} docs/sec")
+        if result["worst_ms"] > before["worst_ms"] * (1 + max_regression):
+            failures.append(f"{name}: worst case {result['worst_ms']} ms, baseline {before['worst_ms']} ms")
+    return failures
+
+
+def format_report(report):
+    lines = [f"{'parser':<18}{'kind':<20}{'docs/sec':>10}{'p99 ms':>10}{'worst ms':>10}"]
+    for name, result in report.items():
+        for kind, stats in result["kinds"].items():
+            lines.append(f"{name:<18}{kind:<20}{stats['docs_per_sec']:>10}{stats['p99_ms']:>10}"
+                         f"{stats['worst_ms']:>10}")
+        lines.append(f"{name:<18}{'all':<20}{result['docs_per_sec']:>10}{result['p99_ms']:>10}"
+                     f"{result['worst_ms']:>10}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark parser throughput and worst-case latency")
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3, help="timings per document, the best is kept")
+    parser.add_argument("--scale", type=float, default=1.0, help="size of the long and adversarial documents")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--targets", default=",".join(TARGETS), help="comma-separated parsers to time")
+    parser.add_argument("--json", dest="json_path", help="also write the report as JSON")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="allowed fractional drop in docs/sec or growth in worst-case ms")
+    parser.add_argument("--max-worst-ms", type=float, default=250.0,
+                        help="fail if any single document takes longer")
+    args = parser.parse_args(argv)
+
+    # The analyzer logs every call at INFO level
+    logging.disable(logging.INFO)
+    documents = corpus(args.documents, seed=args.seed, scale=args.scale)
+    print(f"{len(documents)} documents, {sum(len(doc['text']) for doc in documents) / 1e6:.1f} M characters")
+    report = run(documents, repeat=args.repeat, targets=args.targets.split(","))
+    print(format_report(report))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    failures = compare(report, baseline, args.max_regression, args.max_worst_ms)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
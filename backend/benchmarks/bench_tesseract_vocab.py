@@ -0,0 +1,142 @@
+"""
+Decode time and field accuracy with and without the Tesseract vocabulary.
+
+Renders synthetic prescriptions and patient records (medication and condition
+names drawn from the knowledge base, speckle noise and blur applied), OCRs
+every page with extractor.ocr_page() using the plain OCR configs and the
+configs with the user-words and user-patterns (see tesseract_vocab), and reports per page:
+
+- ms/page: best OCR time over ``--repeat`` runs,
+- fields: share of parsed fields equal to the fields parsed from the clean
+  source text (whitespace-normalized),
+- meds: share of rendered medication names the analyzer's knowledge base
+  lookup finds exactly in the OCR text.
+
+Uses the OCR engine selected by RXTRACT_OCR_ENGINE, so run it with a real
+Tesseract install for meaningful numbers; with the stub engine it only
+smoke-tests the plumbing.
+
+Usage:
+    python backend/benchmarks/bench_tesseract_vocab.py [--documents 10] [--repeat 2]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(os.path.dirname(BENCH_DIR))
+sys.path.insert(0, os.path.join(REPO_ROOT, "backend", "src"))
+
+os.environ.setdefault("RXTRACT_DEBUG_ARTIFACTS", "0")
+os.environ.setdefault("RXTRACT_OCR_CACHE", "0")
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+
+import extractor  # noqa: E402
+import knowledge_base  # noqa: E402
+import utils  # noqa: E402
+from parser_patient_details import PatientDetailsParser  # noqa: E402
+from parser_prescription import PrescriptionParser  # noqa: E402
+
+PARSERS = {"prescription": PrescriptionParser, "patient_details": PatientDetailsParser}
+FIRST_NAMES = ["Marta", "Jerry", "Anita", "Samuel", "Priya", "Tomasz", "Grace", "Omar"]
+LAST_NAMES = ["Sharapova", "Lucas", "Fernandes", "Okafor", "Lindqvist", "Moreau", "Kowalski", "Haddad"]
+
+
+def synthetic_document(file_format, rng, medications, conditions):
+    """Return (source lines, medication names rendered)"""
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    phone = f"({rng.randint(200, 999)}) {rng.randint(200, 999)}-{rng.randint(1000, 9999)}"
+    meds = rng.sample(medications, 2)
+    if file_format == "prescription":
+        lines = [
+            "Dr John Smith, M.D", phone,
+            f"Name: {name} Date: {rng.randint(1, 12)}/{rng.randint(1, 28)}/2022",
+            f"Address: {rng.randint(1, 99)} tennis court, New York",
+            f"{meds[0].capitalize()} {rng.choice([5, 10, 20, 40])} mg",
+            f"{meds[1].capitalize()} {rng.choice([1, 2])}.{rng.randint(0, 9)} gram",
+            "Directions:",
+            f"{meds[0].capitalize()}, take 1 tablet every {rng.randint(2, 4)} days",
+            f"{meds[1].capitalize()} - take 2 pills daily for 1 month",
+            f"Refill: {rng.randint(1, 5)} times",
+        ]
+    else:
+        lines = [
+            "Patient Medical Record",
+            "Patient Information Birth Date",
+            f"{name} May {rng.randint(1, 28)} {rng.randint(1940, 2005)}",
+            phone,
+            f"Medical Problems: {rng.choice(conditions).capitalize()}",
+            f"Current medication: {meds[0].capitalize()}, {meds[1].capitalize()}",
+            f"Have you had a flu vaccination? {rng.choice(['Yes', 'No'])}",
+            f"Do you have health insurance? {rng.choice(['Yes', 'No'])}",
+        ]
+    return lines, meds
+
+
+def render(lines, seed):
+    """Render lines as a noisy 300 dpi-like grayscale scan"""
+    img = np.full((60 + 70 * len(lines), 1400), 255, dtype=np.uint8)
+    for i, line in enumerate(lines):
+        cv2.putText(img, line, (40, 80 + 70 * i), cv2.FONT_HERSHEY_SIMPLEX, 1.4, 0, 2, cv2.LINE_AA)
+    rng = np.random.default_rng(seed)
+    img = cv2.GaussianBlur(img, (3, 3), 0)
+    img[rng.random(img.shape) < 0.004] = 0
+    return img
+
+
+def normalize(value):
+    return " ".join(str(value or "").split()).lower()
+
+
+def field_accuracy(reference, candidate):
+    if not reference:
+        return 1.0
+    return sum(1 for key, value in reference.items() if normalize(candidate.get(key)) == normalize(value)) \
+        / len(reference)
+
+
+def run(pages, configs, repeat):
+    """Return (tables, best seconds per page)"""
+    best, tables = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tables = [extractor.ocr_page(utils.preprocess_image(page, scale=extractor.OCR_SCALE), configs=configs)
+                  for page in pages]
+        best = min(best, (time.perf_counter() - start) / len(pages))
+    return tables, best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Tesseract user-words and user-patterns")
+    parser.add_argument("--documents", type=int, default=10, help="synthetic documents per type")
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    kb = knowledge_base.get_knowledge_base()
+    medications = sorted({kb.record(number)["name"] for _, number in kb.names("medication")})
+    conditions = sorted({kb.record(number)["name"] for _, number in kb.names("condition")})
+    rng = random.Random(args.seed)
+
+    print(f"OCR engine: {extractor.OCR_ENGINE.name}")
+    print(f"{'document type':<18}{'vocabulary':<12}{'ms/page':>10}{'fields':>8}{'meds':>8}")
+    for file_format, parser_class in PARSERS.items():
+        documents = [synthetic_document(file_format, rng, medications, conditions) for _ in range(args.documents)]
+        pages = [render(lines, args.seed + i) for i, (lines, _) in enumerate(documents)]
+        references = [parser_class("\n".join(lines) + "\n").parse() for lines, _ in documents]
+        for label, configs in (("none", extractor.OCR_CONFIGS), ("user", extractor.ocr_configs())):
+            tables, seconds = run(pages, configs, args.repeat)
+            fields = [field_accuracy(reference, parser_class(table.text).parse())
+                      for reference, table in zip(references, tables)]
+            found = [len(set(meds) & set(kb.find_in_text(table.text))) / len(meds)
+                     for (_, meds), table in zip(documents, tables)]
+            print(f"{file_format:<18}{label:<12}{seconds * 1000:>10.1f}"
+                  f"{sum(fields) / len(fields):>8.2f}{sum(found) / len(found):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
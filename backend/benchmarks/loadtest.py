@@ -0,0 +1,421 @@
+"""
+Load generator for the /extract_from_doc HTTP API.
+
+Starts the FastAPI app from backend/src/main.py under uvicorn (or targets an
+already running server with --url) and drives it at a series of load levels.
+Each level is either closed-loop (a fixed number of concurrent clients) or
+open-loop (Poisson arrivals at a fixed rate). For every level it reports
+throughput, latency percentiles and error rate, then picks the saturation
+point: the last level before throughput stops growing or errors appear.
+
+By default the server runs with the stub OCR engine so the numbers measure the
+web layer, file handling, parsing and analysis without Tesseract cost.
+
+Examples:
+    python backend/benchmarks/loadtest.py --concurrency 1,2,4,8,16 --duration 10
+    python backend/benchmarks/loadtest.py --rate 5,10,20,40 --stub-latency-ms 150
+    python backend/benchmarks/loadtest.py --ocr-engine tesseract --mix prescription:1
+"""
+import argparse
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(BACKEND_DIR)
+RESOURCES_DIR = os.path.join(BACKEND_DIR, "resources")
+SUPPORTED_EXTENSIONS = ['.pdf', '.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif']
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ServerProcess:
+    """Runs backend/src/main.py:app under uvicorn in a child process"""
+
+    def __init__(self, ocr_engine="stub", stub_latency_ms=0.0, stub_ms_per_mp=0.0,
+                 workers=1, port=None, extra_env=None):
+        self.port = port or _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.workers = workers
+        self.upload_dir = tempfile.mkdtemp(prefix="rxtract_load_")
+        self.env = dict(os.environ)
+        self.env.update({
+            "RXTRACT_OCR_ENGINE": ocr_engine,
+            "RXTRACT_STUB_OCR_LATENCY_MS": str(stub_latency_ms),
+            "RXTRACT_STUB_OCR_MS_PER_MP": str(stub_ms_per_mp),
+            "RXTRACT_DEBUG_ARTIFACTS": "0",
+            "RXTRACT_UPLOAD_DIR": self.upload_dir,
+            # The same documents are sent over and over; measure OCR, not the cache
+            "RXTRACT_OCR_CACHE": "0",
+        })
+        self.env.update(extra_env or {})
+        self.process = None
+
+    def start(self, timeout=60):
+        cmd = [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--app-dir", os.path.join(BACKEND_DIR, "src"),
+            "--host", "127.0.0.1", "--port", str(self.port),
+            "--workers", str(self.workers), "--log-level", "warning",
+        ]
+        self.process = subprocess.Popen(cmd, cwd=REPO_DIR, env=self.env)
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {self.process.returncode}")
+            try:
+                if requests.get(f"{self.url}/health", timeout=1).status_code == 200:
+                    return self
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"Server did not become healthy within {timeout}s")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def parse_mix(mix):
+    """Parse 'prescription:3,patient_details:1' into {doc_type: weight}"""
+    weights = {}
+    for item in mix.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        doc_type, _, weight = item.partition(":")
+        weights[doc_type.strip()] = float(weight) if weight else 1.0
+    return weights
+
+
+def load_documents(mix, docs_dir=RESOURCES_DIR):
+    """
+    Load request payloads for every doc type in the mix.
+
+    Documents are read from ``docs_dir/<doc_type>/`` into memory once so file
+    I/O on the client side does not distort the measurements.
+
+    Returns:
+        list: (doc_type, weight, [(filename, content), ...]) per doc type
+    """
+    documents = []
+    for doc_type, weight in parse_mix(mix).items():
+        type_dir = os.path.join(docs_dir, doc_type)
+        files = []
+        if os.path.isdir(type_dir):
+            for name in sorted(os.listdir(type_dir)):
+                if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS:
+                    with open(os.path.join(type_dir, name), "rb") as f:
+                        files.append((name, f.read()))
+        if not files:
+            raise ValueError(f"No documents found for '{doc_type}' in {type_dir}")
+        documents.append((doc_type, weight, files))
+    return documents
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = math.ceil(pct / 100.0 * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+class LoadLevel:
+    """Results for a single load level"""
+
+    def __init__(self, mode, level):
+        self.mode = mode
+        self.level = level
+        self.latencies = []
+        self.errors = 0
+        self.error_samples = []
+        self.status_counts = {}
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def record(self, latency, status, error=None):
+        with self._lock:
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+            if error is None:
+                self.latencies.append(latency)
+            else:
+                self.errors += 1
+                if len(self.error_samples) < 5:
+                    self.error_samples.append(error)
+
+    def summary(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        latencies = sorted(self.latencies)
+        total = len(latencies) + self.errors
+
+        def ms(value):
+            return round(value * 1000, 1) if value is not None else None
+
+        return {
+            "mode": self.mode,
+            "level": self.level,
+            "requests": total,
+            "ok": len(latencies),
+            "errors": self.errors,
+            "error_rate": round(self.errors / total, 4) if total else 0.0,
+            "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+            "latency_ms": {
+                "p50": ms(percentile(latencies, 50)),
+                "p90": ms(percentile(latencies, 90)),
+                "p95": ms(percentile(latencies, 95)),
+                "p99": ms(percentile(latencies, 99)),
+                "max": ms(latencies[-1] if latencies else None),
+            },
+            "status_counts": {str(k): v for k, v in sorted(self.status_counts.items(), key=lambda item: str(item[0]))},
+            "error_samples": self.error_samples,
+        }
+
+
+class LoadGenerator:
+    """Sends weighted random documents at /extract_from_doc"""
+
+    def __init__(self, base_url, documents, timeout=120, seed=0):
+        self.endpoint = base_url.rstrip("/") + "/extract_from_doc"
+        self.documents = documents
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _session(self):
+        # One keep-alive session per client thread
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        return session
+
+    def _pick(self):
+        with self._rng_lock:
+            doc_type, _, files = self.rng.choices(
+                self.documents, weights=[weight for _, weight, _ in self.documents]
+            )[0]
+            filename, content = self.rng.choice(files)
+        return doc_type, filename, content
+
+    def send_one(self, result, scheduled_at=None):
+        """Send one request; latency is measured from ``scheduled_at`` when given"""
+        doc_type, filename, content = self._pick()
+        start = scheduled_at if scheduled_at is not None else time.perf_counter()
+        try:
+            response = self._session().post(
+                self.endpoint,
+                files={"file": (filename, content)},
+                data={"file_format": doc_type},
+                timeout=self.timeout
+            )
+            latency = time.perf_counter() - start
+            error = None
+            if response.status_code != 200:
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+            else:
+                body = response.json()
+                if isinstance(body, dict) and "error" in body:
+                    error = f"extract error: {body['error'][:200]}"
+            result.record(latency, response.status_code, error)
+        except requests.exceptions.RequestException as e:
+            result.record(time.perf_counter() - start, type(e).__name__, str(e)[:200])
+
+    def run_closed_loop(self, concurrency, duration):
+        """``concurrency`` clients each send back-to-back requests for ``duration`` seconds"""
+        result = LoadLevel("concurrency", concurrency)
+        result.started = time.perf_counter()
+        deadline = result.started + duration
+
+        def client():
+            while time.perf_counter() < deadline:
+                self.send_one(result)
+
+        threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        result.finished = time.perf_counter()
+        return result
+
+    def run_open_loop(self, rate, duration, max_in_flight=256):
+        """
+        Poisson arrivals at ``rate`` requests/second for ``duration`` seconds.
+
+        Latency includes time spent waiting for a free client slot, so queueing
+        in an overloaded server shows up in the percentiles.
+        """
+        result = LoadLevel("rate", rate)
+        result.started = time.perf_counter()
+        deadline = result.started + duration
+        arrivals = random.Random(self.rng.random())
+        next_arrival = result.started
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            while True:
+                next_arrival += arrivals.expovariate(rate)
+                if next_arrival >= deadline:
+                    break
+                delay = next_arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self.send_one, result, next_arrival)
+        result.finished = time.perf_counter()
+        return result
+
+
+def find_saturation(summaries, min_gain=0.1, max_error_rate=0.01):
+    """
+    Return the level with the highest sustainable throughput.
+
+    Walking the levels in order, load is considered saturated once a level
+    raises throughput by less than ``min_gain`` over the best so far, or its
+    error rate exceeds ``max_error_rate``. The last level before that point is
+    the saturation point.
+    """
+    best = None
+    for summary in summaries:
+        if summary["error_rate"] > max_error_rate:
+            break
+        if best is not None and summary["throughput_rps"] < best["throughput_rps"] * (1 + min_gain):
+            break
+        best = summary
+    return best
+
+
+def run(base_url, documents, mode, levels, duration, warmup=2.0, timeout=120, seed=0, on_level=None):
+    """Run every load level against ``base_url`` and return the report dict"""
+    generator = LoadGenerator(base_url, documents, timeout=timeout, seed=seed)
+    if warmup > 0:
+        generator.run_closed_loop(1, warmup)
+
+    summaries = []
+    for level in levels:
+        if mode == "rate":
+            result = generator.run_open_loop(level, duration)
+        else:
+            result = generator.run_closed_loop(int(level), duration)
+        summary = result.summary()
+        summaries.append(summary)
+        if on_level:
+            on_level(summary)
+
+    return {
+        "endpoint": generator.endpoint,
+        "duration_per_level_s": duration,
+        "levels": summaries,
+        "saturation": find_saturation(summaries),
+    }
+
+
+def format_report(report):
+    lines = [f"Target: {report['endpoint']}"]
+    header = f"{'mode':<12}{'level':>8}{'reqs':>8}{'err%':>8}{'rps':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}"
+    lines.append(header)
+    lines.append("-" * len(header))
+    for s in report["levels"]:
+        lat = s["latency_ms"]
+        lines.append(
+            f"{s['mode']:<12}{s['level']:>8}{s['requests']:>8}{s['error_rate'] * 100:>7.1f}%"
+            f"{s['throughput_rps']:>9.2f}{lat['p50'] or 0:>9.1f}{lat['p90'] or 0:>9.1f}"
+            f"{lat['p99'] or 0:>9.1f}{lat['max'] or 0:>9.1f}"
+        )
+    saturation = report["saturation"]
+    if saturation:
+        lines.append(
+            f"Saturation point: {saturation['mode']}={saturation['level']} "
+            f"at {saturation['throughput_rps']} req/s (p99 {saturation['latency_ms']['p99']} ms)"
+        )
+    else:
+        lines.append("Saturation point: not reached a sustainable level (errors at the first level)")
+    return "\n".join(lines)
+
+
+def _number_list(value):
+    return [float(v) if "." in v else int(v) for v in value.split(",") if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the /extract_from_doc endpoint")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--concurrency", type=_number_list, help="closed-loop client counts, e.g. 1,2,4,8")
+    load.add_argument("--rate", type=_number_list, help="open-loop arrival rates in req/s, e.g. 5,10,20")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per load level")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds of single-client warmup")
+    parser.add_argument("--mix", default="prescription:1,patient_details:1",
+                        help="document mix as doc_type:weight pairs")
+    parser.add_argument("--docs-dir", default=RESOURCES_DIR,
+                        help="directory with one sub-directory of documents per doc type")
+    parser.add_argument("--url", help="target an already running server instead of starting one")
+    parser.add_argument("--ocr-engine", default="stub", choices=["stub", "tesseract"])
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0, help="stub OCR delay per call")
+    parser.add_argument("--stub-ms-per-mp", type=float, default=0.0, help="stub OCR delay per megapixel")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", help="write the full report as JSON to this path")
+    args = parser.parse_args(argv)
+
+    mode, levels = ("rate", args.rate) if args.rate else ("concurrency", args.concurrency or [1, 2, 4, 8])
+    documents = load_documents(args.mix, args.docs_dir)
+
+    def on_level(summary):
+        lat = summary["latency_ms"]
+        print(f"  {mode}={summary['level']}: {summary['throughput_rps']} req/s, "
+              f"p50 {lat['p50']} ms, p99 {lat['p99']} ms, errors {summary['errors']}", file=sys.stderr)
+
+    server = None
+    try:
+        if args.url:
+            base_url = args.url
+        else:
+            server = ServerProcess(
+                ocr_engine=args.ocr_engine,
+                stub_latency_ms=args.stub_latency_ms,
+                stub_ms_per_mp=args.stub_ms_per_mp,
+                workers=args.workers
+            ).start()
+            base_url = server.url
+        report = run(base_url, documents, mode, levels, args.duration,
+                     warmup=args.warmup, timeout=args.timeout, seed=args.seed, on_level=on_level)
+    finally:
+        if server:
+            server.stop()
+
+    print(format_report(report))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+"""
+Per-request resource budgets for extract().
+
+A Budget caps the pages decoded, the total megapixels OCR'd and the wall time
+of one request. Pages past the page or megapixel budget are not decoded, and
+pages not reached in time are not OCR'd; the request still returns what the
+processed pages yielded, marked partial.
+
+Pages larger than ``max_page_megapixels`` are degraded rather than rejected:
+JPEGs are decoded at 1/2, 1/4 or 1/8 size to begin with, then the page is
+
+- downsampled to fit, if that keeps at least ``min_scale`` of its resolution,
+- otherwise scaled to ``min_scale`` and cut into overlapping tiles of at most
+  ``max_page_megapixels`` each, so text stays legible.
+
+Other formats (PNG, TIFF, BMP, ...) can only be decoded in full; OpenCV's
+reduced decode of them decodes the whole image and shrinks it afterwards. A
+page that would still be larger than ``max_decode_megapixels`` once decoded
+is skipped, even the first one.
+
+Everything skipped or degraded is listed in report().
+
+Configured by RXTRACT_MAX_PAGES (default 50), RXTRACT_MAX_MEGAPIXELS (total,
+500), RXTRACT_MAX_PAGE_MEGAPIXELS (40), RXTRACT_MAX_DECODE_MEGAPIXELS (250),
+RXTRACT_MAX_SECONDS (300) and RXTRACT_MIN_DOWNSAMPLE (0.5).
+"""
+import io
+import math
+import os
+import time
+
+import cv2
+from PIL import Image
+
+# Reduction factors OpenCV can apply while decoding JPEGs, with their imread flags
+REDUCED_DECODE_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+# Rows shared by neighbouring tiles, so a text line cut by one tile is whole in the next
+TILE_OVERLAP = 48
+# Narrowest tile band before tiles are also split horizontally
+MIN_TILE_ROWS = 256
+
+def _unchecked_size(fp):
+    """
+    (width, height) from the header of the format plugin that accepts ``fp``,
+    for images PIL's Image.open() refuses as decompression bombs
+    """
+    Image.init()
+    prefix = fp.read(16)
+    for format_id in Image.ID:
+        factory, accept = Image.OPEN[format_id]
+        fp.seek(0)
+        if accept is not None and not accept(prefix):
+            continue
+        try:
+            with factory(fp, "") as img:
+                return img.size
+        except Exception:
+            continue
+    return None
+
+
+def reducible(source):
+    """Whether an image (bytes or a path) is a JPEG, the one format decoded at reduced size"""
+    if isinstance(source, (bytes, bytearray)):
+        return source[:2] == b"\xff\xd8"
+    with open(source, "rb") as fp:
+        return fp.read(2) == b"\xff\xd8"
+
+
+def image_size(source):
+    """
+    (width, height) from an image's header (bytes or a path) without decoding
+    it, or None if PIL cannot read it. Images over PIL's decompression bomb
+    limit are measured too, since the budget is what limits their decoding.
+    """
+    try:
+        with Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source) as img:
+            return img.size
+    except Image.DecompressionBombError:
+        pass
+    except Exception:
+        return None
+    try:
+        if isinstance(source, (bytes, bytearray)):
+            return _unchecked_size(io.BytesIO(source))
+        with open(source, "rb") as fp:
+            return _unchecked_size(fp)
+    except Exception:
+        return None
+
+
+class Budget:
+    """
+    Limits for one request; create one per extract() call.
+
+    Args:
+        max_pages (int): pages (PDF images or image files) decoded
+        max_megapixels (float): total megapixels OCR'd, after downsampling; the
+            first page is processed whatever its size
+        max_page_megapixels (float): largest page OCR'd in one piece
+        max_decode_megapixels (float): largest page decoded, after any
+            reduction while decoding; applies to the first page too
+        max_seconds (float): wall time after which no further page is OCR'd
+        min_scale (float): least resolution a page is downsampled to before it is tiled instead
+    """
+
+    def __init__(self, max_pages=50, max_megapixels=500.0, max_page_megapixels=40.0, max_seconds=300.0,
+                 min_scale=0.5, max_decode_megapixels=250.0):
+        self.max_pages = max_pages
+        self.max_megapixels = max_megapixels
+        self.max_page_megapixels = max_page_megapixels
+        self.max_decode_megapixels = max_decode_megapixels
+        self.max_seconds = max_seconds
+        self.min_scale = min_scale
+        self.start = time.monotonic()
+        self.admitted = []
+        self.megapixels = 0.0
+        self.original_sizes = {}
+        self.skipped = []
+        self.degraded = []
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_pages=int(os.environ.get("RXTRACT_MAX_PAGES", "50")),
+            max_megapixels=float(os.environ.get("RXTRACT_MAX_MEGAPIXELS", "500")),
+            max_page_megapixels=float(os.environ.get("RXTRACT_MAX_PAGE_MEGAPIXELS", "40")),
+            max_decode_megapixels=float(os.environ.get("RXTRACT_MAX_DECODE_MEGAPIXELS", "250")),
+            max_seconds=float(os.environ.get("RXTRACT_MAX_SECONDS", "300")),
+            min_scale=float(os.environ.get("RXTRACT_MIN_DOWNSAMPLE", "0.5")),
+        )
+
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    def out_of_time(self):
+        return self.elapsed() >= self.max_seconds
+
+    def skip(self, page, reason):
+        self.skipped.append({"page": page, "reason": reason})
+
+    def scaled_megapixels(self, size):
+        """Megapixels a page of (width, height) is OCR'd at"""
+        return size[0] * size[1] * self.target_scale(size) ** 2 / 1e6
+
+    def admit(self, page, size=None, reducible=True):
+        """
+        Decide whether to decode ``page`` (numbered from 1), given its
+        (width, height) if known and whether its format can be decoded at
+        reduced size. Refused pages are recorded as skipped. The first page
+        is always admitted within the page, decode and time limits.
+        """
+        megapixels = self.scaled_megapixels(size) if size is not None else 0.0
+        if len(self.admitted) >= self.max_pages:
+            reason = "page_limit"
+        elif size is not None and self.decoded_megapixels(size, reducible) > self.max_decode_megapixels:
+            reason = "decode_limit"
+        elif self.admitted and self.megapixels + megapixels > self.max_megapixels:
+            reason = "megapixel_limit"
+        elif self.out_of_time():
+            reason = "time_limit"
+        else:
+            self.admitted.append(page)
+            if size is not None:
+                self.original_sizes[page] = size
+                self.megapixels += megapixels
+            return True
+        self.skip(page, reason)
+        return False
+
+    def target_scale(self, size):
+        """Overall scale a page of (width, height) is OCR'd at: 1, a downsample, or min_scale for tiling"""
+        megapixels = size[0] * size[1] / 1e6
+        if megapixels <= self.max_page_megapixels:
+            return 1.0
+        return max(math.sqrt(self.max_page_megapixels / megapixels), self.min_scale)
+
+    def decode_reduction(self, size, reducible=True):
+        """
+        Largest of 1, 2, 4 or 8 to divide a page's size by while decoding
+        without going below target_scale(); 1 unless the format is ``reducible``
+        """
+        if size is None or not reducible:
+            return 1
+        scale = self.target_scale(size)
+        return max([1] + [factor for factor in REDUCED_DECODE_FLAGS if 1.0 / factor >= scale])
+
+    def decoded_megapixels(self, size, reducible=True):
+        """Megapixels a page of (width, height) is decoded at"""
+        return size[0] * size[1] / self.decode_reduction(size, reducible) ** 2 / 1e6
+
+    def fit(self, img, page):
+        """
+        Return ``img`` as a list of pages within max_page_megapixels: itself,
+        downsampled, or tiles. Pages admitted without a known size are counted
+        against the megapixel budget here, and skipped (an empty list) if they
+        exceed it.
+        """
+        height, width = img.shape[:2]
+        original = self.original_sizes.get(page)
+        if original is None:
+            original = self.original_sizes[page] = (width, height)
+            megapixels = self.scaled_megapixels(original)
+            if self.megapixels > 0 and self.megapixels + megapixels > self.max_megapixels:
+                self.skip(page, "megapixel_limit")
+                return []
+            self.megapixels += megapixels
+        scale = self.target_scale(original)
+        # The image may already have been reduced while decoding
+        resize = scale * original[0] / float(width)
+        if resize < 0.999:
+            img = cv2.resize(img, None, fx=resize, fy=resize, interpolation=cv2.INTER_AREA)
+        pieces = [img]
+        if img.shape[0] * img.shape[1] / 1e6 > self.max_page_megapixels * 1.01:
+            pieces = tile(img, int(self.max_page_megapixels * 1e6))
+        if scale < 0.999 or len(pieces) > 1:
+            self.degraded.append({
+                "page": page,
+                "action": "tiled" if len(pieces) > 1 else "downsampled",
+                "original_size": list(original),
+                "scale": round(scale, 3),
+                "tiles": len(pieces),
+            })
+        return pieces
+
+    def report(self):
+        """What the budget skipped or degraded, for the response"""
+        return {
+            "limits": {
+                "max_pages": self.max_pages,
+                "max_megapixels": self.max_megapixels,
+                "max_page_megapixels": self.max_page_megapixels,
+                "max_decode_megapixels": self.max_decode_megapixels,
+                "max_seconds": self.max_seconds,
+            },
+            "pages_processed": len(set(self.admitted) - {skip["page"] for skip in self.skipped}),
+            "megapixels": round(self.megapixels, 2),
+            "elapsed_seconds": round(self.elapsed(), 3),
+            "skipped_pages": self.skipped,
+            "degraded_pages": self.degraded,
+            "partial": bool(self.skipped),
+        }
+
+
+def tile(img, max_pixels, overlap=TILE_OVERLAP):
+    """
+    Cut ``img`` into tiles of at most about ``max_pixels``, in reading order:
+    full-width bands, or a grid if bands would be thinner than MIN_TILE_ROWS.
+    Neighbouring tiles overlap by ``overlap`` pixels.
+    """
+    height, width = img.shape[:2]
+    tile_width = width
+    if max_pixels // width < MIN_TILE_ROWS:
+        tile_width = int(math.sqrt(max_pixels))
+    tile_height = max(max_pixels // tile_width, overlap * 2)
+    tiles = []
+    for top in range(0, height, tile_height - overlap):
+        for left in range(0, width, max(tile_width - overlap, 1)):
+            tiles.append(img[top:top + tile_height, left:left + tile_width])
+            if left + tile_width >= width:
+                break
+        if top + tile_height >= height:
+            break
+    return tiles
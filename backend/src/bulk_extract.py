@@ -0,0 +1,271 @@
+"""
+Bulk extraction over a directory tree without going through the HTTP server.
+
+Walks the input directory, detects each file's type from its leading bytes,
+extracts documents on a process pool and appends one JSON record per document
+to the output JSONL file. Completed files are also appended to a checkpoint
+file, so re-running the same command after an interruption skips everything
+already done; failed documents are only retried with --retry-failed. Records
+are written before their checkpoint entry, so a crash between the two can at
+worst repeat a document on resume, never drop one.
+
+A document whose worker process dies (killed for running out of memory, a
+crash in OpenCV or Tesseract) is recorded as failed instead of stopping the
+run: the pool is restarted and the documents that were in flight with it are
+retried one at a time to find the one that killed the worker.
+
+Usage:
+    python backend/src/bulk_extract.py ARCHIVE_DIR --format prescription --output results.jsonl
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+# Leading bytes used to detect file types, mapped to the extension extract() expects
+FILE_SIGNATURES = [
+    (b"%PDF", ".pdf"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"II*\x00", ".tif"),
+    (b"MM\x00*", ".tif"),
+    (b"BM", ".bmp"),
+]
+
+
+def detect_file_type(file_path):
+    """Return the extension matching the file's content, or None if unsupported"""
+    try:
+        with open(file_path, "rb") as f:
+            header = f.read(16)
+    except OSError:
+        return None
+    for signature, file_ext in FILE_SIGNATURES:
+        if header.startswith(signature):
+            return file_ext
+    return None
+
+
+def walk_documents(input_dir):
+    """Yield (relative path, detected extension) for every supported file, in a stable order"""
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            file_ext = detect_file_type(file_path)
+            rel_path = os.path.relpath(file_path, input_dir)
+            yield rel_path, file_ext
+
+
+def load_checkpoint(checkpoint_path, retry_failed=False):
+    """Return the set of relative paths already processed (optionally excluding failures)"""
+    done = set()
+    if not os.path.exists(checkpoint_path):
+        return done
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A torn last line from an interrupted run
+                continue
+            if retry_failed and entry.get("status") == "error":
+                done.discard(entry["path"])
+            else:
+                done.add(entry["path"])
+    return done
+
+
+def _init_worker(verbose):
+    # Debug artifacts would be overwritten by every document, so keep them off
+    os.environ["RXTRACT_DEBUG_ARTIFACTS"] = "0"
+    if not verbose:
+        sys.stdout = open(os.devnull, "w")
+    import extractor  # noqa: F401  (warm the OCR engine once per worker)
+
+
+def _process(input_dir, rel_path, file_ext, file_format):
+    from extractor import extract
+    start = time.perf_counter()
+    data = extract(os.path.join(input_dir, rel_path), file_format, file_ext=file_ext)
+    record = {
+        "path": rel_path,
+        "file_type": file_ext.lstrip("."),
+        "file_format": file_format,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    if isinstance(data, dict) and "error" in data:
+        record["error"] = data["error"]
+    else:
+        record["data"] = data
+        classification = data.get("processing_info", {}).get("classification")
+        if classification:
+            record["file_format"] = classification["file_format"]
+    return record
+
+
+def _error_record(rel_path, file_ext, file_format, error):
+    return {"path": rel_path, "file_type": file_ext.lstrip("."), "file_format": file_format, "error": error}
+
+
+def _write_record(output, checkpoint, record):
+    """Append a record, then its checkpoint entry"""
+    output.write(json.dumps(record) + "\n")
+    output.flush()
+    status = "error" if "error" in record else "ok"
+    checkpoint.write(json.dumps({"path": record["path"], "status": status}) + "\n")
+    checkpoint.flush()
+
+
+class ProgressReporter:
+    """Prints processed count, throughput and ETA to stderr at most every ``interval`` seconds"""
+
+    def __init__(self, total, interval=2.0, stream=sys.stderr):
+        self.total = total
+        self.interval = interval
+        self.stream = stream
+        self.done = 0
+        self.errors = 0
+        self.started = time.time()
+        self._last_report = 0.0
+
+    def update(self, record, force=False):
+        if record is not None:
+            self.done += 1
+            if "error" in record:
+                self.errors += 1
+        now = time.time()
+        if not force and now - self._last_report < self.interval:
+            return
+        self._last_report = now
+        elapsed = max(now - self.started, 1e-9)
+        rate = self.done / elapsed
+        remaining = self.total - self.done
+        eta = remaining / rate if rate > 0 else float("inf")
+        eta_text = time.strftime("%H:%M:%S", time.gmtime(eta)) if eta != float("inf") else "--:--:--"
+        print(f"{self.done}/{self.total} documents, {self.errors} errors, "
+              f"{rate:.2f} docs/s, ETA {eta_text}", file=self.stream, flush=True)
+
+
+def run(input_dir, output_path, file_format, checkpoint_path=None, workers=None,
+        verbose=False, report_interval=2.0, retry_failed=False):
+    """
+    Extract every supported document under ``input_dir`` into ``output_path``.
+
+    Returns:
+        dict: counts of processed, failed, skipped (already done) and unsupported files
+    """
+    checkpoint_path = checkpoint_path or output_path + ".checkpoint"
+    workers = workers or os.cpu_count() or 1
+    done = load_checkpoint(checkpoint_path, retry_failed=retry_failed)
+
+    pending, unsupported, skipped = [], 0, 0
+    for rel_path, file_ext in walk_documents(input_dir):
+        if file_ext is None:
+            unsupported += 1
+        elif rel_path in done:
+            skipped += 1
+        else:
+            pending.append((rel_path, file_ext))
+
+    print(f"{len(pending)} documents to process, {skipped} already done, "
+          f"{unsupported} unsupported files ignored", file=sys.stderr)
+    reporter = ProgressReporter(len(pending), interval=report_interval)
+
+    def new_pool():
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(verbose,))
+
+    with open(output_path, "a", encoding="utf-8") as output, \
+            open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        pool = new_pool()
+        queue = iter(pending)
+        # future -> (rel_path, file_ext, whether it runs alone)
+        in_flight = {}
+        # Documents in flight when a worker died, retried one at a time
+        suspects = deque()
+        # Keep a bounded number of tasks submitted so huge archives don't build huge queues
+        max_in_flight = workers * 2
+        try:
+            while True:
+                isolating = any(alone for _, _, alone in in_flight.values())
+                if suspects and not in_flight:
+                    rel_path, file_ext = suspects.popleft()
+                    future = pool.submit(_process, input_dir, rel_path, file_ext, file_format)
+                    in_flight[future] = (rel_path, file_ext, True)
+                while not suspects and not isolating and len(in_flight) < max_in_flight:
+                    item = next(queue, None)
+                    if item is None:
+                        break
+                    rel_path, file_ext = item
+                    future = pool.submit(_process, input_dir, rel_path, file_ext, file_format)
+                    in_flight[future] = (rel_path, file_ext, False)
+                if not in_flight:
+                    break
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in finished:
+                    rel_path, file_ext, alone = in_flight.pop(future)
+                    try:
+                        record = future.result()
+                    except BrokenProcessPool as e:
+                        broken = True
+                        if not alone:
+                            suspects.append((rel_path, file_ext))
+                            continue
+                        record = _error_record(rel_path, file_ext, file_format, f"Worker process died: {e}")
+                    except Exception as e:
+                        record = _error_record(rel_path, file_ext, file_format, f"{type(e).__name__}: {e}")
+                    _write_record(output, checkpoint, record)
+                    reporter.update(record)
+                if broken:
+                    # Every other task of the dead pool fails too: run them again
+                    suspects.extend((rel_path, file_ext) for rel_path, file_ext, _ in in_flight.values())
+                    in_flight = {}
+                    pool.shutdown(wait=True)
+                    print(f"A worker process died, restarting the pool and retrying {len(suspects)} "
+                          f"documents one at a time", file=sys.stderr)
+                    pool = new_pool()
+        finally:
+            pool.shutdown(wait=True)
+
+    reporter.update(None, force=True)
+    return {
+        "processed": reporter.done,
+        "failed": reporter.errors,
+        "skipped": skipped,
+        "unsupported": unsupported,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract data from every document in a directory tree")
+    parser.add_argument("input_dir", help="directory to walk for PDF and image files")
+    parser.add_argument("--format", dest="file_format", required=True,
+                        choices=["prescription", "patient_details", "auto"],
+                        help="document type of the archive (auto: detect per document)")
+    parser.add_argument("--output", default="extraction_results.jsonl", help="JSONL file to append results to")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: OUTPUT.checkpoint)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--retry-failed", action="store_true", help="reprocess documents that failed in earlier runs")
+    parser.add_argument("--verbose", action="store_true", help="show extractor output from workers")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.input_dir):
+        parser.error(f"Not a directory: {args.input_dir}")
+
+    summary = run(args.input_dir, args.output, args.file_format,
+                  checkpoint_path=args.checkpoint, workers=args.workers, verbose=args.verbose,
+                  retry_failed=args.retry_failed)
+    print(json.dumps(summary), file=sys.stderr)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
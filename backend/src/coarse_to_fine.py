@@ -0,0 +1,91 @@
+"""
+Coarse-to-fine OCR strategy.
+
+Most of a prescription is large, clean print that Tesseract reads fine at low
+resolution. This strategy OCRs a downsampled page once with word-level
+confidences, then re-OCRs only the lines containing low-confidence words from
+a high-resolution crop of the original page and merges the results. Lines
+that read as mostly digits are re-OCR'd with a numeric character whitelist.
+"""
+import tesseract_vocab
+import utils
+from word_table import WordTable, group_lines
+
+# Resize factor for the fast whole-page pass (the full-page strategy uses 1.5)
+COARSE_SCALE = 0.75
+# Resize factor for re-OCR of low-confidence lines
+FINE_SCALE = 1.5
+# Lines with any word below this confidence are re-OCR'd at FINE_SCALE
+MIN_WORD_CONFIDENCE = 70.0
+# Padding around a line box, in original page pixels
+LINE_PADDING = 6
+# Page segmentation mode for a cropped line ("treat the image as a single text line")
+LINE_CONFIG = "--psm 7 --oem 3"
+
+
+def _refine_line(engine, img, line, coarse_scale, lang, fine_scale, line_config=LINE_CONFIG):
+    """
+    Re-OCR one line from a high-resolution crop; return (words, confs, boxes)
+    or None, with boxes in the coarse image's coordinates
+    """
+    height, width = img.shape[:2]
+    left, top, right, bottom = [int(round(v / coarse_scale)) for v in line["box"]]
+    left, top = max(left - LINE_PADDING, 0), max(top - LINE_PADDING, 0)
+    right, bottom = min(right + LINE_PADDING, width), min(bottom + LINE_PADDING, height)
+    if right <= left or bottom <= top:
+        return None
+    crop = img[top:bottom, left:right]
+    processed = utils.preprocess_image(crop, buffers=utils.thread_buffers("fine"), scale=fine_scale)
+    if tesseract_vocab.is_numeric(" ".join(line["words"])):
+        line_config = tesseract_vocab.numeric_config(line_config)
+    data = engine.image_to_data(processed, lang=lang, config=line_config)
+    words, confs, boxes = [], [], []
+    for i, text in enumerate(data["text"]):
+        if data["conf"][i] >= 0 and text.strip():
+            words.append(text)
+            confs.append(data["conf"][i])
+            boxes.append((
+                (left + data["left"][i] / fine_scale) * coarse_scale,
+                (top + data["top"][i] / fine_scale) * coarse_scale,
+                data["width"][i] / fine_scale * coarse_scale,
+                data["height"][i] / fine_scale * coarse_scale,
+            ))
+    if not words:
+        return None
+    return words, confs, boxes
+
+
+def coarse_to_fine_ocr(engine, img, coarse_img, coarse_scale=COARSE_SCALE, lang="eng",
+                       config="--psm 6 --oem 3", min_confidence=MIN_WORD_CONFIDENCE, fine_scale=FINE_SCALE,
+                       page=1, line_config=LINE_CONFIG):
+    """
+    OCR a page coarse-to-fine.
+
+    Args:
+        engine: OCR engine with ``image_to_data``
+        img: the original (decoded) page
+        coarse_img: ``img`` preprocessed at ``coarse_scale``
+        min_confidence: lines with a word below this are refined
+        page: page number recorded in the word table
+        line_config: Tesseract config for refined lines
+
+    Returns:
+        tuple: (WordTable of the page in original page coordinates, stats dict
+        with total, low-confidence and refined line counts)
+    """
+    lines = group_lines(engine.image_to_data(coarse_img, lang=lang, config=config))
+    low_confidence, refined = 0, 0
+    for line in lines:
+        if min(line["confs"]) >= min_confidence:
+            continue
+        low_confidence += 1
+        result = _refine_line(engine, img, line, coarse_scale, lang, fine_scale, line_config)
+        if result is None:
+            continue
+        words, confs, boxes = result
+        # Keep whichever reading Tesseract is more confident about
+        if sum(confs) / len(confs) >= sum(line["confs"]) / len(line["confs"]):
+            line["words"], line["confs"], line["boxes"] = words, confs, boxes
+            refined += 1
+    stats = {"lines": len(lines), "low_confidence_lines": low_confidence, "refined_lines": refined}
+    return WordTable.from_lines(lines, page=page, scale=coarse_scale), stats
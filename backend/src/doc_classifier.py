@@ -0,0 +1,129 @@
+"""
+Document-type detection for the ``auto`` file format.
+
+Documents are classified by scoring keyword features typical of each type.
+The cheapest available text is used: a PDF's text layer if it has one,
+otherwise a low-resolution OCR of the top of the first page, where the
+printed headings are. When neither is conclusive, extract() classifies the
+full OCR text, which it has to produce anyway.
+"""
+import re
+import time
+
+from PyPDF2 import PdfReader
+
+import utils
+
+FILE_FORMATS = ["prescription", "patient_details"]
+
+# (pattern, weight) features; each counts once per document
+KEYWORD_FEATURES = {
+    "prescription": [
+        (r"\bdirections?\b", 3.0),
+        (r"\brefills?\b", 3.0),
+        (r"\brx\b", 2.0),
+        (r"\bm\.\s?d\b", 2.0),
+        (r"\bdr\.?\s+[a-z]", 1.0),
+        (r"\btaper\b", 1.0),
+        (r"\bname\s*[:;]", 1.0),
+        (r"\baddress\s*[:;]", 1.0),
+        (r"\b\d+(?:\.\d+)?\s?(?:mg|mcg|gram|ml)\b", 1.0),
+    ],
+    "patient_details": [
+        (r"\bpatient\s+medical\s+record\b", 5.0),
+        (r"\bpatient\s+information\b", 3.0),
+        (r"\bmedical\s+(?:history|problems)\b", 3.0),
+        (r"\b(?:birth\s*date|date\s+of\s+birth)\b", 2.0),
+        (r"\bin\s+case\s+of\s+emergency\b", 2.0),
+        (r"\bimmuni[sz]ations?\b", 2.0),
+        (r"\binsurance\b", 2.0),
+        (r"\bvaccinat", 2.0),
+        (r"\ballerg", 1.0),
+        (r"\b(?:weight|height)\s*:", 1.0),
+    ],
+}
+COMPILED_FEATURES = {
+    file_format: [(re.compile(pattern, re.IGNORECASE), weight) for pattern, weight in features]
+    for file_format, features in KEYWORD_FEATURES.items()
+}
+
+# A classification needs this share of the total score, and this much score
+MIN_CONFIDENCE = 0.65
+MIN_SCORE = 2.0
+# Text layers shorter than this are treated as absent (scanned PDFs)
+MIN_TEXT_LAYER_CHARS = 40
+# Top share of the first page OCR'd for the header, and its resize factor
+HEADER_FRACTION = 0.35
+HEADER_SCALE = 0.5
+
+
+def score_text(text):
+    """Return {file_format: score} for ``text``"""
+    return {
+        file_format: sum(weight for pattern, weight in features if pattern.search(text))
+        for file_format, features in COMPILED_FEATURES.items()
+    }
+
+
+def classify_text(text):
+    """
+    Classify ``text``.
+
+    Returns:
+        tuple: (file format or None if inconclusive, confidence, scores)
+    """
+    scores = score_text(text)
+    best = max(FILE_FORMATS, key=lambda file_format: scores[file_format])
+    total = sum(scores.values())
+    confidence = scores[best] / total if total else 0.0
+    if scores[best] < MIN_SCORE or confidence < MIN_CONFIDENCE:
+        return None, round(confidence, 3), scores
+    return best, round(confidence, 3), scores
+
+
+def pdf_text_layer(file_path, max_pages=2):
+    """Return the embedded text of the first pages of a PDF, or "" if it has none"""
+    try:
+        with open(file_path, "rb") as f:
+            pdf = PdfReader(f)
+            return "\n".join((page.extract_text() or "") for page in pdf.pages[:max_pages])
+    except Exception as e:
+        print(f"Could not read PDF text layer: {e}")
+        return ""
+
+
+def header_text(engine, img, lang="eng", config="--psm 6 --oem 3"):
+    """OCR the top HEADER_FRACTION of a page at HEADER_SCALE"""
+    header = img[:max(int(img.shape[0] * HEADER_FRACTION), 1)]
+    processed = utils.preprocess_image(header, buffers=utils.thread_buffers("header"), scale=HEADER_SCALE)
+    return engine.image_to_string(processed, lang=lang, config=config)
+
+
+def classify_document(file_path, file_ext, images, engine=None, lang="eng", config="--psm 6 --oem 3"):
+    """
+    Classify a decoded document from its text layer or header.
+
+    ``engine`` may be None when OCR is unavailable, in which case only the
+    text layer is used.
+
+    Returns:
+        dict: ``file_format`` (None if inconclusive), ``confidence``,
+        ``method`` (``text_layer`` or ``header_ocr``), ``scores`` and ``seconds``
+    """
+    start = time.perf_counter()
+    result = {"file_format": None, "confidence": 0.0, "method": None, "scores": {}}
+    attempts = []
+    if file_ext == ".pdf":
+        attempts.append(("text_layer", lambda: pdf_text_layer(file_path)))
+    if engine is not None and images:
+        attempts.append(("header_ocr", lambda: header_text(engine, images[0], lang, config)))
+    for method, get_text in attempts:
+        text = get_text()
+        if method == "text_layer" and len(text.strip()) < MIN_TEXT_LAYER_CHARS:
+            continue
+        file_format, confidence, scores = classify_text(text)
+        result.update(file_format=file_format, confidence=confidence, method=method, scores=scores)
+        if file_format is not None:
+            break
+    result["seconds"] = round(time.perf_counter() - start, 4)
+    return result
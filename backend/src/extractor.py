@@ -12,61 +12,208 @@ import re
 from parser_patient_details import PatientDetailsParser
 from parser_prescription import PrescriptionParser
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import ocr_engine
+import ocr_cache
+import phash_index
+import coarse_to_fine
+import doc_classifier
+import word_table
+import tesseract_vocab
+import budgets
 
 # Get Tesseract path from environment variable if available, otherwise use default
-DEFAULT_TESSERACT_PATH = r"C:/Program Files/Tesseract-OCR/tesseract.exe"
+DEFAULT_TESSERACT_PATH = ocr_engine.DEFAULT_TESSERACT_PATH
 TESSERACT_ENGINE_PATH = os.environ.get("TESSERACT_PATH", DEFAULT_TESSERACT_PATH)
 
+# OCR engine (Tesseract, or the stub engine selected with RXTRACT_OCR_ENGINE=stub)
+# Repeated OCR of the same preprocessed page is served from the page cache
+OCR_ENGINE = ocr_cache.cached(ocr_engine.get_engine())
+
 # Flag to track if Tesseract is available
-TESSERACT_AVAILABLE = False
-
-# Configure pytesseract with fallback
-try:
-    pytesseract.pytesseract.tesseract_cmd = TESSERACT_ENGINE_PATH
-    # Test if Tesseract is actually working
-    test_img = np.zeros((100, 100), dtype=np.uint8)
-    pytesseract.image_to_string(test_img)
-    TESSERACT_AVAILABLE = True
-    print(f"Tesseract OCR 5.5.0 is available at: {TESSERACT_ENGINE_PATH}")
-except Exception as e:
-    print(f"Warning: Tesseract OCR is not available: {e}")
-    print("Using fallback mode without OCR. Text extraction will be limited.")
-
-def convert_pdf_to_images(file_path):
-    """Convert PDF to images using PyPDF2 and PIL"""
+TESSERACT_AVAILABLE = OCR_ENGINE.probe() and OCR_ENGINE.name == "tesseract"
+
+# Tesseract configurations tried on every page
+OCR_LANG = "eng"
+OCR_CONFIGS = [
+    '--psm 6 --oem 3',  # Single block of text, LSTM engine
+    '--psm 4 --oem 3',  # Assume single column of text, LSTM engine
+]
+# Resize factor of the full-page strategy
+OCR_SCALE = 1.5
+
+# "full" OCRs every page at 1.5x with each of OCR_CONFIGS; "coarse_to_fine"
+# OCRs a downsampled page once and re-OCRs only low-confidence lines
+OCR_STRATEGIES = ["full", "coarse_to_fine"]
+DEFAULT_OCR_STRATEGY = os.environ.get("RXTRACT_OCR_STRATEGY", "full")
+
+# Document types; "auto" detects prescription or patient_details per document
+FILE_FORMATS = doc_classifier.FILE_FORMATS + ["auto"]
+PARSERS = {"prescription": PrescriptionParser, "patient_details": PatientDetailsParser}
+
+# PDF pages without embedded images or text are rendered at this resolution and OCR'd
+# without resizing; RXTRACT_RENDER_THREADS pages are rendered at a time
+OCR_DPI = int(os.environ.get("RXTRACT_OCR_DPI", "300"))
+RENDER_THREADS = int(os.environ.get("RXTRACT_RENDER_THREADS", str(min(4, os.cpu_count() or 1))))
+# Least OCR confidence of every field for early_stop extraction to skip the remaining pages
+EARLY_STOP_CONFIDENCE = float(os.environ.get("RXTRACT_EARLY_STOP_CONFIDENCE", "80"))
+# Smaller embedded images (logos, signatures, bullets) do not make a page a scan
+MIN_EMBEDDED_IMAGE_SIDE = 200
+
+# Debug artifacts (images, text, parsed JSON) are written on every request unless disabled
+DEBUG_ARTIFACTS = os.environ.get("RXTRACT_DEBUG_ARTIFACTS", "1") != "0"
+
+def decode_image_bytes(data, reduction=1):
+    """
+    Decode encoded image bytes (JPEG, PNG, ...) directly into an ndarray.
+
+    OpenCV decodes straight from the byte buffer into a single BGR or
+    grayscale array. PIL is only used for formats OpenCV cannot read.
+    ``reduction`` (2, 4 or 8) decodes a JPEG at that fraction of the size
+    (see budgets.REDUCED_DECODE_FLAGS); other formats are always decoded in full.
+    """
+    flags = cv2.IMREAD_ANYCOLOR
+    if budgets.reducible(data):
+        flags = budgets.REDUCED_DECODE_FLAGS.get(reduction, flags)
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+    if img is None:
+        img = pil_to_gray(Image.open(io.BytesIO(data)))
+    return img
+
+def pil_to_gray(img):
+    """
+    Grayscale ndarray of a PIL image. PIL decodes color as RGB, which
+    preprocess_image() would read as BGR, weighting red and blue the wrong way.
+    """
+    return np.asarray(img.convert("L"))
+
+def _admit(budget, page, size, reducible=True):
+    """Decode reduction for ``page``, or None if the budget skips it"""
+    if budget is None:
+        return 1
+    if not budget.admit(page, size, reducible):
+        return None
+    return budget.decode_reduction(size, reducible)
+
+def _embedded_images(page):
+    """(encoded bytes, (width, height) or None) of the images embedded in a PDF page"""
+    if page.images:
+        return [(image.data, budgets.image_size(image.data)) for image in page.images]
+    # If no images found, try to extract from XObject
+    images = []
+    xObject = page['/Resources']['/XObject'].get_object() if '/XObject' in page['/Resources'] else {}
+    for obj in xObject:
+        if xObject[obj]['/Subtype'] == '/Image':
+            images.append((xObject[obj].get_data(), (int(xObject[obj]['/Width']), int(xObject[obj]['/Height']))))
+    return images
+
+def rasterize_page(file_path, page_number, dpi):
+    """Render one PDF page with pdf2image (poppler) as a grayscale ndarray"""
+    from pdf2image import convert_from_path
+    rendered = convert_from_path(file_path, dpi=dpi, first_page=page_number, last_page=page_number,
+                                 grayscale=True, poppler_path=os.environ.get("POPPLER_PATH") or None)
+    return np.asarray(rendered[0])
+
+def load_pdf_pages(file_path, budget=None, page_range=None, dpi=None, use_text_layer=True):
+    """
+    Decode the pages of a PDF for OCR as a list of dicts with ``number``
+    (position in the list, as counted by ``budget``), ``pdf_page``,
+    ``source`` and ``image`` or ``text``:
+
+    - ``embedded``: an image embedded in the page, one entry per image at
+      least MIN_EMBEDDED_IMAGE_SIDE pixels on each side,
+    - ``text_layer``: pages without such images but with at least
+      doc_classifier.MIN_TEXT_LAYER_CHARS of embedded text, which is used
+      as is rather than OCR'd (unless ``use_text_layer`` is False),
+    - ``rendered``: any other page, rasterized with pdf2image at ``dpi``
+      (default OCR_DPI), the resolution it is OCR'd at. Pages are rendered
+      in parallel on RENDER_THREADS threads.
+
+    ``page_range`` is an inclusive (first, last) range of PDF pages, numbered
+    from 1. A page with an embedded image that cannot be decoded is rendered
+    instead; pages that cannot be rendered are left out.
+    """
+    dpi = dpi or OCR_DPI
+    entries, to_render = [], []
+    number = 0
+    with open(file_path, "rb") as file:
+        pdf = PdfReader(file)
+        first, last = page_range or (1, len(pdf.pages))
+        for page_num in range(max(first, 1), min(last, len(pdf.pages)) + 1):
+            page = pdf.pages[page_num - 1]
+            try:
+                images = [(data, size) for data, size in _embedded_images(page)
+                          if size is None or min(size) >= MIN_EMBEDDED_IMAGE_SIDE]
+            except Exception as e:
+                # Filters PyPDF2 cannot decode (JBIG2, ...): handle it like a page without images
+                print(f"Could not read the images of PDF page {page_num}: {e}")
+                images = []
+            # Size and resolution the page is rendered at (the OCR resolution, less if the budget says so)
+            page_size = (round(float(page.mediabox.width) * dpi / 72), round(float(page.mediabox.height) * dpi / 72))
+            page_dpi = max(int(round(dpi * budget.target_scale(page_size) if budget is not None else dpi)), 1)
+            if images:
+                page_entries = []
+                for data, size in images:
+                    number += 1
+                    reduction = _admit(budget, number, size, budgets.reducible(data))
+                    if reduction is None:
+                        continue
+                    entry = {"number": number, "pdf_page": page_num, "source": "embedded"}
+                    page_entries.append(entry)
+                    try:
+                        # Decode once into the array used for OpenCV processing
+                        entry["image"] = decode_image_bytes(data, reduction)
+                    except Exception as e:
+                        # Neither OpenCV nor PIL can read it: render the whole page instead
+                        print(f"Could not decode an image on PDF page {page_num}, rendering the page: {e}")
+                        entry = {"number": page_entries[0]["number"], "pdf_page": page_num, "source": "rendered"}
+                        page_entries = [entry]
+                        to_render.append((entry, page_dpi))
+                        break
+                entries.extend(page_entries)
+                continue
+            number += 1
+            text = (page.extract_text() or "").strip() if use_text_layer else ""
+            if len(text) >= doc_classifier.MIN_TEXT_LAYER_CHARS:
+                if _admit(budget, number, None) is not None:
+                    entries.append({"number": number, "pdf_page": page_num, "source": "text_layer", "text": text})
+                continue
+            # Vector or blank page: render it
+            if _admit(budget, number, page_size) is not None:
+                entry = {"number": number, "pdf_page": page_num, "source": "rendered"}
+                entries.append(entry)
+                to_render.append((entry, page_dpi))
+
+    def render(job):
+        entry, page_dpi = job
+        try:
+            entry["image"] = rasterize_page(file_path, entry["pdf_page"], page_dpi)
+        except Exception as e:
+            print(f"Could not render PDF page {entry['pdf_page']}: {e}")
+
+    if len(to_render) > 1 and RENDER_THREADS > 1:
+        with ThreadPoolExecutor(max_workers=min(RENDER_THREADS, len(to_render))) as executor:
+            list(executor.map(render, to_render))
+    else:
+        for job in to_render:
+            render(job)
+    return [entry for entry in entries if "image" in entry or "text" in entry]
+
+def convert_pdf_to_images(file_path, budget=None):
+    """
+    Convert PDF to images: embedded images, or pages rendered with pdf2image
+    where a page has none (see load_pdf_pages())
+    """
     images = []
     try:
-        # Open the PDF file
-        with open(file_path, "rb") as file:
-            pdf = PdfReader(file)
-            
-            # Iterate through each page
-            for page_num in range(len(pdf.pages)):
-                page = pdf.pages[page_num]
-                
-                # Check if the page has images
-                if page.images:
-                    # Extract images directly from the page
-                    for image in page.images:
-                        img = Image.open(io.BytesIO(image.data))
-                        # Convert PIL Image to numpy array for OpenCV processing
-                        images.append(np.array(img))
-                else:
-                    # If no images found, try to extract from XObject
-                    xObject = page['/Resources']['/XObject'].get_object() if '/XObject' in page['/Resources'] else {}
-                    for obj in xObject:
-                        if xObject[obj]['/Subtype'] == '/Image':
-                            data = xObject[obj].get_data()
-                            img = Image.open(io.BytesIO(data))
-                            images.append(np.array(img))
-    
+        images = [entry["image"] for entry in load_pdf_pages(file_path, budget, use_text_layer=False)]
     except Exception as e:
         print(f"Error converting PDF to images: {e}")
         # If PyPDF2 extraction fails, try a fallback method
         try:
             # Use PIL to open the PDF directly (works for some PDFs)
-            img = Image.open(file_path)
-            images = [np.array(img)]
+            images = [pil_to_gray(Image.open(file_path))]
         except:
             pass
     
@@ -80,13 +227,19 @@ def convert_pdf_to_images(file_path):
     
     return images
 
-def load_image_file(file_path):
-    """Load image file (jpg, png, etc.)"""
+def load_image_file(file_path, budget=None):
+    """Load image file (jpg, png, etc.), decoding large ones at reduced size with a budgets.Budget"""
     try:
-        img = cv2.imread(file_path)
+        reducible = budgets.reducible(file_path)
+        reduction = _admit(budget, 1, budgets.image_size(file_path) if budget is not None else None, reducible)
+        if reduction is None:
+            return []
+        # Keep grayscale scans single-channel instead of expanding them to BGR
+        flags = budgets.REDUCED_DECODE_FLAGS.get(reduction, cv2.IMREAD_ANYCOLOR) if reducible else cv2.IMREAD_ANYCOLOR
+        img = cv2.imread(file_path, flags)
         if img is None:
             # Try with PIL if OpenCV fails
-            img = np.array(Image.open(file_path))
+            img = pil_to_gray(Image.open(file_path))
         return [img]
     except Exception as e:
         print(f"Error loading image file: {e}")
@@ -145,76 +298,269 @@ def extract_text_without_ocr(file_path, file_format):
         # Return empty dictionary with error message
         return {"error": f"Failed to extract text: {str(e)}"}
 
-def extract(file_path, file_format):
+def ocr_configs():
+    """OCR_CONFIGS with the Tesseract vocabulary, see tesseract_vocab"""
+    return [tesseract_vocab.ocr_config(config) for config in OCR_CONFIGS]
+
+def ocr_config_key(ocr_strategy, configs):
+    """Identifies the OCR setup that produced a page's text, for reuse across requests"""
+    if ocr_strategy == "full":
+        return f"{OCR_ENGINE.name}:{OCR_LANG}:data:{'|'.join(configs)}"
+    return f"{OCR_ENGINE.name}:{OCR_LANG}:{ocr_strategy}:{configs[0]}"
+
+def ocr_page(processed_img, page=1, scale=OCR_SCALE, configs=OCR_CONFIGS):
+    """
+    OCR a preprocessed page with each of ``configs`` and keep the reading with
+    the longest text, as a word_table.WordTable in original page coordinates
+    """
+    words = None
+    for config in configs:
+        data = OCR_ENGINE.image_to_data(processed_img, lang=OCR_LANG, config=config)
+        table = word_table.WordTable.from_data(data, page=page, scale=scale)
+        # Use the longer text as it likely contains more information
+        if words is None or len(table.text) >= len(words.text):
+            words = table
+    return words
+
+def _report(progress, stage, **details):
+    """Send a progress event to the optional ``progress`` callback"""
+    if progress is None:
+        return
+    try:
+        progress(dict(stage=stage, **details))
+    except Exception as e:
+        print(f"Error reporting progress: {e}")
+
+def _parse_so_far(file_format, page_words):
+    """Parser over the pages OCR'd so far, or None while the document type is unknown"""
+    parser_class = PARSERS.get(file_format)
+    if parser_class is None:
+        return None
+    return parser_class.from_words(word_table.WordTable.concat(page_words))
+
+def fields_complete(parser, min_confidence=EARLY_STOP_CONFIDENCE):
+    """
+    True if every field of ``parser.parse()`` has a value whose OCR confidence
+    is at least ``min_confidence``. Fields read from text without word
+    confidences (PDF text layers, reused near-duplicate pages) count as confident.
+    """
+    fields = parser.parse()
+    confidence = parser.field_confidence()
+    return all(
+        value and (name not in confidence or confidence[name]["confidence"] >= min_confidence)
+        for name, value in fields.items()
+    )
+
+def extract(file_path, file_format, progress=None, file_ext=None, ocr_strategy=None, page_results=False,
+            page_range=None, early_stop=False, early_stop_confidence=EARLY_STOP_CONFIDENCE):
+    """
+    Extract structured data from a document.
+
+    ``progress`` is an optional callable that receives a dict per pipeline
+    stage: ``decoded`` (page count), ``ocr`` (after each page), ``parsed`` and
+    ``analyzed``. With ``page_results`` it also receives a ``page`` event
+    after each page with that page's text and the fields parsed from the text
+    so far (None while the document type is unknown). ``page_range`` limits
+    a PDF to an inclusive (first, last) range of pages. With ``early_stop``
+    the text is parsed after each page and OCR stops once fields_complete();
+    ``processing_info["early_stop"]`` then lists the pages skipped.
+    ``file_ext`` overrides the file type implied by the path's
+    extension (e.g. ``".pdf"`` for a file detected by its content).
+    ``ocr_strategy`` is one of OCR_STRATEGIES (default RXTRACT_OCR_STRATEGY).
+
+    ``file_format`` ``"auto"`` detects the document type with doc_classifier
+    before OCR, falling back to the full OCR text (and then to prescription)
+    when that is inconclusive. The result is reported under
+    ``processing_info["classification"]``.
+
+    Each page is OCR'd into a word_table.WordTable; ``field_confidence`` in the
+    result gives the OCR confidence, page and box of every parsed field.
+
+    The request runs within a budgets.Budget (RXTRACT_MAX_PAGES and friends):
+    oversized pages are downsampled or tiled, and pages past the page,
+    megapixel, decode or time limit are skipped. If anything was, the result has
+    ``partial`` set and ``processing_info["budget"]`` says what and why.
+    Boxes of tiled pages are relative to their tile.
+
+    PDF pages are their embedded images, their text layer when they have no
+    images, or else rendered at OCR_DPI (see load_pdf_pages());
+    ``processing_info["pdf_pages"]`` lists which.
+    """
+    ocr_strategy = ocr_strategy or DEFAULT_OCR_STRATEGY
+    if ocr_strategy not in OCR_STRATEGIES:
+        return {"error": f"Unsupported OCR strategy: {ocr_strategy}"}
+    
     try:
         # Determine file type based on extension
-        file_ext = os.path.splitext(file_path)[1].lower()
+        file_ext = (file_ext or os.path.splitext(file_path)[1]).lower()
         
         # Load the appropriate file type
+        budget = budgets.Budget.from_env()
+        processing_info = {}
         if file_ext == '.pdf':
-            images = convert_pdf_to_images(file_path)
+            entries = load_pdf_pages(file_path, budget, page_range=page_range)
+            processing_info["pdf_pages"] = [
+                {"page": entry["number"], "pdf_page": entry["pdf_page"], "source": entry["source"]}
+                for entry in entries
+            ]
+            if not entries and not budget.skipped:
+                return {"error": "Could not extract any pages from the PDF"}
         elif file_ext in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif']:
-            images = load_image_file(file_path)
+            entries = [{"number": 1, "source": "image", "image": img} for img in load_image_file(file_path, budget)]
         else:
             return {"error": f"Unsupported file format: {file_ext}"}
         
+        # Oversized pages become downsampled pages or tiles, each OCR'd on its own.
+        # Text layer pages are kept as text (None image); rendered pages are
+        # already at OCR_DPI and are not resized again.
+        images, page_numbers, page_texts, page_scales = [], [], [], []
+        for entry in entries:
+            pieces = budget.fit(entry["image"], entry["number"]) if "image" in entry else [None]
+            images.extend(pieces)
+            page_numbers.extend([entry["number"]] * len(pieces))
+            page_texts.extend([entry.get("text")] * len(pieces))
+            page_scales.extend([1.0 if entry["source"] == "rendered" else OCR_SCALE] * len(pieces))
+        
+        _report(progress, "decoded", pages=len(images))
+        
+        classification = None
+        if file_format == "auto":
+            classification = doc_classifier.classify_document(
+                file_path, file_ext, [img for img in images if img is not None], engine=OCR_ENGINE,
+                lang=OCR_LANG, config=OCR_CONFIGS[0]
+            )
+            _report(progress, "classified", file_format=classification["file_format"],
+                    confidence=classification["confidence"])
+        
         # Create debug directory if it doesn't exist
         debug_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "debug")
-        os.makedirs(debug_dir, exist_ok=True)
+        if DEBUG_ARTIFACTS:
+            os.makedirs(debug_dir, exist_ok=True)
         
         # Save original image for debugging
-        if images and len(images) > 0:
-            first_image = images[0]
+        first_image = next((img for img in images if img is not None), None)
+        if DEBUG_ARTIFACTS and first_image is not None:
             debug_image_path = os.path.join(debug_dir, "original_image.png")
             cv2.imwrite(debug_image_path, first_image)
             print(f"Saved original image to {debug_image_path}")
         
-        # Extract text using OCR
-        extracted_text = ""
+        # OCR every page into a word table; its text feeds the parsers
+        page_words = []
+        page_index = phash_index.get_index()
+        if page_index is not None:
+            processing_info["reused_ocr_pages"] = []
+        if ocr_strategy == "coarse_to_fine":
+            processing_info["coarse_to_fine"] = []
+        # Pages parsed as they are OCR'd need the detected document type
+        parse_format = classification["file_format"] if classification is not None else file_format
+        configs = ocr_configs()
+        config_key = ocr_config_key(ocr_strategy, configs)
         
         for idx, img in enumerate(images):
-            # Preprocess the image
-            processed_img = utils.preprocess_image(img)
+            page_number = page_numbers[idx]
+            if budget.out_of_time():
+                # Out of time: keep what has been OCR'd so far
+                for number in sorted(set(page_numbers[idx:])):
+                    budget.skip(number, "time_limit")
+                print(f"Time budget of {budget.max_seconds}s exhausted, skipping from page {page_number}")
+                break
             
-            # Save processed image for debugging
-            debug_processed_path = os.path.join(debug_dir, f"processed_image_{idx}.png")
-            cv2.imwrite(debug_processed_path, processed_img)
-            print(f"Saved processed image to {debug_processed_path}")
+            if page_texts[idx] is not None:
+                # The PDF's own text: nothing to OCR, no word positions
+                words = word_table.WordTable(page_texts[idx])
+            else:
+                # Preprocess the image
+                if ocr_strategy == "coarse_to_fine":
+                    processed_img = utils.preprocess_image(
+                        img, buffers=utils.thread_buffers("coarse"), scale=coarse_to_fine.COARSE_SCALE
+                    )
+                else:
+                    processed_img = utils.preprocess_image(img, scale=page_scales[idx])
             
-            # Try different OCR configurations for best results
-            text_psm6 = pytesseract.image_to_string(
-                processed_img,
-                lang="eng",
-                config='--psm 6 --oem 3'  # Single block of text, LSTM engine
-            )
+                # Save processed image for debugging
+                if DEBUG_ARTIFACTS:
+                    debug_processed_path = os.path.join(debug_dir, f"processed_image_{idx}.png")
+                    cv2.imwrite(debug_processed_path, processed_img)
+                    print(f"Saved processed image to {debug_processed_path}")
             
-            text_psm4 = pytesseract.image_to_string(
-                processed_img,
-                lang="eng",
-                config='--psm 4 --oem 3'  # Assume single column of text, LSTM engine
-            )
+                # Near-duplicate pages (re-scans, re-faxes) reuse previously OCR'd text
+                match = None
+                if page_index is not None:
+                    page_hash = page_index.hash(processed_img)
+                    match = page_index.lookup(page_hash, processed_img, config_key)
             
-            # Use the longer text as it likely contains more information
-            page_text = text_psm6 if len(text_psm6) > len(text_psm4) else text_psm4
-            extracted_text += page_text + "\n\n"
+                if match is not None:
+                    distance, record = match
+                    # Only the text is kept for reused pages, not word positions
+                    words = word_table.WordTable(record["text"])
+                    processing_info["reused_ocr_pages"].append({"page": page_number, "distance": distance})
+                    print(f"Reused OCR text for page {page_number} from a near-duplicate page (distance {distance})")
+                elif ocr_strategy == "coarse_to_fine":
+                    words, stats = coarse_to_fine.coarse_to_fine_ocr(
+                        OCR_ENGINE, img, processed_img, lang=OCR_LANG, config=configs[0], page=page_number,
+                        line_config=tesseract_vocab.ocr_config(coarse_to_fine.LINE_CONFIG)
+                    )
+                    processing_info["coarse_to_fine"].append(dict(page=page_number, **stats))
+                else:
+                    words = ocr_page(processed_img, page=page_number, scale=page_scales[idx], configs=configs)
+            
+                if match is None and page_index is not None:
+                    page_index.add(page_hash, processed_img, words.text, config_key)
+            
+            page_words.append(words)
+            _report(progress, "ocr", page=idx + 1, pages=len(images))
+            if not (early_stop or page_results and progress is not None):
+                continue
+            parser = _parse_so_far(parse_format, page_words)
+            if page_results:
+                _report(progress, "page", page=page_number, index=idx + 1, pages=len(images), text=words.text,
+                        fields=parser.parse() if parser is not None else None)
+            # Tiles of a page are OCR'd together
+            remaining = sorted(set(page_numbers[idx + 1:]))
+            if (early_stop and remaining and remaining[0] != page_number and parser is not None
+                    and fields_complete(parser, early_stop_confidence)):
+                # Every field has a confident value: the remaining pages are not OCR'd
+                processing_info["early_stop"] = {"after_page": page_number, "skipped_pages": remaining}
+                print(f"All fields found by page {page_number}, skipping pages {remaining}")
+                break
+        
+        words = word_table.WordTable.concat(page_words)
+        extracted_text = words.text
         
         # Save extracted text for debugging
-        debug_text_path = os.path.join(debug_dir, "extracted_text.txt")
-        with open(debug_text_path, "w", encoding="utf-8") as f:
-            f.write(extracted_text)
-        print(f"Saved extracted text to {debug_text_path}")
+        if DEBUG_ARTIFACTS:
+            debug_text_path = os.path.join(debug_dir, "extracted_text.txt")
+            with open(debug_text_path, "w", encoding="utf-8") as f:
+                f.write(extracted_text)
+            print(f"Saved extracted text to {debug_text_path}")
+        
+        if classification is not None:
+            if classification["file_format"] is None:
+                # Inconclusive from the header: the full text has every keyword
+                start = time.perf_counter()
+                detected, confidence, scores = doc_classifier.classify_text(extracted_text)
+                classification.update(
+                    file_format=detected or "prescription", confidence=confidence, method="full_text",
+                    scores=scores, seconds=round(classification["seconds"] + time.perf_counter() - start, 4)
+                )
+            file_format = classification["file_format"]
+            processing_info["classification"] = classification
+            print(f"Classified document as {file_format} ({classification['method']}, "
+                  f"confidence {classification['confidence']})")
         
         # Parse the extracted text based on the document format
         if file_format == "prescription":
-            parser = PrescriptionParser(extracted_text)
+            parser = PrescriptionParser.from_words(words)
             extracted_data = parser.parse()
+            extracted_data["field_confidence"] = parser.field_confidence()
+            _report(progress, "parsed")
             
             # Add AI analysis using SmolDocling
             try:
                 from smoldocling_analyzer import SmolDoclingAnalyzer
                 analyzer = SmolDoclingAnalyzer()
                 if analyzer.is_model_available():
-                    analysis = analyzer.analyze_prescription(extracted_text)
+                    analysis = analyzer.analyze_prescription(extracted_text, words=words)
                     extracted_data["ai_analysis"] = analysis
                     print("Added AI analysis to extracted data")
                 else:
@@ -223,15 +569,17 @@ def extract(file_path, file_format):
                 print(f"Error performing AI analysis: {str(e)}")
                 
         elif file_format == "patient_details":
-            parser = PatientDetailsParser(extracted_text)
+            parser = PatientDetailsParser.from_words(words)
             extracted_data = parser.parse()
+            extracted_data["field_confidence"] = parser.field_confidence()
+            _report(progress, "parsed")
             
             # Add AI analysis for patient details
             try:
                 from smoldocling_analyzer import SmolDoclingAnalyzer
                 analyzer = SmolDoclingAnalyzer()
                 if analyzer.is_model_available():
-                    analysis = analyzer.analyze_patient_details(extracted_text)
+                    analysis = analyzer.analyze_patient_details(extracted_text, words=words)
                     extracted_data["ai_analysis"] = analysis
                     print("Added AI analysis to extracted data")
                 else:
@@ -240,12 +588,22 @@ def extract(file_path, file_format):
                 print(f"Error performing AI analysis: {str(e)}")
         else:
             return {"error": f"Unsupported document format: {file_format}"}
+        _report(progress, "analyzed")
+        
+        budget_report = budget.report()
+        if budget_report["skipped_pages"] or budget_report["degraded_pages"]:
+            processing_info["budget"] = budget_report
+            extracted_data["partial"] = budget_report["partial"]
+        
+        if processing_info:
+            extracted_data["processing_info"] = processing_info
         
         # Save parsed data for debugging
-        debug_json_path = os.path.join(debug_dir, "parsed_data.json")
-        with open(debug_json_path, "w", encoding="utf-8") as f:
-            json.dump(extracted_data, f, indent=2)
-        print(f"Saved parsed data to {debug_json_path}")
+        if DEBUG_ARTIFACTS:
+            debug_json_path = os.path.join(debug_dir, "parsed_data.json")
+            with open(debug_json_path, "w", encoding="utf-8") as f:
+                json.dump(extracted_data, f, indent=2)
+            print(f"Saved parsed data to {debug_json_path}")
         
         return extracted_data
     
@@ -256,6 +614,12 @@ def extract(file_path, file_format):
         return {"error": f"Failed to extract data: {str(e)}"}
 
 if __name__ == "__main__":
-    # Test the extraction
-    data = extract("backend/resources/patient_details/pd_1.pdf", "patient_details")
-    print(data)
\ No newline at end of file
+    # Extract a single document: python extractor.py FILE [prescription|patient_details|auto]
+    # For directories of documents use bulk_extract.py
+    if len(sys.argv) > 1:
+        file_path = sys.argv[1]
+        file_format = sys.argv[2] if len(sys.argv) > 2 else "prescription"
+    else:
+        file_path, file_format = "backend/resources/patient_details/pd_1.pdf", "patient_details"
+    data = extract(file_path, file_format)
+    print(json.dumps(data, indent=2))
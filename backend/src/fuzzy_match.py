@@ -0,0 +1,100 @@
+"""
+Edit-distance helpers for OCR-tolerant name matching.
+
+The knowledge base index stores a SymSpell-style deletion table: every name is
+reduced to all strings obtainable by deleting up to MAX_EDIT_DISTANCE
+characters from its first PREFIX_LENGTH characters. A query token generates
+its own deletes the same way; any name sharing a delete with the token is a
+candidate within that edit distance, which is then confirmed with
+edit_distance(). This turns fuzzy search into a handful of hash probes per
+token regardless of the vocabulary size.
+"""
+
+# Largest edit distance the deletion table supports
+MAX_EDIT_DISTANCE = 2
+# Only this many leading characters generate deletes (SymSpell's prefix length)
+PREFIX_LENGTH = 7
+# Tokens shorter than this are never fuzzy matched ("mg", "bid", ...)
+MIN_TOKEN_LENGTH = 5
+# Fuzzy matches below this confidence (see confidence()) are ignored by default
+MIN_CONFIDENCE = 0.75
+
+
+def deletes(word, max_distance=MAX_EDIT_DISTANCE, prefix_length=PREFIX_LENGTH):
+    """Return the set of strings made by deleting up to ``max_distance`` characters from the word's prefix"""
+    word = word[:prefix_length]
+    results = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        next_frontier = set()
+        for item in frontier:
+            if len(item) <= 1:
+                continue
+            for i in range(len(item)):
+                next_frontier.add(item[:i] + item[i + 1:])
+        next_frontier -= results
+        results |= next_frontier
+        frontier = next_frontier
+    return results
+
+
+def edit_distance(a, b, max_distance):
+    """
+    Damerau-Levenshtein (optimal string alignment) distance between a and b,
+    or ``max_distance + 1`` as soon as it is known to exceed ``max_distance``.
+
+    Only the diagonal band of width ``max_distance`` is computed, after
+    stripping the common prefix and suffix.
+    """
+    too_far = max_distance + 1
+    if abs(len(a) - len(b)) > max_distance:
+        return too_far
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    a, b = a[start:end_a], b[start:end_b]
+    if not a or not b:
+        return len(a) + len(b) if len(a) + len(b) <= max_distance else too_far
+
+    width = len(b)
+    previous_previous = None
+    previous = [j if j <= max_distance else too_far for j in range(width + 1)]
+    for i in range(1, len(a) + 1):
+        current = [too_far] * (width + 1)
+        if i <= max_distance:
+            current[0] = i
+        low, high = max(1, i - max_distance), min(width, i + max_distance)
+        row_min = current[0]
+        char_a = a[i - 1]
+        for j in range(low, high + 1):
+            value = previous[j - 1] if char_a == b[j - 1] else previous[j - 1] + 1
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == b[j - 1] \
+                    and previous_previous[j - 2] + 1 < value:
+                value = previous_previous[j - 2] + 1
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > max_distance:
+            return too_far
+        previous_previous, previous = previous, current
+    return previous[width] if previous[width] <= max_distance else too_far
+
+
+def allowed_distance(token):
+    """Edit distance tolerated for a token: none for short tokens, 1 up to 7 characters, then 2"""
+    if len(token) < MIN_TOKEN_LENGTH:
+        return 0
+    return 1 if len(token) < 8 else MAX_EDIT_DISTANCE
+
+
+def confidence(token, name, distance):
+    """Match confidence in [0, 1]: the share of the longer string that did not need editing"""
+    return round(1.0 - distance / float(max(len(token), len(name))), 3)
@@ -0,0 +1,503 @@
+"""
+Medication and condition knowledge base.
+
+The source of truth is a versioned JSON file (backend/data/knowledge_base.json)
+mapping canonical names to records with synonyms. It is compiled once into a
+binary index that is opened with mmap, so loading costs a header read however
+big the formulary is, and worker processes share the file's pages through the
+page cache instead of each holding a copy of the data.
+
+Index layout (little-endian):
+    header   HEADER struct (see the comment above it)
+    keys     n_keys KEY_ENTRY structs (key offset, key length, record number),
+             sorted by key bytes. A key is a kind prefix ("m:" or "c:")
+             followed by a normalized name or synonym.
+    slots    open-addressing hash table of n_slots uint32 key positions + 1
+             (0 is empty), indexed by CRC-32 of the key with linear probing
+    records  n_records RECORD_ENTRY structs (offset, length)
+    pairs    open-addressing hash table of INTERACTION structs keyed by the
+             pair of medication record numbers (lower first, stored + 1 so 0
+             is empty): the sparse drug-drug interaction matrix
+    buckets  n_buckets + 1 uint32 offsets into the postings, by CRC-32 of a
+             kind prefix plus delete (see fuzzy_match), modulo n_buckets
+    postings DELETE_ENTRY structs (delete CRC-32, key position) by bucket
+    blobs    key bytes, compact JSON records, then interaction descriptions
+
+Interactions are listed in the source as {"drugs": [a, b], "severity": ...,
+"description": ...}; checking k medications costs k * (k - 1) / 2 probes of
+the pair table whatever the size of the formulary. Fuzzy lookups of OCR'd
+tokens probe the deletion table once per delete of the token.
+
+Usage:
+    python backend/src/knowledge_base.py build [SOURCE] [--output INDEX]
+    python backend/src/knowledge_base.py lookup NAME
+"""
+import argparse
+import functools
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+
+import numpy as np
+
+import fuzzy_match
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SOURCE_PATH = os.path.join(BACKEND_DIR, "data", "knowledge_base.json")
+DEFAULT_INDEX_PATH = os.path.join(BACKEND_DIR, "cache", "knowledge_base.idx")
+
+MAGIC = b"RXKB"
+FORMAT_VERSION = 3
+# magic, format version, KB version, source size, source mtime (ns), key count,
+# record count, longest key in words, hash slot count, interaction count,
+# interaction slot count, delete bucket count, delete entry count,
+# keys/slots/records/pairs/buckets/postings/blob offsets
+HEADER = struct.Struct("<4sIIQQIIIIIIIIQQQQQQQ")
+KEY_ENTRY = struct.Struct("<III")
+SLOT = struct.Struct("<I")
+RECORD_ENTRY = struct.Struct("<II")
+# first record + 1, second record + 1, severity, description offset, description length
+INTERACTION = struct.Struct("<IIIII")
+DELETE_ENTRY = struct.Struct("<II")
+
+KINDS = {"medication": b"m:", "condition": b"c:"}
+SOURCE_SECTIONS = {"medication": "medications", "condition": "conditions"}
+# Interaction severities, least severe first
+SEVERITIES = ["minor", "moderate", "major", "contraindicated"]
+
+
+def normalize_name(name):
+    """Lower-case and reduce to alphanumeric words separated by single spaces"""
+    return " ".join(re.findall(r"[a-z0-9]+", name.lower()))
+
+
+def _table_size(entries):
+    """Power-of-two slot count keeping an open-addressing table at most half full"""
+    size = 1
+    while size < 2 * entries:
+        size *= 2
+    return size
+
+
+def _pair_slot(first, second, mask):
+    return ((first * 2654435761) ^ (second * 40503)) & mask
+
+
+def _resolve_interactions(interactions, keys):
+    """Map source interactions to {(record, record): (severity, description)}"""
+    pairs = {}
+    for interaction in interactions:
+        drugs = interaction["drugs"]
+        records = []
+        for drug in drugs:
+            record_number = keys.get(KINDS["medication"] + normalize_name(drug).encode("utf-8"))
+            if record_number is None:
+                raise ValueError(f"Interaction {drugs} names an unknown medication: {drug}")
+            records.append(record_number)
+        if len(records) != 2 or records[0] == records[1]:
+            raise ValueError(f"An interaction needs two different medications: {drugs}")
+        if interaction["severity"] not in SEVERITIES:
+            raise ValueError(f"Unknown severity {interaction['severity']!r} for {drugs}")
+        severity = SEVERITIES.index(interaction["severity"])
+        pair = (min(records), max(records))
+        # Keep the most severe entry if a pair is listed twice
+        if pair not in pairs or pairs[pair][0] < severity:
+            pairs[pair] = (severity, interaction.get("description", ""))
+    return pairs
+
+
+def _build_deletion_table(sorted_keys):
+    """Return (bucket offsets, postings) arrays of the fuzzy deletion table"""
+    hashes, positions = [], []
+    for position, key in enumerate(sorted_keys):
+        prefix, name = key[:2], key[2:].decode("utf-8")
+        # Shorter names could only match tokens too short to be fuzzy matched
+        if len(name) < fuzzy_match.MIN_TOKEN_LENGTH - 1:
+            continue
+        for delete in fuzzy_match.deletes(name):
+            hashes.append(zlib.crc32(prefix + delete.encode("utf-8")))
+            positions.append(position)
+    bucket_count = max(_table_size(len(hashes)) // 2, 1)
+    postings = np.empty(len(hashes), dtype=[("hash", "<u4"), ("position", "<u4")])
+    postings["hash"] = hashes
+    postings["position"] = positions
+    buckets = postings["hash"] & np.uint32(bucket_count - 1)
+    order = np.argsort(buckets, kind="stable")
+    postings = postings[order]
+    offsets = np.searchsorted(buckets[order], np.arange(bucket_count + 1)).astype("<u4")
+    return offsets, postings
+
+
+def build_index(source_path=DEFAULT_SOURCE_PATH, index_path=DEFAULT_INDEX_PATH):
+    """
+    Compile the JSON knowledge base at ``source_path`` into ``index_path``.
+
+    The file is written to a temporary name and renamed into place, so
+    processes that already mapped the old index keep a consistent view.
+    """
+    with open(source_path, "r", encoding="utf-8") as f:
+        source = json.load(f)
+    stat = os.stat(source_path)
+
+    keys, records = {}, []
+    max_words = 1
+    for kind, prefix in KINDS.items():
+        for name, record in source.get(SOURCE_SECTIONS[kind], {}).items():
+            record = dict(record, name=name, kind=kind)
+            record_number = len(records)
+            records.append(json.dumps(record, separators=(",", ":")).encode("utf-8"))
+            for alias in [name] + record.get("synonyms", []):
+                normalized = normalize_name(alias)
+                if not normalized:
+                    continue
+                # The first record to claim a name keeps it
+                keys.setdefault(prefix + normalized.encode("utf-8"), record_number)
+                max_words = max(max_words, normalized.count(" ") + 1)
+
+    pairs = _resolve_interactions(source.get("interactions", []), keys)
+
+    sorted_keys = sorted(keys)
+    slot_count = _table_size(len(sorted_keys))
+    slots = [0] * slot_count
+    for position, key in enumerate(sorted_keys):
+        slot = zlib.crc32(key) & (slot_count - 1)
+        while slots[slot]:
+            slot = (slot + 1) & (slot_count - 1)
+        slots[slot] = position + 1
+
+    keys_offset = HEADER.size
+    slots_offset = keys_offset + KEY_ENTRY.size * len(sorted_keys)
+    records_offset = slots_offset + SLOT.size * slot_count
+    pairs_offset = records_offset + RECORD_ENTRY.size * len(records)
+    pair_slot_count = _table_size(len(pairs))
+    bucket_offsets, postings = _build_deletion_table(sorted_keys)
+    buckets_offset = pairs_offset + INTERACTION.size * pair_slot_count
+    postings_offset = buckets_offset + bucket_offsets.nbytes
+    blob_offset = postings_offset + postings.nbytes
+
+    blob = bytearray()
+    key_table = bytearray()
+    for key in sorted_keys:
+        key_table += KEY_ENTRY.pack(blob_offset + len(blob), len(key), keys[key])
+        blob += key
+    record_table = bytearray()
+    for record in records:
+        record_table += RECORD_ENTRY.pack(blob_offset + len(blob), len(record))
+        blob += record
+    pair_table = bytearray(INTERACTION.size * pair_slot_count)
+    for (first, second), (severity, description) in pairs.items():
+        slot = _pair_slot(first, second, pair_slot_count - 1)
+        while INTERACTION.unpack_from(pair_table, slot * INTERACTION.size)[0]:
+            slot = (slot + 1) & (pair_slot_count - 1)
+        description = description.encode("utf-8")
+        INTERACTION.pack_into(pair_table, slot * INTERACTION.size, first + 1, second + 1, severity,
+                              blob_offset + len(blob), len(description))
+        blob += description
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, int(source.get("version", 0)), stat.st_size, stat.st_mtime_ns,
+                         len(sorted_keys), len(records), max_words, slot_count, len(pairs), pair_slot_count,
+                         len(bucket_offsets) - 1, len(postings), keys_offset, slots_offset, records_offset,
+                         pairs_offset, buckets_offset, postings_offset, blob_offset)
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(key_table)
+        f.write(struct.pack(f"<{slot_count}I", *slots))
+        f.write(record_table)
+        f.write(pair_table)
+        f.write(bucket_offsets.tobytes())
+        f.write(postings.tobytes())
+        f.write(blob)
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+class KnowledgeBase:
+    """
+    Read-only view of a compiled knowledge base index.
+
+    Lookups probe the memory-mapped hash table, so only the pages they touch
+    are read; decoded records are cached per process.
+    """
+
+    def __init__(self, index_path=DEFAULT_INDEX_PATH):
+        self.index_path = index_path
+        with open(index_path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            stat = os.fstat(f.fileno())
+        # Identifies the file opened, see is_replaced()
+        self.file_id = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        (magic, format_version, self.version, self.source_size, self.source_mtime_ns, self.key_count,
+         self.record_count, self.max_words, self._slot_count, self.interaction_count, self._pair_slot_count,
+         self._bucket_count, self.delete_count, self._keys_offset, self._slots_offset, self._records_offset,
+         self._pairs_offset, self._buckets_offset, self._postings_offset,
+         self._blob_offset) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            self._map.close()
+            raise ValueError(f"Not a knowledge base index (format {FORMAT_VERSION}): {index_path}")
+        # Identifies the source the index was compiled from, for caches of
+        # results derived from it: ``version`` is edited by hand and may not change
+        self.content_id = (index_path, self.source_size, self.source_mtime_ns)
+        self.record = functools.lru_cache(maxsize=4096)(self._record)
+
+    def close(self):
+        self._map.close()
+
+    def is_replaced(self):
+        """True if the index file was rebuilt or removed since it was opened"""
+        try:
+            stat = os.stat(self.index_path)
+        except OSError:
+            return True
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns) != self.file_id
+
+    def __len__(self):
+        return self.record_count
+
+    def _key(self, position):
+        offset, length, record_number = KEY_ENTRY.unpack_from(self._map, self._keys_offset + position * KEY_ENTRY.size)
+        return self._map[offset:offset + length], record_number
+
+    def _record(self, record_number):
+        offset, length = RECORD_ENTRY.unpack_from(self._map, self._records_offset + record_number * RECORD_ENTRY.size)
+        return json.loads(self._map[offset:offset + length])
+
+    def find(self, name, kind="medication"):
+        """Return the record number for a name or synonym of ``kind``, or None"""
+        target = KINDS[kind] + normalize_name(name).encode("utf-8")
+        mask = self._slot_count - 1
+        slot = zlib.crc32(target) & mask
+        while True:
+            (position,) = SLOT.unpack_from(self._map, self._slots_offset + slot * SLOT.size)
+            if position == 0:
+                return None
+            key, record_number = self._key(position - 1)
+            if key == target:
+                return record_number
+            slot = (slot + 1) & mask
+
+    def lookup(self, name, kind="medication"):
+        """Return the record (with canonical ``name``) for a name or synonym, or None"""
+        record_number = self.find(name, kind)
+        return None if record_number is None else self.record(record_number)
+
+    def names(self, kind="medication"):
+        """Yield every normalized name and synonym of ``kind`` with its record number"""
+        prefix = KINDS[kind]
+        for position in range(self.key_count):
+            key, record_number = self._key(position)
+            if key.startswith(prefix):
+                yield key[len(prefix):].decode("utf-8"), record_number
+
+    def _interaction(self, first, second):
+        """Return (severity, description) for two medication record numbers, or None"""
+        first, second = min(first, second) + 1, max(first, second) + 1
+        mask = self._pair_slot_count - 1
+        slot = _pair_slot(first - 1, second - 1, mask)
+        while True:
+            entry = INTERACTION.unpack_from(self._map, self._pairs_offset + slot * INTERACTION.size)
+            if entry[0] == 0:
+                return None
+            if entry[0] == first and entry[1] == second:
+                offset, length = entry[3], entry[4]
+                return SEVERITIES[entry[2]], self._map[offset:offset + length].decode("utf-8")
+            slot = (slot + 1) & mask
+
+    def interactions(self, medications):
+        """
+        Return the known interactions among ``medications`` (names or synonyms).
+
+        Returns:
+            list: dicts with the two canonical drug names, severity and
+            description, most severe first
+        """
+        records = []
+        for name in medications:
+            record_number = self.find(name, "medication")
+            if record_number is not None and record_number not in records:
+                records.append(record_number)
+        found = []
+        for i, first in enumerate(records):
+            for second in records[i + 1:]:
+                interaction = self._interaction(first, second)
+                if interaction is not None:
+                    found.append({
+                        "drugs": [self.record(first)["name"], self.record(second)["name"]],
+                        "severity": interaction[0],
+                        "description": interaction[1],
+                    })
+        found.sort(key=lambda item: -SEVERITIES.index(item["severity"]))
+        return found
+
+    def fuzzy_find(self, token, kind="medication", max_distance=None):
+        """
+        Resolve a possibly misread token ("Lia1da") to the closest name or synonym.
+
+        ``max_distance`` defaults to fuzzy_match.allowed_distance(token).
+        Returns a dict with the record number, the canonical ``name``, the
+        ``matched`` name or synonym, the edit ``distance`` and a
+        ``confidence`` in [0, 1], or None when nothing is close enough.
+        """
+        token = normalize_name(token)
+        if max_distance is None:
+            max_distance = fuzzy_match.allowed_distance(token)
+        max_distance = min(max_distance, fuzzy_match.MAX_EDIT_DISTANCE)
+        prefix = KINDS[kind]
+        mask = self._bucket_count - 1
+        candidates = set()
+        for delete in fuzzy_match.deletes(token, max_distance):
+            delete_hash = zlib.crc32(prefix + delete.encode("utf-8"))
+            bucket = self._buckets_offset + (delete_hash & mask) * SLOT.size
+            start, end = struct.unpack_from("<II", self._map, bucket)
+            for entry in range(start, end):
+                entry_hash, position = DELETE_ENTRY.unpack_from(self._map, self._postings_offset + entry * DELETE_ENTRY.size)
+                if entry_hash == delete_hash:
+                    candidates.add(position)
+
+        best = None
+        for position in sorted(candidates):
+            key, record_number = self._key(position)
+            name = key[len(prefix):].decode("utf-8")
+            limit = max_distance if best is None else best[0] - 1
+            distance = fuzzy_match.edit_distance(token, name, limit)
+            if distance <= limit:
+                best = (distance, name, record_number)
+                if distance == 0:
+                    break
+        if best is None:
+            return None
+        distance, name, record_number = best
+        return {
+            "record": record_number,
+            "name": self.record(record_number)["name"],
+            "matched": name,
+            "distance": distance,
+            "confidence": fuzzy_match.confidence(token, name, distance),
+        }
+
+    def match_text(self, text, kind="medication", fuzzy=False, min_confidence=fuzzy_match.MIN_CONFIDENCE):
+        """
+        Find the names of ``kind`` mentioned in ``text``.
+
+        Every run of up to ``max_words`` consecutive words is looked up, so the
+        cost depends on the length of the text, not the size of the formulary.
+        With ``fuzzy``, single words that match nothing exactly are resolved
+        with fuzzy_find() and kept if their confidence reaches ``min_confidence``.
+
+        Returns:
+            list: dicts with the canonical ``name``, the ``text`` that matched
+            and its ``confidence`` (1.0 for exact matches), in knowledge base
+            order, one per record
+        """
+        words = re.findall(r"[a-z0-9]+", text.lower())
+        found = {}
+        matched_words = set()
+        for start in range(len(words)):
+            for length in range(1, min(self.max_words, len(words) - start) + 1):
+                phrase = " ".join(words[start:start + length])
+                record_number = self.find(phrase, kind)
+                if record_number is not None:
+                    found.setdefault(record_number, (phrase, 1.0))
+                    matched_words.update(range(start, start + length))
+        if fuzzy:
+            for index, word in enumerate(words):
+                if index in matched_words or word.isdigit() or len(word) < fuzzy_match.MIN_TOKEN_LENGTH:
+                    continue
+                match = self.fuzzy_find(word, kind)
+                if match is None or match["confidence"] < min_confidence:
+                    continue
+                previous = found.get(match["record"])
+                if previous is None or previous[1] < match["confidence"]:
+                    found[match["record"]] = (word, match["confidence"])
+        return [
+            {"name": self.record(record_number)["name"], "text": found[record_number][0],
+             "confidence": found[record_number][1]}
+            for record_number in sorted(found)
+        ]
+
+    def find_in_text(self, text, kind="medication", fuzzy=False):
+        """Return the canonical names of ``kind`` mentioned in ``text``, see match_text()"""
+        return [match["name"] for match in self.match_text(text, kind, fuzzy=fuzzy)]
+
+
+def _index_is_current(index_path, source_path):
+    if not os.path.exists(index_path):
+        return False
+    if not os.path.exists(source_path):
+        return True
+    stat = os.stat(source_path)
+    try:
+        with open(index_path, "rb") as f:
+            header = HEADER.unpack(f.read(HEADER.size))
+    except (OSError, struct.error):
+        return False
+    return header[0] == MAGIC and header[1] == FORMAT_VERSION and header[3:5] == (stat.st_size, stat.st_mtime_ns)
+
+
+# Seconds between checks of the source and index for updates
+CHECK_INTERVAL = float(os.environ.get("RXTRACT_KB_CHECK_INTERVAL", "30"))
+
+_knowledge_base = None
+_checked_at = 0.0
+_knowledge_base_lock = threading.Lock()
+
+
+def get_knowledge_base():
+    """
+    Return the process-wide knowledge base, compiling the index if it is
+    missing or older than its source. At most every CHECK_INTERVAL seconds
+    (RXTRACT_KB_CHECK_INTERVAL, default 30) the source and index are checked
+    again: an edited source is recompiled and a rebuilt index reopened.
+    Objects already holding the previous knowledge base keep using it.
+
+    RXTRACT_KB_SOURCE and RXTRACT_KB_INDEX override the JSON source and the
+    compiled index paths.
+    """
+    global _knowledge_base, _checked_at
+    with _knowledge_base_lock:
+        now = time.monotonic()
+        if _knowledge_base is None or now - _checked_at >= CHECK_INTERVAL:
+            _checked_at = now
+            source_path = os.environ.get("RXTRACT_KB_SOURCE", DEFAULT_SOURCE_PATH)
+            index_path = os.environ.get("RXTRACT_KB_INDEX", DEFAULT_INDEX_PATH)
+            if not _index_is_current(index_path, source_path):
+                print(f"Compiling knowledge base index {index_path} from {source_path}")
+                build_index(source_path, index_path)
+            if (_knowledge_base is None or _knowledge_base.index_path != index_path
+                    or _knowledge_base.is_replaced()):
+                # The previous map is closed when the last reference to it goes
+                _knowledge_base = KnowledgeBase(index_path)
+    return _knowledge_base
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the knowledge base index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="compile the JSON knowledge base")
+    build.add_argument("source", nargs="?", default=DEFAULT_SOURCE_PATH)
+    build.add_argument("--output", default=DEFAULT_INDEX_PATH)
+    lookup = commands.add_parser("lookup", help="look a name or synonym up")
+    lookup.add_argument("name")
+    lookup.add_argument("--kind", choices=sorted(KINDS), default="medication")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        path = build_index(args.source, args.output)
+        kb = KnowledgeBase(path)
+        print(f"Wrote {path}: version {kb.version}, {len(kb)} records, {kb.key_count} names, "
+              f"{kb.interaction_count} interactions")
+        return 0
+    record = get_knowledge_base().lookup(args.name, args.kind)
+    print(json.dumps(record, indent=2))
+    return 0 if record is not None else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
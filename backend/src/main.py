@@ -1,24 +1,34 @@
-from fastapi import FastAPI, Form, UploadFile, File, HTTPException
+from fastapi import FastAPI, Form, UploadFile, File, Header, HTTPException, Response
+from fastapi.responses import FileResponse, StreamingResponse
 import uvicorn
-from extractor import extract
+from extractor import extract, FILE_FORMATS, OCR_STRATEGIES
+import ocr_engine
+import ocr_cache
+import profiling
+from smoldocling_analyzer import analysis_cache
 import uuid
+import hmac
 import os
 import shutil
+import json
+import queue
+import threading
+from typing import Optional
 
 app = FastAPI()
 
 # Ensure uploads directory exists
-UPLOAD_DIR = "backend/uploads"
+UPLOAD_DIR = os.environ.get("RXTRACT_UPLOAD_DIR", "backend/uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-@app.post("/extract_from_doc")
-def extract_from_doc(
-    file: UploadFile = File(...),
-    file_format: str = Form(...)
-):
+def save_upload(file, file_format, ocr_strategy=None):
+    """Validate the request and write the upload to UPLOAD_DIR, returning its path"""
     # Validate file format
-    if file_format not in ["prescription", "patient_details"]:
-        raise HTTPException(status_code=400, detail=f"Invalid file format: {file_format}. Must be 'prescription' or 'patient_details'")
+    if file_format not in FILE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid file format: {file_format}. Must be one of {', '.join(FILE_FORMATS)}")
+    
+    if ocr_strategy is not None and ocr_strategy not in OCR_STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"Invalid OCR strategy: {ocr_strategy}. Must be one of {', '.join(OCR_STRATEGIES)}")
     
     # Validate file type
     file_extension = os.path.splitext(file.filename)[1].lower()
@@ -46,36 +56,214 @@ def extract_from_doc(
             f.write(content)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error saving file: {str(e)}")
+    
+    return FILE_PATH
 
-    # Process file
+def parse_page_range(pages):
+    """Parse a ``pages`` form field ("3" or "2-5") into an inclusive (first, last) range, or None"""
+    if not pages:
+        return None
+    first, _, last = pages.partition("-")
     try:
-        # Check if Tesseract is available
-        tesseract_path = os.environ.get("TESSERACT_PATH", "C:/Program Files/Tesseract-OCR/tesseract.exe")
-        if not os.path.exists(tesseract_path):
-            raise HTTPException(
-                status_code=500,
-                detail=f"Tesseract OCR not found at {tesseract_path}. Please ensure Tesseract 5.5.0 is installed."
+        page_range = (int(first), int(last or first))
+    except ValueError:
+        page_range = None
+    if page_range is None or page_range[0] < 1 or page_range[1] < page_range[0]:
+        raise HTTPException(status_code=400, detail=f"Invalid page range: {pages}. Use e.g. 3 or 2-5")
+    return page_range
+
+def check_ocr_engine():
+    """Raise if the configured OCR engine cannot run"""
+    tesseract_path = os.environ.get("TESSERACT_PATH", "C:/Program Files/Tesseract-OCR/tesseract.exe")
+    if not ocr_engine.get_engine().is_available():
+        raise HTTPException(
+            status_code=500,
+            detail=f"Tesseract OCR not found at {tesseract_path}. Please ensure Tesseract 5.5.0 is installed."
+        )
+
+def processing_error(e):
+    """Build the HTTPException returned when processing a file fails"""
+    # Provide more helpful error message for common issues
+    error_message = str(e)
+    if "tesseract" in error_message.lower():
+        error_message = "Tesseract OCR 5.5.0 is not installed or it's not in your PATH. Please ensure it's installed at C:/Program Files/Tesseract-OCR/tesseract.exe or set the TESSERACT_PATH environment variable."
+    
+    return HTTPException(status_code=500, detail=f"Error processing file: {error_message}")
+
+def check_admin_token(token):
+    """
+    Raise unless ``token`` is the admin token (RXTRACT_ADMIN_TOKEN). Profiling
+    requests and /admin endpoints are disabled when no token is configured.
+    """
+    admin_token = os.environ.get("RXTRACT_ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled. Set RXTRACT_ADMIN_TOKEN to enable them.")
+    if not hmac.compare_digest((token or "").encode(), admin_token.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def profile_mode(x_profile, x_admin_token):
+    """Profiler mode for a request: the X-Profile header's (admin only) or sampled, else None"""
+    if x_profile:
+        check_admin_token(x_admin_token)
+    try:
+        return profiling.get_profiler().choose_mode(x_profile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def remove_upload(file_path):
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+def extraction_events(file_path, file_format, ocr_strategy, mode, label, page_results=False, page_range=None,
+                      early_stop=False):
+    """
+    Run extract() on a background thread and yield its ``(event, data)``
+    pairs: ``progress`` events, a ``profile`` event if the request was
+    profiled, then a single ``result`` or ``error``. Removes the upload when
+    done.
+    """
+    events = queue.Queue()
+
+    def run():
+        try:
+            data, profile_id = profiling.get_profiler().run(
+                lambda progress: extract(file_path, file_format, progress=progress, ocr_strategy=ocr_strategy,
+                                         page_results=page_results, page_range=page_range,
+                                         early_stop=early_stop),
+                mode, label=label, progress=lambda event: events.put(("progress", event))
             )
-            
-        data = extract(FILE_PATH, file_format)
+            if profile_id:
+                events.put(("profile", {"id": profile_id}))
+            events.put(("result", data))
+        except Exception as e:
+            events.put(("error", {"detail": processing_error(e).detail}))
+        finally:
+            remove_upload(file_path)
+
+    threading.Thread(target=run, daemon=True).start()
+    while True:
+        event, data = events.get()
+        yield event, data
+        if event in ("result", "error"):
+            break
+
+def ndjson_events(events):
+    """
+    NDJSON lines for /extract_from_doc streaming: one ``page`` line per OCR'd
+    page (``page``, ``index``, ``pages``, ``text``, ``fields``), then
+    ``profile`` if profiled and a final ``result`` (``data``) or ``error``.
+    """
+    for event, data in events:
+        if event == "progress":
+            if data.get("stage") != "page":
+                continue
+            line = dict(data, event="page")
+            del line["stage"]
+        elif event == "result":
+            line = {"event": "result", "data": data}
+        else:
+            line = dict(data, event=event)
+        yield json.dumps(line) + "\n"
+
+@app.post("/extract_from_doc")
+def extract_from_doc(
+    response: Response,
+    file: UploadFile = File(...),
+    file_format: str = Form(...),
+    ocr_strategy: Optional[str] = Form(None),
+    pages: Optional[str] = Form(None),
+    early_stop: bool = Form(False),
+    x_profile: Optional[str] = Header(None),
+    x_admin_token: Optional[str] = Header(None),
+    accept: Optional[str] = Header(None)
+):
+    """
+    Extract data from an uploaded document. With an ``X-Profile: cprofile``
+    or ``sampling`` header (and ``X-Admin-Token``) the request is profiled
+    and the ``X-Profile-Id`` response header names the stored profile.
+
+    With ``Accept: application/x-ndjson`` the response streams one JSON line
+    per page as it is OCR'd, with the fields found so far, and ends with the
+    merged result (see ndjson_events()).
+
+    ``pages`` ("3" or "2-5") limits a PDF to those pages. With ``early_stop``
+    set, pages after the one where every field was found with confidence are
+    not OCR'd; ``processing_info.early_stop`` lists them.
+    """
+    mode = profile_mode(x_profile, x_admin_token)
+    page_range = parse_page_range(pages)
+    FILE_PATH = save_upload(file, file_format, ocr_strategy)
+
+    if accept and "application/x-ndjson" in accept:
+        try:
+            check_ocr_engine()
+        except Exception as e:
+            remove_upload(FILE_PATH)
+            raise processing_error(e)
+        events = extraction_events(FILE_PATH, file_format, ocr_strategy, mode,
+                                   label=f"/extract_from_doc {file_format} {file.filename}", page_results=True,
+                                   page_range=page_range, early_stop=early_stop)
+        return StreamingResponse(ndjson_events(events), media_type="application/x-ndjson",
+                                 headers={"Cache-Control": "no-cache"})
+
+    # Process file
+    try:
+        check_ocr_engine()
+        data, profile_id = profiling.get_profiler().run(
+            lambda progress: extract(FILE_PATH, file_format, progress=progress, ocr_strategy=ocr_strategy,
+                                     page_range=page_range, early_stop=early_stop),
+            mode, label=f"/extract_from_doc {file_format} {file.filename}"
+        )
+        if profile_id:
+            response.headers["X-Profile-Id"] = profile_id
     except Exception as e:
         # Clean up file
-        if os.path.exists(FILE_PATH):
-            os.remove(FILE_PATH)
-        
-        # Provide more helpful error message for common issues
-        error_message = str(e)
-        if "tesseract" in error_message.lower():
-            error_message = "Tesseract OCR 5.5.0 is not installed or it's not in your PATH. Please ensure it's installed at C:/Program Files/Tesseract-OCR/tesseract.exe or set the TESSERACT_PATH environment variable."
-        
-        raise HTTPException(status_code=500, detail=f"Error processing file: {error_message}")
+        remove_upload(FILE_PATH)
+        raise processing_error(e)
 
     # Clean up file
-    if os.path.exists(FILE_PATH):
-        os.remove(FILE_PATH)
+    remove_upload(FILE_PATH)
 
     return data
 
+def sse_event(event, data):
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/extract_from_doc/stream")
+def extract_from_doc_stream(
+    file: UploadFile = File(...),
+    file_format: str = Form(...),
+    ocr_strategy: Optional[str] = Form(None),
+    pages: Optional[str] = Form(None),
+    early_stop: bool = Form(False),
+    x_profile: Optional[str] = Header(None),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Same as /extract_from_doc, but streams Server-Sent Events while processing.
+
+    Emits ``progress`` events as pages are decoded and OCR'd and the text is
+    parsed and analyzed, a ``profile`` event with the profile id if the
+    request was profiled, then a single ``result`` or ``error`` event.
+    """
+    mode = profile_mode(x_profile, x_admin_token)
+    page_range = parse_page_range(pages)
+    FILE_PATH = save_upload(file, file_format, ocr_strategy)
+    try:
+        check_ocr_engine()
+    except Exception as e:
+        remove_upload(FILE_PATH)
+        raise processing_error(e)
+
+    def stream():
+        for event, data in extraction_events(FILE_PATH, file_format, ocr_strategy, mode,
+                                             label=f"/extract_from_doc/stream {file_format} {file.filename}",
+                                             page_range=page_range, early_stop=early_stop):
+            yield sse_event(event, data)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.get("/")
 def read_root():
     return {"message": "Medical Data Extraction API is running. Use POST /extract_from_doc to process documents."}
@@ -85,18 +273,72 @@ def health_check():
     """Health check endpoint"""
     tesseract_path = os.environ.get("TESSERACT_PATH", "C:/Program Files/Tesseract-OCR/tesseract.exe")
     tesseract_available = os.path.exists(tesseract_path)
+    page_cache = ocr_cache.get_cache()
     
     return {
         "status": "healthy",
+        "pid": os.getpid(),
         "tesseract_available": tesseract_available,
-        "tesseract_path": tesseract_path
+        "tesseract_path": tesseract_path,
+        "ocr_engine": ocr_engine.get_engine().name,
+        "analysis_cache": analysis_cache.stats(),
+        "ocr_cache": page_cache.stats() if page_cache else None
+    }
+
+@app.get("/admin/profiles")
+def list_profiles(x_admin_token: Optional[str] = Header(None)):
+    """Stored profiles, newest first, and the profiler settings"""
+    check_admin_token(x_admin_token)
+    profiler = profiling.get_profiler()
+    return {
+        "sample_rate": profiler.sample_rate,
+        "default_mode": profiler.default_mode,
+        "skipped_while_busy": profiler.skipped,
+        "profiles": profiler.store.list()
     }
 
+@app.post("/admin/profiles/settings")
+def update_profile_settings(
+    sample_rate: Optional[float] = Form(None),
+    default_mode: Optional[str] = Form(None),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """Change the sampled fraction of requests or the default mode without a restart"""
+    check_admin_token(x_admin_token)
+    profiler = profiling.get_profiler()
+    if sample_rate is not None:
+        if not 0.0 <= sample_rate <= 1.0:
+            raise HTTPException(status_code=400, detail="sample_rate must be between 0 and 1")
+        profiler.sample_rate = sample_rate
+    if default_mode is not None:
+        if default_mode not in profiling.MODES:
+            raise HTTPException(status_code=400, detail=f"Invalid profile mode: {default_mode}. Must be one of {', '.join(profiling.MODES)}")
+        profiler.default_mode = default_mode
+    return {"sample_rate": profiler.sample_rate, "default_mode": profiler.default_mode}
+
+@app.get("/admin/profiles/{profile_id}")
+def get_profile(profile_id: str, x_admin_token: Optional[str] = Header(None)):
+    """A profile's summary: top stages, functions and allocation sites"""
+    check_admin_token(x_admin_token)
+    summary = profiling.get_profiler().store.summary(profile_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail=f"Profile not found: {profile_id}")
+    return summary
+
+@app.get("/admin/profiles/{profile_id}/{artifact}")
+def download_profile_artifact(profile_id: str, artifact: str, x_admin_token: Optional[str] = Header(None)):
+    """Download a profile artifact (cpu.prof, cpu.folded, allocations.snapshot or summary.json)"""
+    check_admin_token(x_admin_token)
+    path = profiling.get_profiler().store.artifact_path(profile_id, artifact)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Artifact not found: {profile_id}/{artifact}")
+    return FileResponse(path, filename=f"{profile_id}-{artifact}")
+
 if __name__ == "__main__":
     print("Starting Medical Data Extraction Backend...")
     print("API will be available at http://127.0.0.1:8000")
     print("Supported file formats: PDF, JPG, PNG, and other image formats")
-    print("Supported document types: prescription, patient_details")
+    print("Supported document types: prescription, patient_details, auto (detected)")
     
     # Check Tesseract availability
     tesseract_path = os.environ.get("TESSERACT_PATH", "C:/Program Files/Tesseract-OCR/tesseract.exe")
@@ -0,0 +1,283 @@
+"""
+Optional model-backed analysis for SmolDoclingAnalyzer.
+
+A local causal language model (any transformers ``AutoModelForCausalLM``
+checkpoint) writes the diagnosis, routine and diet sections from the OCR text
+and the medications and conditions found in the knowledge base. Warnings and
+interactions always come from the knowledge base.
+
+The model is loaded lazily, once per process, on the batching thread. Requests
+from concurrent extractions are collected for up to ``max_wait_ms`` (or until
+``max_batch_size`` are waiting) and run through the model as one padded batch,
+which raises CPU throughput considerably over one generate() call per request.
+Weights can be kept in float32, cast to bfloat16, or dynamically quantized to
+int8. Callers wait at most a timeout for their result and fall back to the
+rule-based analysis otherwise.
+
+Configured by RXTRACT_ANALYZER_MODEL (checkpoint directory, required),
+RXTRACT_ANALYZER_PRECISION (int8, bfloat16 or float32; default int8),
+RXTRACT_ANALYZER_MAX_BATCH (8), RXTRACT_ANALYZER_BATCH_WAIT_MS (20),
+RXTRACT_ANALYZER_MAX_NEW_TOKENS (128) and RXTRACT_ANALYZER_THREADS.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+PRECISIONS = ["int8", "bfloat16", "float32"]
+# Sections the model writes, in prompt order
+SECTIONS = ["diagnosis", "routine", "diet"]
+# Longest prompt, in tokens; build_prompt() shortens the OCR text to fit
+MAX_PROMPT_TOKENS = 512
+
+
+class BatchingEngine:
+    """
+    Runs ``batch_fn(prompts) -> outputs`` on a background thread, batching
+    prompts submitted from any number of threads.
+
+    Args:
+        batch_fn: callable taking a list of prompts, returning one output each
+        max_batch_size (int): most prompts per batch_fn call
+        max_wait_ms (float): how long the first prompt of a batch waits for company
+    """
+
+    def __init__(self, batch_fn, max_batch_size=8, max_wait_ms=20.0):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.batches = 0
+        self.requests = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, prompt):
+        """Queue a prompt and return a Future for its output"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="analyzer-batching", daemon=True)
+                self._thread.start()
+        future = Future()
+        self._queue.put((prompt, future))
+        return future
+
+    def generate(self, prompt, timeout=None):
+        """
+        Return the output for one prompt.
+
+        Raises:
+            concurrent.futures.TimeoutError: if it is not ready within ``timeout`` seconds
+        """
+        future = self.submit(prompt)
+        try:
+            return future.result(timeout=timeout)
+        except Exception:
+            # Not started yet: drop it rather than spend model time on it
+            future.cancel()
+            raise
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return [(prompt, future) for prompt, future in batch if future.set_running_or_notify_cancel()]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            self.batches += 1
+            self.requests += len(batch)
+            try:
+                outputs = self.batch_fn([prompt for prompt, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), output in zip(batch, outputs):
+                future.set_result(output)
+
+
+class TransformersBackend:
+    """
+    Batched greedy generation with a local transformers checkpoint on CPU.
+
+    The checkpoint is loaded on the first call. ``precision`` is one of
+    PRECISIONS: ``int8`` applies dynamic quantization to the Linear layers.
+    """
+
+    def __init__(self, model_path, precision="int8", max_new_tokens=128, num_threads=None):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision: {precision}. Must be one of {', '.join(PRECISIONS)}")
+        self.model_path = model_path
+        self.precision = precision
+        self.max_new_tokens = max_new_tokens
+        self.num_threads = num_threads
+        self.model = None
+        self.tokenizer = None
+        self._tokenizer_lock = threading.Lock()
+        # Fast (Rust) tokenizers are not safe to use from several threads at
+        # once; every tokenizer call, on request threads or the batching
+        # thread, holds this lock
+        self._tokenize_lock = threading.Lock()
+
+    def get_tokenizer(self):
+        """The checkpoint's tokenizer, loaded on first use (without the model)"""
+        with self._tokenizer_lock:
+            if self.tokenizer is None:
+                from transformers import AutoTokenizer
+
+                tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+                # Decoder-only models must be padded on the left to generate in a batch
+                tokenizer.padding_side = "left"
+                # build_prompt() already fits prompts; if one is still too
+                # long, keep its end with the "Diagnosis:" cue
+                tokenizer.truncation_side = "left"
+                if tokenizer.pad_token is None:
+                    tokenizer.pad_token = tokenizer.eos_token
+                self.tokenizer = tokenizer
+        return self.tokenizer
+
+    def load(self):
+        import torch
+        from transformers import AutoModelForCausalLM
+
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+        start = time.perf_counter()
+        tokenizer = self.get_tokenizer()
+        dtype = torch.bfloat16 if self.precision == "bfloat16" else torch.float32
+        model = AutoModelForCausalLM.from_pretrained(self.model_path, torch_dtype=dtype)
+        model.eval()
+        if self.precision == "int8":
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.tokenizer, self.model = tokenizer, model
+        print(f"Loaded analysis model {self.model_path} ({self.precision}) in {time.perf_counter() - start:.1f}s")
+
+    def __call__(self, prompts):
+        import torch
+
+        if self.model is None:
+            self.load()
+        with self._tokenize_lock:
+            inputs = self.tokenizer(prompts, return_tensors="pt", padding=True, truncation=True,
+                                    max_length=MAX_PROMPT_TOKENS)
+        with torch.inference_mode():
+            outputs = self.model.generate(
+                **inputs, max_new_tokens=self.max_new_tokens, do_sample=False,
+                pad_token_id=self.tokenizer.pad_token_id
+            )
+        new_tokens = outputs[:, inputs["input_ids"].shape[1]:]
+        with self._tokenize_lock:
+            return self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+
+    def build_prompt(self, ocr_text, medications, conditions):
+        """build_prompt() fitted with this checkpoint's tokenizer, safe to call from any thread"""
+        tokenizer = self.get_tokenizer()
+        with self._tokenize_lock:
+            return build_prompt(ocr_text, medications, conditions, tokenizer=tokenizer)
+
+
+def build_prompt(ocr_text, medications, conditions, tokenizer=None, max_tokens=MAX_PROMPT_TOKENS):
+    """
+    Prompt asking for one line per section in SECTIONS. With a ``tokenizer``
+    the OCR text is cut to what fits in ``max_tokens`` tokens, so the
+    instructions and the closing "Diagnosis:" cue are always kept.
+    """
+    def prompt(document):
+        return (
+            "You are a clinical assistant. Read the medical document and answer in exactly three lines:\n"
+            "Diagnosis: <likely diagnosis>\nRoutine: <recommended routine>\nDiet: <dietary advice>\n\n"
+            f"Known medications: {', '.join(medications) or 'none'}\n"
+            f"Known conditions: {', '.join(conditions) or 'none'}\n"
+            f"Document:\n{document}\n\n"
+            "Diagnosis:"
+        )
+
+    document = ocr_text.strip()
+    if tokenizer is None:
+        return prompt(document)
+    budget = max(max_tokens - len(tokenizer.encode(prompt(""))), 0)
+    tokens = document_tokens = tokenizer.encode(document, add_special_tokens=False)
+    cut = budget
+    while len(tokens) > budget:
+        # Decoding and re-encoding can merge tokens differently at the cut
+        document = tokenizer.decode(document_tokens[:cut]).strip()
+        tokens = tokenizer.encode(document, add_special_tokens=False)
+        cut -= 1
+    return prompt(document)
+
+
+def parse_sections(output):
+    """
+    Split model output into SECTIONS. The prompt ends with "Diagnosis:", so
+    text before the first other heading is the diagnosis.
+    """
+    sections = {}
+    current = "diagnosis"
+    for line in ("Diagnosis:" + output).splitlines():
+        heading, _, rest = line.partition(":")
+        if heading.strip().lower() in SECTIONS:
+            current = heading.strip().lower()
+            line = rest
+        text = line.strip()
+        if text and current not in sections:
+            sections[current] = text
+        elif text:
+            sections[current] += " " + text
+    return sections
+
+
+def engine_from_env():
+    model_path = os.environ.get("RXTRACT_ANALYZER_MODEL")
+    if not model_path:
+        raise ValueError("RXTRACT_ANALYZER_MODEL must point to a local model directory in model analysis mode")
+    threads = os.environ.get("RXTRACT_ANALYZER_THREADS")
+    backend = TransformersBackend(
+        model_path,
+        precision=os.environ.get("RXTRACT_ANALYZER_PRECISION", "int8"),
+        max_new_tokens=int(os.environ.get("RXTRACT_ANALYZER_MAX_NEW_TOKENS", "128")),
+        num_threads=int(threads) if threads else None,
+    )
+    return BatchingEngine(
+        backend,
+        max_batch_size=int(os.environ.get("RXTRACT_ANALYZER_MAX_BATCH", "8")),
+        max_wait_ms=float(os.environ.get("RXTRACT_ANALYZER_BATCH_WAIT_MS", "20")),
+    )
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Return the process-wide batching engine, creating it on first use"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = engine_from_env()
+    return _engine
+
+
+def analyze(ocr_text, medications, conditions, timeout=None):
+    """
+    Return the model's sections for a document.
+
+    Raises:
+        concurrent.futures.TimeoutError: if the model does not answer within ``timeout`` seconds
+    """
+    engine = get_engine()
+    # Backends with a tokenizer fit the prompt to it
+    prompt = getattr(engine.batch_fn, "build_prompt", build_prompt)(ocr_text, medications, conditions)
+    output = engine.generate(prompt, timeout=timeout)
+    return parse_sections(output)
@@ -0,0 +1,182 @@
+"""
+Page-level OCR result cache.
+
+OCR output depends only on the preprocessed page and the OCR call (engine,
+language, Tesseract config and whether text or word data was asked for), not
+on the parsers. CachedEngine wraps an OCR engine and stores every result on
+disk under a hash of the page's pixels plus that call signature, so re-parsing
+a document after a parser change runs no OCR at all. Re-submitting it as
+another document type does too when per-type Tesseract vocabularies are
+disabled (RXTRACT_TESSERACT_VOCAB=0, see tesseract_vocab).
+
+Entries are JSON files sharded by key prefix. When the cache grows past its
+size limit the least recently used files are deleted. The entries hold the
+documents' OCR text, patient data included, unencrypted, so the cache is off
+unless RXTRACT_OCR_CACHE=1. Also configured by RXTRACT_OCR_CACHE_DIR (default
+backend/cache/ocr_pages) and RXTRACT_OCR_CACHE_MAX_MB (default 1024).
+"""
+import hashlib
+import json
+import os
+import threading
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "ocr_pages"
+)
+
+
+def page_digest(img):
+    """Hash of a page's pixels, shape and dtype"""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{img.shape}:{img.dtype}".encode("ascii"))
+    digest.update(memoryview(img if img.flags["C_CONTIGUOUS"] else img.copy()).cast("B"))
+    return digest.hexdigest()
+
+
+class OCRCache:
+    """
+    Directory of cached OCR results.
+
+    Args:
+        cache_dir (str): directory holding the entries
+        max_bytes (int): total size above which least recently used entries are evicted
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def key(self, img, signature):
+        return hashlib.blake2b(f"{page_digest(img)}|{signature}".encode("utf-8"), digest_size=20).hexdigest()
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)["value"]
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            # Mark as recently used for eviction
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, signature, value):
+        path = self._path(key)
+        encoded = json.dumps({"signature": signature, "value": value})
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(encoded)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(encoded)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, path
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        """Delete least recently used entries until the cache is at 90% of its limit"""
+        target = self.max_bytes * 0.9
+        entries = sorted(self._entries())
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+                size -= entry_size
+            except OSError:
+                pass
+        self._size = size
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "bytes": self._size,
+            }
+
+
+class CachedEngine:
+    """OCR engine wrapper that serves repeated calls from an OCRCache"""
+
+    def __init__(self, engine, cache):
+        self.engine = engine
+        self.cache = cache
+
+    def __getattr__(self, name):
+        # name, probe(), is_available() and anything else come from the engine
+        return getattr(self.engine, name)
+
+    def _cached(self, method, img, lang, config):
+        signature = f"{self.engine.name}:{method}:{lang}:{config}"
+        key = self.cache.key(img, signature)
+        value = self.cache.get(key)
+        if value is None:
+            value = getattr(self.engine, method)(img, lang=lang, config=config)
+            try:
+                self.cache.put(key, signature, value)
+            except OSError as e:
+                print(f"Could not write OCR cache entry: {e}")
+        return value
+
+    def image_to_string(self, img, lang="eng", config=""):
+        return self._cached("image_to_string", img, lang, config)
+
+    def image_to_data(self, img, lang="eng", config=""):
+        return self._cached("image_to_data", img, lang, config)
+
+
+_cache = None
+
+
+def get_cache():
+    """Return the process-wide OCR cache, or None unless RXTRACT_OCR_CACHE=1"""
+    global _cache
+    if os.environ.get("RXTRACT_OCR_CACHE", "0") != "1":
+        return None
+    if _cache is None:
+        _cache = OCRCache(
+            cache_dir=os.environ.get("RXTRACT_OCR_CACHE_DIR", DEFAULT_CACHE_DIR),
+            max_bytes=int(float(os.environ.get("RXTRACT_OCR_CACHE_MAX_MB", "1024")) * 1024 * 1024),
+        )
+    return _cache
+
+
+def cached(engine):
+    """Wrap ``engine`` with the process-wide cache, if enabled"""
+    cache = get_cache()
+    return engine if cache is None else CachedEngine(engine, cache)
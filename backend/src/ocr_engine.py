@@ -0,0 +1,208 @@
+"""
+OCR engines used by the extractor.
+
+The real engine runs the Tesseract binary. The stub engine returns canned text
+after a configurable delay so the web layer can be exercised without Tesseract.
+"""
+import os
+import shlex
+import subprocess
+import time
+
+import pytesseract
+
+import utils
+
+DEFAULT_TESSERACT_PATH = r"C:/Program Files/Tesseract-OCR/tesseract.exe"
+
+# Canned text returned by the stub engine. It carries the anchors used by both
+# parsers so either document type produces populated fields.
+STUB_OCR_TEXT = """Dr John Smith, M.D
+2 Non-Important Street,
+New York, Phone (000)-111-2222
+Name: Marta Sharapova Date: 5/11/2022
+Address: 9 tennis court, new Russia, DC
+Prednisone 20 mg
+Lialda 2.4 gram
+Directions:
+Prednisone, Taper 5 mg every 3 days,
+Finish in 2.5 weeks
+Lialda - take 2 pill everyday for 1 month
+Refill: 3 times
+Medical Problems: Hypertension
+Do you have health insurance? Yes
+Have you had a flu vaccination? Yes
+"""
+
+
+TSV_COLUMNS = ["level", "page_num", "block_num", "par_num", "line_num", "word_num",
+               "left", "top", "width", "height", "conf", "text"]
+
+
+def parse_tsv(tsv):
+    """
+    Parse Tesseract TSV output into a dict of column lists.
+
+    Mirrors pytesseract's ``Output.DICT`` layout: integer columns, a float
+    ``conf`` (-1 for non-word rows) and a ``text`` column.
+    """
+    data = {column: [] for column in TSV_COLUMNS}
+    lines = tsv.splitlines()
+    for line in lines[1:]:
+        cells = line.split("\t")
+        if len(cells) < len(TSV_COLUMNS) - 1:
+            continue
+        if len(cells) == len(TSV_COLUMNS) - 1:
+            cells.append("")
+        for column, cell in zip(TSV_COLUMNS[:10], cells[:10]):
+            data[column].append(int(cell))
+        data["conf"].append(float(cells[10]))
+        data["text"].append(cells[11])
+    return data
+
+
+class TesseractEngine:
+    """
+    OCR through the Tesseract binary.
+
+    Grayscale uint8 pages are piped to ``tesseract stdin stdout`` as raw PGM
+    bytes (zero-copy for pages from utils.preprocess_image). Anything else goes
+    through pytesseract, which re-encodes the image to a temporary file.
+    """
+    name = "tesseract"
+
+    def __init__(self, tesseract_path=None, raw_input=True):
+        self.tesseract_path = tesseract_path or os.environ.get("TESSERACT_PATH", DEFAULT_TESSERACT_PATH)
+        self.raw_input = raw_input
+        pytesseract.pytesseract.tesseract_cmd = self.tesseract_path
+
+    def is_available(self):
+        """Check if the Tesseract binary exists"""
+        return os.path.exists(self.tesseract_path)
+
+    def probe(self):
+        """Run a tiny OCR call to check that Tesseract actually works"""
+        import numpy as np
+        try:
+            pytesseract.image_to_string(np.zeros((100, 100), dtype=np.uint8))
+            print(f"Tesseract OCR 5.5.0 is available at: {self.tesseract_path}")
+            return True
+        except Exception as e:
+            print(f"Warning: Tesseract OCR is not available: {e}")
+            print("Using fallback mode without OCR. Text extraction will be limited.")
+            return False
+
+    def _run_raw(self, img, lang, config, output_config=None):
+        """Run Tesseract on a PGM buffer through stdin and return its stdout"""
+        # Split the way pytesseract does, see tesseract_vocab.config_arg()
+        cmd = [self.tesseract_path, "stdin", "stdout", "-l", lang] + shlex.split(config, posix=os.name != "nt")
+        if output_config:
+            cmd.append(output_config)
+        try:
+            process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except OSError:
+            raise pytesseract.TesseractNotFoundError()
+        stdout, stderr = process.communicate(utils.pgm_buffer(img))
+        if process.returncode != 0:
+            raise pytesseract.TesseractError(process.returncode, stderr.decode("utf-8", "replace").strip())
+        return stdout.decode("utf-8", "replace")
+
+    def _accepts_raw(self, img):
+        return self.raw_input and getattr(img, "ndim", 0) == 2 and str(img.dtype) == "uint8"
+
+    def image_to_string(self, img, lang="eng", config=""):
+        if self._accepts_raw(img):
+            return self._run_raw(img, lang, config)
+        return pytesseract.image_to_string(img, lang=lang, config=config)
+
+    def image_to_data(self, img, lang="eng", config=""):
+        """Word-level boxes and confidences, see parse_tsv()"""
+        if self._accepts_raw(img):
+            return parse_tsv(self._run_raw(img, lang, config, output_config="tsv"))
+        return parse_tsv(pytesseract.image_to_data(img, lang=lang, config=config))
+
+
+class StubEngine:
+    """
+    Stand-in OCR engine for load and integration testing.
+
+    Every call sleeps for ``latency_ms`` plus ``ms_per_megapixel`` times the
+    image size, then returns ``text``. ``image_to_data`` lays the words of
+    ``text`` out on an even grid over the image, each with confidence ``conf``.
+    """
+    name = "stub"
+
+    def __init__(self, latency_ms=0.0, ms_per_megapixel=0.0, text=None, conf=95.0):
+        self.latency_ms = latency_ms
+        self.ms_per_megapixel = ms_per_megapixel
+        self.text = STUB_OCR_TEXT if text is None else text
+        self.conf = conf
+
+    def is_available(self):
+        return True
+
+    def probe(self):
+        print(f"Using stub OCR engine ({self.latency_ms} ms + {self.ms_per_megapixel} ms/MP per call)")
+        return True
+
+    def _delay(self, img):
+        megapixels = img.shape[0] * img.shape[1] / 1e6
+        delay_ms = self.latency_ms + self.ms_per_megapixel * megapixels
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000.0)
+
+    def image_to_string(self, img, lang="eng", config=""):
+        self._delay(img)
+        return self.text
+
+    def image_to_data(self, img, lang="eng", config=""):
+        self._delay(img)
+        data = {column: [] for column in TSV_COLUMNS}
+        lines = [line.split() for line in self.text.splitlines()]
+        height, width = img.shape[:2]
+        line_height = max(height // max(len(lines), 1), 1)
+        for line_num, words in enumerate(lines, start=1):
+            word_width = max(width // max(len(words), 1), 1)
+            for word_num, word in enumerate(words, start=1):
+                row = [5, 1, 1, 1, line_num, word_num, (word_num - 1) * word_width,
+                       (line_num - 1) * line_height, word_width, line_height, self.conf, word]
+                for column, value in zip(TSV_COLUMNS, row):
+                    data[column].append(value)
+        return data
+
+
+def engine_from_env():
+    """
+    Build the OCR engine selected by the environment.
+
+    RXTRACT_OCR_ENGINE picks ``tesseract`` (default) or ``stub``. Setting
+    RXTRACT_TESSERACT_RAW_INPUT=0 sends every image through pytesseract's
+    temp files instead of stdin. The stub reads RXTRACT_STUB_OCR_LATENCY_MS,
+    RXTRACT_STUB_OCR_MS_PER_MP and RXTRACT_STUB_OCR_TEXT_FILE.
+    """
+    engine_name = os.environ.get("RXTRACT_OCR_ENGINE", "tesseract").lower()
+    if engine_name == "stub":
+        text = None
+        text_file = os.environ.get("RXTRACT_STUB_OCR_TEXT_FILE")
+        if text_file:
+            with open(text_file, "r", encoding="utf-8") as f:
+                text = f.read()
+        return StubEngine(
+            latency_ms=float(os.environ.get("RXTRACT_STUB_OCR_LATENCY_MS", "0")),
+            ms_per_megapixel=float(os.environ.get("RXTRACT_STUB_OCR_MS_PER_MP", "0")),
+            text=text
+        )
+    if engine_name != "tesseract":
+        raise ValueError(f"Unknown OCR engine: {engine_name}. Must be 'tesseract' or 'stub'")
+    return TesseractEngine(raw_input=os.environ.get("RXTRACT_TESSERACT_RAW_INPUT", "1") != "0")
+
+
+_engine = None
+
+
+def get_engine():
+    """Return the process-wide OCR engine, creating it on first use"""
+    global _engine
+    if _engine is None:
+        _engine = engine_from_env()
+    return _engine
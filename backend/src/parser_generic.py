@@ -1,11 +1,48 @@
 import abc
+import re
 
 
 class MedicalDocParser(metaclass=abc.ABCMeta):
 
-    def __init__(self, text):
+    def __init__(self, text, words=None):
         self.text = text
+        # Optional word_table.WordTable whose text is ``text``
+        self.words = words
+        # Character span of each field's value in the text, set by search_field()
+        self.spans = {}
+
+    @classmethod
+    def from_words(cls, words):
+        """Parser for the text of a word_table.WordTable"""
+        return cls(words.text, words=words)
 
     @abc.abstractmethod
     def parse(self):
-        pass
\ No newline at end of file
+        pass
+
+    def search_field(self, field_name, pattern, flags=0):
+        """
+        First match of ``pattern``'s group in the text, stripped, or None.
+        Records the value's character span in ``self.spans``.
+        """
+        match = re.search(pattern, self.text, flags=flags)
+        if match is None:
+            return None
+        value = match.group(1)
+        start = match.start(1) + len(value) - len(value.lstrip())
+        self.spans[field_name] = (start, start + len(value.strip()))
+        return value.strip()
+
+    def field_confidence(self):
+        """
+        OCR confidence, page and box of each field found by parse(), see
+        WordTable.describe(). Empty without a word table.
+        """
+        if self.words is None:
+            return {}
+        details = {}
+        for field_name, (start, end) in self.spans.items():
+            detail = self.words.span_details(start, end)
+            if detail is not None:
+                details[field_name] = detail
+        return details
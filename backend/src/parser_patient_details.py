@@ -2,8 +2,8 @@ import re
 from parser_generic import MedicalDocParser
 
 class PatientDetailsParser(MedicalDocParser):
-    def __init__(self, text):
-        MedicalDocParser.__init__(self, text)
+    def __init__(self, text, words=None):
+        MedicalDocParser.__init__(self, text, words)
 
     def parse(self):
         return{
@@ -68,9 +68,8 @@ class PatientDetailsParser(MedicalDocParser):
                 flags = pattern_object.get("flags", 0)
                 
                 for pattern in patterns:
-                    matches = re.findall(pattern, self.text, flags=flags)
-                    if matches and len(matches) > 0:
-                        result = matches[0].strip()
+                    result = self.search_field(field_name, pattern, flags)
+                    if result is not None:
                         
                         # Normalize values
                         if field_name == "vaccination_status" or field_name == "has_insurance":
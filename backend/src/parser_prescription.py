@@ -3,8 +3,8 @@ from parser_generic import MedicalDocParser
 
 
 class PrescriptionParser(MedicalDocParser):
-    def __init__(self, text):
-        MedicalDocParser.__init__(self, text)
+    def __init__(self, text, words=None):
+        MedicalDocParser.__init__(self, text, words)
 
     def parse(self):
         return{
@@ -20,7 +20,8 @@ class PrescriptionParser(MedicalDocParser):
             # More flexible patterns to account for OCR variations
             "patient_name": {
                 "pattern": [
-                    r"[Nn]ame:?\s*([A-Za-z\s]+)(?:[^A-Za-z\n]|$)",
+                    # The date usually follows the name on the same line
+                    r"[Nn]ame:?\s*((?:(?!\b[Dd]ate\b)[A-Za-z\s])+)(?:[^A-Za-z\n]|$)",
                     r"[Nn]ame\s*[:;]\s*([A-Za-z\s]+)",
                     r"[Pp]atient\s*[:;]?\s*([A-Za-z\s]+)",
                 ]
@@ -37,7 +38,10 @@ class PrescriptionParser(MedicalDocParser):
                     r"(?:[Aa]ddress|[Rr]esidence)[^\n]*\n+([^D][^\n]*(?:\n[^D][^\n]*)*?)(?:[Dd]irections|[Ii]nstructions)",
                     r"(?:[Mm]edication|[Mm]edicines|[Pp]rescribed)[^\n]*\n+([^\n]*(?:\n[^\n]*)*?)(?:[Dd]irections|[Ii]nstructions)",
                 ],
-                "flags": re.DOTALL
+                "flags": re.DOTALL,
+                # Both patterns end at a directions heading and backtrack in
+                # quadratic time looking for one that is not there
+                "requires": r"[Dd]irections|[Ii]nstructions"
             },
             "directions": {
                 "pattern": [
@@ -62,11 +66,13 @@ class PrescriptionParser(MedicalDocParser):
                 # Try multiple patterns for each field
                 patterns = pattern_object["pattern"] if isinstance(pattern_object["pattern"], list) else [pattern_object["pattern"]]
                 flags = pattern_object.get("flags", 0)
+                if "requires" in pattern_object and re.search(pattern_object["requires"], self.text) is None:
+                    return None
                 
                 for pattern in patterns:
-                    matches = re.findall(pattern, self.text, flags=flags)
-                    if matches and len(matches) > 0:
-                        return matches[0].strip()
+                    result = self.search_field(field_name, pattern, flags)
+                    if result is not None:
+                        return result
             except Exception as e:
                 print(f"Error extracting {field_name}: {str(e)}")
         return None
@@ -0,0 +1,262 @@
+"""
+Perceptual-hash index of OCR'd pages for near-duplicate reuse.
+
+Re-scans and re-faxes of the same document differ byte-for-byte but look the
+same after preprocessing. Each preprocessed page is reduced to a DCT-based
+perceptual hash; pages whose hashes are within a Hamming-distance threshold of
+a stored page reuse that page's OCR text instead of running Tesseract again.
+
+The hash alone cannot tell a re-scan from another copy of the same template
+with a different dose or refill count: a few changed characters barely move
+the low frequencies, less than scan noise does. Every stored page therefore
+keeps a small ink thumbnail (cells a quarter of a text line high), and a
+match is only reused when no cell of the aligned thumbnails differs by more
+than MAX_CELL_DIFFERENCE.
+
+The index lives in memory as a BK-tree and is persisted as an append-only
+JSONL file so it survives restarts. It is disabled unless
+RXTRACT_PHASH_THRESHOLD is set.
+"""
+import base64
+import json
+import os
+import threading
+
+import cv2
+import numpy as np
+
+DEFAULT_INDEX_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "phash_index.jsonl"
+)
+
+# Pages whose aspect ratios differ by more than this are never treated as duplicates
+MAX_ASPECT_RATIO_DIFFERENCE = 0.02
+
+# Thumbnail cells per text line height, largest ink difference (0-255) of a
+# cell between reused pages, and misalignment (cells) tolerated between them
+CELLS_PER_LINE = 4
+MAX_CELL_DIFFERENCE = 140
+MAX_CELL_SHIFT = 2
+
+
+def page_hash(img, hash_size=16):
+    """
+    Compute a perceptual hash of a (preprocessed) page.
+
+    The page is shrunk to ``4 * hash_size`` pixels square, transformed with a
+    DCT, and the lowest ``hash_size`` x ``hash_size`` frequencies are compared
+    to their median. Returns the ``hash_size ** 2`` bits packed into an int.
+    """
+    if len(img.shape) == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    side = hash_size * 4
+    small = cv2.resize(img, (side, side), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low_freq = cv2.dct(small)[:hash_size, :hash_size].flatten()
+    # Leave the DC term out of the median so overall brightness does not dominate
+    bits = low_freq > np.median(low_freq[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def text_height(img):
+    """Typical height of the dark connected components (glyphs) of a binarized page, or None if blank"""
+    count, _, stats, _ = cv2.connectedComponentsWithStats((img < 128).astype(np.uint8))
+    if count < 2:
+        return None
+    # Area-weighted median, so specks do not outvote the glyphs
+    heights, areas = stats[1:, cv2.CC_STAT_HEIGHT], stats[1:, cv2.CC_STAT_AREA]
+    order = np.argsort(heights)
+    cumulative = np.cumsum(areas[order])
+    return int(heights[order][np.searchsorted(cumulative, cumulative[-1] / 2)])
+
+
+def ink_thumbnail(img, shape=None):
+    """
+    Ink density (0-255) of a preprocessed page on a grid of cells.
+
+    The grid has CELLS_PER_LINE cells per text line height, unless ``shape``
+    (rows, columns) is given, e.g. to match a stored thumbnail. A median
+    filter removes scan specks first.
+    """
+    if len(img.shape) == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    img = cv2.medianBlur(img, 5)
+    if shape is None:
+        cell = max((text_height(img) or 40) / CELLS_PER_LINE, 1.0)
+        shape = (max(int(round(img.shape[0] / cell)), 1), max(int(round(img.shape[1] / cell)), 1))
+    return cv2.resize(255 - img, (shape[1], shape[0]), interpolation=cv2.INTER_AREA)
+
+
+def cell_difference(a, b, max_shift=MAX_CELL_SHIFT):
+    """Largest cell difference between two thumbnails of the same shape once aligned (shifted up to ``max_shift``)"""
+    a, b = a.astype(np.int16), b.astype(np.int16)
+    height, width = a.shape
+    best = None
+    for dy in range(-max_shift, max_shift + 1):
+        for dx in range(-max_shift, max_shift + 1):
+            diff = np.abs(a[max(dy, 0):height + min(dy, 0), max(dx, 0):width + min(dx, 0)]
+                          - b[max(-dy, 0):height + min(-dy, 0), max(-dx, 0):width + min(-dx, 0)])
+            if diff.size and (best is None or diff.sum() < best[0]):
+                best = (diff.sum(), int(diff.max()))
+    return best[1] if best is not None else 0
+
+
+def encode_thumbnail(thumbnail):
+    return base64.b64encode(cv2.imencode(".png", thumbnail)[1].tobytes()).decode("ascii")
+
+
+def decode_thumbnail(data):
+    return cv2.imdecode(np.frombuffer(base64.b64decode(data), dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+
+
+class BKTree:
+    """Burkhard-Keller tree over ints using Hamming distance"""
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, key, value):
+        node = (key, value, {})
+        self.size += 1
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming_distance(key, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, key, max_distance):
+        """Return [(distance, value), ...] for all keys within ``max_distance``, nearest first"""
+        results = []
+        if self.root is None:
+            return results
+        stack = [self.root]
+        while stack:
+            node_key, value, children = stack.pop()
+            distance = hamming_distance(key, node_key)
+            if distance <= max_distance:
+                results.append((distance, value))
+            # Triangle inequality: only subtrees in this band can hold matches
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        results.sort(key=lambda item: item[0])
+        return results
+
+
+class PageHashIndex:
+    """
+    Perceptual hashes of pages mapped to their OCR text.
+
+    Args:
+        path (str): JSONL file backing the index, or None for memory only
+        threshold (int): maximum Hamming distance for two pages to match
+        hash_size (int): hash is ``hash_size ** 2`` bits
+        max_cell_difference (int): largest thumbnail cell difference for a
+            match to be reused (see ink_thumbnail())
+    """
+
+    def __init__(self, path=None, threshold=20, hash_size=16, max_cell_difference=MAX_CELL_DIFFERENCE):
+        self.path = path
+        self.threshold = threshold
+        self.hash_size = hash_size
+        self.max_cell_difference = max_cell_difference
+        self.tree = BKTree()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("hash_size") != self.hash_size:
+                    continue
+                self.tree.add(int(record["hash"], 16), record)
+
+    def __len__(self):
+        return self.tree.size
+
+    def hash(self, img):
+        return page_hash(img, self.hash_size)
+
+    def lookup(self, page_hash_value, img, ocr_config=""):
+        """
+        Find the nearest stored page within the threshold that ``img`` (the
+        preprocessed page) can reuse.
+
+        Only pages with the same OCR configuration and a similar aspect ratio
+        are considered, and only if their thumbnails show the same text.
+
+        Returns:
+            tuple: (distance, record) or None
+        """
+        aspect_ratio = img.shape[1] / float(img.shape[0])
+        with self._lock:
+            matches = self.tree.search(page_hash_value, self.threshold)
+        for distance, record in matches:
+            if record["ocr_config"] != ocr_config:
+                continue
+            if abs(record["aspect_ratio"] - aspect_ratio) > MAX_ASPECT_RATIO_DIFFERENCE * aspect_ratio:
+                continue
+            # Records written before thumbnails were stored cannot be verified
+            if "thumbnail" not in record:
+                continue
+            stored = decode_thumbnail(record["thumbnail"])
+            if cell_difference(stored, ink_thumbnail(img, stored.shape)) > self.max_cell_difference:
+                continue
+            return distance, record
+        return None
+
+    def add(self, page_hash_value, img, text, ocr_config=""):
+        record = {
+            "hash": format(page_hash_value, "x"),
+            "hash_size": self.hash_size,
+            "aspect_ratio": img.shape[1] / float(img.shape[0]),
+            "ocr_config": ocr_config,
+            "thumbnail": encode_thumbnail(ink_thumbnail(img)),
+            "text": text,
+        }
+        with self._lock:
+            self.tree.add(page_hash_value, record)
+            if self.path:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+        return record
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """
+    Return the process-wide index, or None when near-duplicate reuse is off.
+
+    Configured by RXTRACT_PHASH_THRESHOLD (bits, enables the index) and
+    RXTRACT_PHASH_INDEX (backing file, default backend/cache/phash_index.jsonl).
+    """
+    global _index
+    threshold = os.environ.get("RXTRACT_PHASH_THRESHOLD")
+    if threshold is None or threshold == "":
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = PageHashIndex(
+                path=os.environ.get("RXTRACT_PHASH_INDEX", DEFAULT_INDEX_PATH),
+                threshold=int(threshold)
+            )
+    return _index
@@ -0,0 +1,356 @@
+"""
+On-demand CPU and memory profiling of extraction requests.
+
+A request is profiled when it asks for it (``X-Profile`` header, honoured
+only with the admin token, see main.py) or is picked by the sample rate. The
+call then runs under one of two CPU profilers:
+
+- ``cprofile``: deterministic, every call timed (cProfile); exact but slows
+  Python-heavy code down noticeably,
+- ``sampling``: a background thread records the profiled thread's stack every
+  ``interval`` seconds; low overhead, statistical.
+
+plus tracemalloc allocation tracking. Progress events from extract() time the
+pipeline stages. Each profile is saved as a directory in a ProfileStore:
+``summary.json`` (top stages, functions and allocation sites), the raw CPU
+profile (``cpu.prof`` for pstats/snakeviz, or ``cpu.folded`` collapsed stacks
+for flame graphs) and ``allocations.snapshot`` (tracemalloc.Snapshot.load).
+Only the newest ``max_profiles`` are kept.
+
+Profiles run one at a time: tracemalloc is process-wide, so a request that
+arrives while another is being profiled runs unprofiled. For the same reason
+the allocation figures cover every thread of the process (tracemalloc does
+not record which thread allocated): requests served concurrently with the
+profiled one show up in them. The summary marks this with ``"scope":
+"process"``.
+
+Configured by RXTRACT_PROFILE_SAMPLE_RATE (fraction of requests, default 0),
+RXTRACT_PROFILE_MODE (default mode, ``sampling``), RXTRACT_PROFILE_DIR
+(default backend/cache/profiles), RXTRACT_PROFILE_MAX (50) and
+RXTRACT_PROFILE_TOP (20 entries per summary table).
+"""
+import collections
+import cProfile
+import json
+import os
+import pstats
+import random
+import shutil
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+
+MODES = ["cprofile", "sampling"]
+SUMMARY_FILE = "summary.json"
+DEFAULT_PROFILE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "profiles"
+)
+# Frames kept per allocation traceback
+ALLOCATION_FRAMES = 10
+
+
+class StackSampler:
+    """
+    Counts the stacks of one thread, sampled every ``interval`` seconds.
+    start() must be called on that thread; frames of its callers (the
+    profiler itself and the web framework) are left out of the stacks.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.base_depth = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        frame = sys._getframe(1)
+        while frame is not None:
+            self.base_depth += 1
+            frame = frame.f_back
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            stack = stack[::-1][self.base_depth:]
+            if stack:
+                self.stacks[tuple(stack)] += 1
+                self.samples += 1
+
+    def folded(self):
+        """Collapsed stacks ("a;b;c count" lines), the flame graph input format"""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, n):
+        """Functions by samples anywhere on the stack (inclusive) and on top (self)"""
+        inclusive, own = collections.Counter(), collections.Counter()
+        for stack, count in self.stacks.items():
+            for function in set(stack):
+                inclusive[function] += count
+            own[stack[-1]] += count
+        seconds = self.interval
+        return [
+            {"function": function, "cumulative_seconds": round(count * seconds, 4),
+             "self_seconds": round(own[function] * seconds, 4), "samples": count}
+            for function, count in inclusive.most_common(n)
+        ]
+
+
+def cprofile_top_functions(profile, n):
+    """Functions of a cProfile.Profile by cumulative time"""
+    stats = pstats.Stats(profile).stats
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:n]
+    return [
+        {"function": f"{os.path.basename(filename)}:{line}:{name}", "cumulative_seconds": round(cumulative, 4),
+         "self_seconds": round(total, 4), "calls": calls}
+        for (filename, line, name), (_, calls, total, cumulative, _) in rows
+    ]
+
+
+class StageTimer:
+    """
+    Progress callback recording when each extract() stage finished. Per-page
+    ``ocr`` events are summed into one ``ocr`` stage.
+    """
+
+    def __init__(self, forward=None):
+        self.forward = forward
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.stages = collections.OrderedDict()
+
+    def __call__(self, event):
+        now = time.perf_counter()
+        stage = event.get("stage", "unknown")
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self.last
+        self.last = now
+        if self.forward is not None:
+            self.forward(event)
+
+    def top(self, n, total):
+        stages = dict(self.stages)
+        stages["(after last stage)"] = time.perf_counter() - self.last
+        return [
+            {"stage": stage, "seconds": round(seconds, 4), "share": round(seconds / total, 3) if total else 0.0}
+            for stage, seconds in sorted(stages.items(), key=lambda item: item[1], reverse=True)[:n]
+        ]
+
+
+class ProfileStore:
+    """
+    Directory of saved profiles, one subdirectory each, keeping the newest
+    ``max_profiles``.
+    """
+
+    def __init__(self, directory=DEFAULT_PROFILE_DIR, max_profiles=50):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+
+    def create(self):
+        """Return (id, directory) for a new profile"""
+        now = time.time()
+        # Sorts by creation time
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(now))}.{int(now * 1e6) % 1000000:06d}" \
+                     f"-{uuid.uuid4().hex[:6]}"
+        path = os.path.join(self.directory, profile_id)
+        os.makedirs(path)
+        return profile_id, path
+
+    def commit(self, profile_id, summary):
+        """Write the profile's summary and evict the oldest profiles"""
+        path = os.path.join(self.directory, profile_id)
+        with open(os.path.join(path, SUMMARY_FILE), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        with self._lock:
+            ids = self.ids()
+            for old_id in ids[:max(len(ids) - self.max_profiles, 0)]:
+                shutil.rmtree(os.path.join(self.directory, old_id), ignore_errors=True)
+
+    def ids(self):
+        """Committed profile ids, oldest first"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name for name in names if os.path.exists(os.path.join(self.directory, name, SUMMARY_FILE)))
+
+    def summary(self, profile_id):
+        """Return a profile's summary, or None"""
+        if profile_id not in self.ids():
+            return None
+        with open(os.path.join(self.directory, profile_id, SUMMARY_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def list(self):
+        """Summaries of the stored profiles without their tables, newest first"""
+        summaries = []
+        for profile_id in reversed(self.ids()):
+            summary = self.summary(profile_id)
+            if summary is not None:
+                summaries.append({key: summary[key] for key in
+                                  ("id", "label", "mode", "started_at", "wall_seconds", "artifacts")})
+        return summaries
+
+    def artifact_path(self, profile_id, name):
+        """Path of one of a profile's artifacts, or None"""
+        summary = self.summary(profile_id)
+        if summary is None or name not in summary["artifacts"]:
+            return None
+        return os.path.join(self.directory, profile_id, name)
+
+
+class Profiler:
+    """
+    Decides which calls to profile and runs them under the profilers.
+
+    Args:
+        store (ProfileStore): where profiles are saved
+        sample_rate (float): fraction of unrequested calls profiled
+        default_mode (str): mode for sampled calls and requests that name none
+        top_n (int): entries per summary table
+        interval (float): seconds between stack samples in ``sampling`` mode
+    """
+
+    def __init__(self, store, sample_rate=0.0, default_mode="sampling", top_n=20, interval=0.005):
+        if default_mode not in MODES:
+            raise ValueError(f"Unknown profile mode: {default_mode}. Must be one of {', '.join(MODES)}")
+        self.store = store
+        self.sample_rate = sample_rate
+        self.default_mode = default_mode
+        self.top_n = top_n
+        self.interval = interval
+        self.skipped = 0
+        self._busy = threading.Lock()
+
+    def choose_mode(self, requested=None):
+        """Mode to profile a call in: ``requested`` (a mode, or "1" for the default), else sampled, else None"""
+        if requested:
+            if requested in MODES:
+                return requested
+            if requested in ("1", "true", "yes"):
+                return self.default_mode
+            raise ValueError(f"Unknown profile mode: {requested}. Must be one of {', '.join(MODES)}")
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return self.default_mode
+        return None
+
+    def run(self, fn, mode, label="", progress=None):
+        """
+        Call ``fn(progress)`` under profiler ``mode``.
+
+        Returns:
+            tuple: (fn's result, profile id or None if ``mode`` is None or
+            another profile is running)
+        """
+        if mode is None:
+            return fn(progress), None
+        if not self._busy.acquire(blocking=False):
+            self.skipped += 1
+            return fn(progress), None
+        try:
+            return self._run(fn, mode, label, progress)
+        finally:
+            self._busy.release()
+
+    def _run(self, fn, mode, label, progress):
+        profile_id, path = self.store.create()
+        stages = StageTimer(progress)
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start(ALLOCATION_FRAMES)
+        tracemalloc.reset_peak()
+        if mode == "cprofile":
+            cpu_profiler = cProfile.Profile()
+        else:
+            cpu_profiler = StackSampler(threading.get_ident(), self.interval)
+        started_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+        cpu_start, wall_start = time.thread_time(), time.perf_counter()
+        if mode == "cprofile":
+            cpu_profiler.enable()
+        else:
+            cpu_profiler.start()
+        try:
+            result = fn(stages)
+        finally:
+            if mode == "cprofile":
+                cpu_profiler.disable()
+            else:
+                cpu_profiler.stop()
+            wall_seconds = time.perf_counter() - wall_start
+            cpu_seconds = time.thread_time() - cpu_start
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            if not was_tracing:
+                tracemalloc.stop()
+            self._save(profile_id, path, mode, label, started_at, wall_seconds, cpu_seconds, stages,
+                       cpu_profiler, snapshot, peak_bytes)
+        return result, profile_id
+
+    def _save(self, profile_id, path, mode, label, started_at, wall_seconds, cpu_seconds, stages,
+              cpu_profiler, snapshot, peak_bytes):
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ])
+        snapshot.dump(os.path.join(path, "allocations.snapshot"))
+        if mode == "cprofile":
+            cpu_profiler.dump_stats(os.path.join(path, "cpu.prof"))
+            functions, cpu_artifact = cprofile_top_functions(cpu_profiler, self.top_n), "cpu.prof"
+        else:
+            with open(os.path.join(path, "cpu.folded"), "w", encoding="utf-8") as f:
+                f.write(cpu_profiler.folded())
+            functions, cpu_artifact = cpu_profiler.top_functions(self.top_n), "cpu.folded"
+        allocation_sites = [
+            {"site": f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+             "bytes": stat.size, "blocks": stat.count}
+            for stat in snapshot.statistics("lineno")[:self.top_n]
+        ]
+        self.store.commit(profile_id, {
+            "id": profile_id,
+            "label": label,
+            "mode": mode,
+            "started_at": started_at,
+            "wall_seconds": round(wall_seconds, 4),
+            "cpu_seconds": round(cpu_seconds, 4),
+            "stages": stages.top(self.top_n, wall_seconds),
+            "functions": functions,
+            "allocations": {"scope": "process", "peak_bytes": peak_bytes, "live_bytes": sum(trace.size for trace in snapshot.traces),
+                            "top": allocation_sites},
+            "artifacts": [cpu_artifact, "allocations.snapshot", SUMMARY_FILE],
+        })
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler():
+    """Return the process-wide profiler, configured from the environment on first use"""
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = Profiler(
+                ProfileStore(
+                    directory=os.environ.get("RXTRACT_PROFILE_DIR", DEFAULT_PROFILE_DIR),
+                    max_profiles=int(os.environ.get("RXTRACT_PROFILE_MAX", "50")),
+                ),
+                sample_rate=float(os.environ.get("RXTRACT_PROFILE_SAMPLE_RATE", "0")),
+                default_mode=os.environ.get("RXTRACT_PROFILE_MODE", "sampling"),
+                top_n=int(os.environ.get("RXTRACT_PROFILE_TOP", "20")),
+            )
+    return _profiler
@@ -0,0 +1,279 @@
+"""
+Pre-forking production server for main.app.
+
+``python main.py`` runs a single uvicorn process, and ``uvicorn --workers N``
+starts N cold processes that each import OpenCV, probe Tesseract and open the
+knowledge base. serve.py does that once in a parent process (warm()), moves
+the resulting objects out of the garbage collector's reach with gc.freeze()
+so the workers' collections do not dirty the pages they share, binds the
+listening socket and forks the workers. They share the warm state
+copy-on-write and accept connections from the one socket.
+
+The parent supervises the workers:
+
+- a worker that exits is replaced; with RXTRACT_WORKER_MAX_REQUESTS set,
+  workers exit on their own after that many requests,
+- SIGHUP replaces the workers one at a time, each replacement started before
+  the worker it replaces is stopped,
+- SIGTERM and SIGINT stop the workers and exit.
+
+Workers are stopped with SIGTERM, finishing in-flight requests within
+RXTRACT_GRACEFUL_TIMEOUT seconds (default 30) before they are killed.
+
+Configured by RXTRACT_WORKERS (default: CPU count), RXTRACT_HOST (default
+127.0.0.1) and RXTRACT_PORT (default 8000), or the matching options.
+Platforms without fork() run a single uvicorn process.
+
+Usage:
+    python backend/src/serve.py [--workers 4] [--host 0.0.0.0] [--port 8000]
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+import uvicorn
+
+# A worker that exits sooner than this after starting is restarted after a pause
+MIN_WORKER_LIFETIME = 1.0
+
+
+def warm():
+    """
+    Import the app and build the process-wide state the workers share: the
+    OCR engine (probed when extractor is imported), the knowledge base, the
+    Tesseract vocabulary files and the parser and analyzer regexes (compiled
+    into re's cache by parsing a sample). Returns the app.
+
+    In model analysis mode only the model's modules are imported here: torch
+    starts thread pools that do not survive fork(), so each worker loads the
+    model itself (load_model()).
+    """
+    start = time.perf_counter()
+    import main
+    import doc_classifier
+    import knowledge_base
+    import ocr_engine
+    import tesseract_vocab
+    from parser_patient_details import PatientDetailsParser
+    from parser_prescription import PrescriptionParser
+    from smoldocling_analyzer import SmolDoclingAnalyzer
+
+    knowledge_base.get_knowledge_base()
+    tesseract_vocab.ocr_config("")
+
+    text = ocr_engine.STUB_OCR_TEXT
+    PrescriptionParser(text).parse()
+    PatientDetailsParser(text).parse()
+    doc_classifier.classify_text(text)
+    # Rules only: the model's batching thread must not start before fork
+    analyzer = SmolDoclingAnalyzer(mode="rules")
+    analyzer.analyze_prescription(text)
+    analyzer.analyze_patient_details(text)
+
+    if model_mode():
+        import model_analyzer
+        model_analyzer.get_engine()
+
+    gc.collect()
+    gc.freeze()
+    print(f"Warmed up in {time.perf_counter() - start:.2f}s")
+    return main.app
+
+
+def model_mode():
+    return os.environ.get("RXTRACT_ANALYZER_MODE", "rules") == "model"
+
+
+def load_model():
+    """Load the analysis model in this process, in model analysis mode"""
+    if not model_mode():
+        return
+    import model_analyzer
+    backend = model_analyzer.get_engine().batch_fn
+    if getattr(backend, "model", True) is None:
+        backend.load()
+
+
+def bind(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Supervisor:
+    """
+    Forks and supervises ``workers`` uvicorn workers serving ``app`` on ``sock``.
+
+    Args:
+        app: the ASGI app, already warm
+        sock (socket.socket): bound, listening socket shared by the workers
+        workers (int): number of workers
+        graceful_timeout (float): seconds a stopping worker gets to finish its requests
+        max_requests (int): requests after which a worker exits and is replaced, or None
+        log_level (str): uvicorn log level
+    """
+
+    def __init__(self, app, sock, workers, graceful_timeout=30.0, max_requests=None, log_level="info"):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.max_requests = max_requests
+        self.log_level = log_level
+        self.pids = {}
+        self.stopping = False
+        self.reload = False
+
+    def run_worker(self):
+        """Worker process body: serve until told to stop"""
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, signal.SIG_DFL)
+        load_model()
+        config = uvicorn.Config(
+            self.app,
+            log_level=self.log_level,
+            limit_max_requests=self.max_requests,
+            timeout_graceful_shutdown=self.graceful_timeout,
+        )
+        uvicorn.Server(config).run(sockets=[self.sock])
+
+    def spawn(self):
+        # Otherwise buffered output would be written by both processes
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self.run_worker()
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        self.pids[pid] = time.monotonic()
+        print(f"Started worker {pid}", flush=True)
+        return pid
+
+    def reap(self):
+        """Forget exited workers, returning {pid: seconds it ran}"""
+        exited = {}
+        while self.pids:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            started = self.pids.pop(pid, None)
+            if started is not None:
+                exited[pid] = time.monotonic() - started
+                print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}", flush=True)
+        return exited
+
+    def stop_worker(self, pid):
+        """SIGTERM a worker and wait for it to finish, killing it after graceful_timeout"""
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        deadline = time.monotonic() + self.graceful_timeout
+        while pid in self.pids and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.05)
+        if pid in self.pids:
+            print(f"Worker {pid} did not stop within {self.graceful_timeout}s, killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            os.waitpid(pid, 0)
+            self.pids.pop(pid, None)
+
+    def restart_workers(self):
+        """Replace every worker, one at a time, keeping the worker count"""
+        for pid in list(self.pids):
+            if self.stopping:
+                return
+            self.spawn()
+            self.stop_worker(pid)
+
+    def stop(self):
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.pids and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.05)
+        for pid in list(self.pids):
+            self.stop_worker(pid)
+
+    def _on_stop(self, signum, frame):
+        self.stopping = True
+
+    def _on_reload(self, signum, frame):
+        self.reload = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+        for _ in range(self.workers):
+            self.spawn()
+        try:
+            while not self.stopping:
+                exited = self.reap()
+                if self.reload:
+                    self.reload = False
+                    print("Restarting workers")
+                    self.restart_workers()
+                if exited and min(exited.values()) < MIN_WORKER_LIFETIME:
+                    # Crashing on startup: do not fork in a tight loop
+                    time.sleep(MIN_WORKER_LIFETIME)
+                while len(self.pids) < self.workers and not self.stopping:
+                    self.spawn()
+                time.sleep(0.2)
+        finally:
+            print("Stopping workers")
+            self.stop()
+            self.sock.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the extraction API with pre-forked workers")
+    parser.add_argument("--host", default=os.environ.get("RXTRACT_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("RXTRACT_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("RXTRACT_WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--graceful-timeout", type=float,
+                        default=float(os.environ.get("RXTRACT_GRACEFUL_TIMEOUT", "30")))
+    max_requests = os.environ.get("RXTRACT_WORKER_MAX_REQUESTS")
+    parser.add_argument("--max-requests", type=int, default=int(max_requests) if max_requests else None)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    app = warm()
+    if not hasattr(os, "fork"):
+        print("fork() is not available, serving from a single process")
+        uvicorn.run(app, host=args.host, port=args.port, log_level=args.log_level)
+        return
+    sock = bind(args.host, args.port)
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} workers (parent {os.getpid()})")
+    Supervisor(app, sock, max(args.workers, 1), graceful_timeout=args.graceful_timeout,
+               max_requests=args.max_requests, log_level=args.log_level).run()
+
+
+if __name__ == "__main__":
+    main()
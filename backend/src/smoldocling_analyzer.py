@@ -3,84 +3,105 @@ SmolDocling integration for enhanced medical document analysis
 """
 import os
 import logging
-import re
+import threading
+from collections import OrderedDict
+
+import knowledge_base
+import model_analyzer
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# "rules" uses the knowledge base only; "model" also asks a local language
+# model (see model_analyzer) for the diagnosis, routine and diet
+ANALYZER_MODES = ["rules", "model"]
+
+class AnalysisCache:
+    """
+    Thread-safe LRU of rule-based analysis sections keyed by the sorted
+    medications and conditions found, with hit/miss counters.
+
+    Entries belong to one knowledge base version (its content_id). A new
+    version drops them; callers still holding a version the cache has moved
+    past (requests that started before a reload) bypass the cache rather than
+    flushing it again.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._retired = set()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            if version in self._retired:
+                return None
+            if version != self.version:
+                if self.version is not None:
+                    self._retired.add(self.version)
+                self._entries.clear()
+                self.version = version
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, version, sections):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[key] = sections
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "version": self.version,
+            }
+
+# Shared by every analyzer in the process (extract() builds one per request)
+analysis_cache = AnalysisCache(int(os.environ.get("RXTRACT_ANALYSIS_CACHE_SIZE", "1024")))
+
 class SmolDoclingAnalyzer:
-    def __init__(self):
-        """Initialize the SmolDocling analyzer for medical document analysis"""
+    def __init__(self, mode=None, model_timeout=None):
+        """
+        Initialize the SmolDocling analyzer for medical document analysis
+
+        ``mode`` defaults to RXTRACT_ANALYZER_MODE (``rules``). In ``model``
+        mode the model has ``model_timeout`` seconds (RXTRACT_ANALYZER_TIMEOUT_S,
+        default 10) to answer before the rule-based analysis is used instead.
+        """
+        self.mode = mode or os.environ.get("RXTRACT_ANALYZER_MODE", "rules")
+        if self.mode not in ANALYZER_MODES:
+            raise ValueError(f"Unknown analyzer mode: {self.mode}. Must be one of {', '.join(ANALYZER_MODES)}")
+        if model_timeout is None:
+            model_timeout = float(os.environ.get("RXTRACT_ANALYZER_TIMEOUT_S", "10"))
+        self.model_timeout = model_timeout
         try:
             # In a real implementation, we would load the model here
             # For now, we'll use a rule-based approach to simulate the model
             logger.info("Initializing SmolDocling analyzer (rule-based simulation)")
             self.model_loaded = True
             
-            # Load medical knowledge base (simplified)
-            self.medications = {
-                "prednisone": {
-                    "uses": ["inflammation", "autoimmune disorders", "allergic reactions"],
-                    "side_effects": ["increased appetite", "mood changes", "weight gain", "high blood pressure"],
-                    "diet": "Low sodium, high potassium diet. Avoid alcohol.",
-                    "routine": "Take with food in the morning. Monitor blood pressure regularly."
-                },
-                "lialda": {
-                    "uses": ["ulcerative colitis", "inflammatory bowel disease"],
-                    "side_effects": ["headache", "nausea", "abdominal pain", "diarrhea"],
-                    "diet": "High fiber diet. Stay well hydrated.",
-                    "routine": "Take with food. Avoid antacids 2 hours before or after."
-                },
-                "metformin": {
-                    "uses": ["type 2 diabetes", "insulin resistance"],
-                    "side_effects": ["diarrhea", "nausea", "stomach upset", "vitamin B12 deficiency"],
-                    "diet": "Low carbohydrate diet. Avoid excessive alcohol.",
-                    "routine": "Take with meals to reduce stomach upset. Monitor blood sugar regularly."
-                },
-                "losartan": {
-                    "uses": ["high blood pressure", "heart failure", "kidney protection"],
-                    "side_effects": ["dizziness", "cough", "high potassium levels"],
-                    "diet": "Low sodium diet. Rich in fruits and vegetables.",
-                    "routine": "Take at the same time each day. Monitor blood pressure regularly."
-                },
-                "levothyroxine": {
-                    "uses": ["hypothyroidism", "thyroid hormone replacement"],
-                    "side_effects": ["weight loss", "increased appetite", "nervousness", "insomnia"],
-                    "diet": "Take on empty stomach. Wait 30-60 minutes before eating.",
-                    "routine": "Take in the morning. Avoid calcium and iron supplements within 4 hours."
-                },
-                "azithromycin": {
-                    "uses": ["bacterial infections", "respiratory infections", "skin infections"],
-                    "side_effects": ["nausea", "diarrhea", "abdominal pain", "allergic reactions"],
-                    "diet": "Can be taken with or without food. Avoid antacids.",
-                    "routine": "Complete the full course even if feeling better."
-                }
-            }
-            
-            # Common medical conditions
-            self.conditions = {
-                "hypertension": {
-                    "diet": "Low sodium, high potassium diet. Rich in fruits and vegetables.",
-                    "routine": "Regular exercise, stress management, limit alcohol."
-                },
-                "diabetes": {
-                    "diet": "Low carbohydrate, low glycemic index foods. Regular meal timing.",
-                    "routine": "Regular exercise, monitor blood sugar, foot care."
-                },
-                "hypothyroidism": {
-                    "diet": "Iodine-rich foods. Limit cruciferous vegetables.",
-                    "routine": "Take medication consistently, regular thyroid function tests."
-                },
-                "ulcerative colitis": {
-                    "diet": "Low fiber during flares, well-cooked vegetables, avoid trigger foods.",
-                    "routine": "Stress management, adequate rest, stay hydrated."
-                },
-                "migraine": {
-                    "diet": "Avoid trigger foods (aged cheese, alcohol, chocolate). Regular meals.",
-                    "routine": "Adequate sleep, stress management, stay hydrated."
-                }
-            }
+            # Medication and condition records, memory-mapped and shared across processes
+            self.knowledge_base = knowledge_base.get_knowledge_base()
             
         except Exception as e:
             logger.error(f"Failed to initialize SmolDocling analyzer: {str(e)}")
@@ -90,12 +111,14 @@ class SmolDoclingAnalyzer:
         """Check if the model is available"""
         return self.model_loaded
     
-    def analyze_prescription(self, ocr_text):
+    def analyze_prescription(self, ocr_text, words=None):
         """
         Analyze prescription text using rule-based approach
         
         Args:
             ocr_text (str): The OCR extracted text from a prescription
+            words (WordTable): optional word table of ``ocr_text``; each found
+                medication then carries the OCR confidence and position it was read at
             
         Returns:
             dict: Analysis results including diagnosis, routine, diet, and warnings
@@ -106,34 +129,27 @@ class SmolDoclingAnalyzer:
                 "diagnosis": "Model not available",
                 "routine": "Model not available",
                 "diet": "Model not available",
-                "warnings": "Model not available"
+                "warnings": "Model not available",
+                "interactions": [],
+                "medications": []
             }
         
         try:
-            # Extract medications from text
-            medications_found = []
-            for med in self.medications.keys():
-                if re.search(r'\b' + med + r'\b', ocr_text.lower()):
-                    medications_found.append(med)
+            # Extract medications (by name or synonym, tolerating OCR misreads) from text
+            medication_matches = self.knowledge_base.match_text(ocr_text, "medication", fuzzy=True)
+            medications_found = [match["name"] for match in medication_matches]
+            if words is not None:
+                for match in medication_matches:
+                    match["ocr"] = words.locate(match["text"])
             
             # Extract potential conditions from text
-            conditions_found = []
-            for condition in self.conditions.keys():
-                if re.search(r'\b' + condition + r'\b', ocr_text.lower()):
-                    conditions_found.append(condition)
+            conditions_found = self.knowledge_base.find_in_text(ocr_text, "condition")
             
             # Generate analysis based on found medications and conditions
-            diagnosis = self._generate_diagnosis(medications_found, conditions_found)
-            routine = self._generate_routine(medications_found, conditions_found)
-            diet = self._generate_diet(medications_found, conditions_found)
-            warnings = self._generate_warnings(medications_found)
-            
-            analysis_result = {
-                "diagnosis": diagnosis,
-                "routine": routine,
-                "diet": diet,
-                "warnings": warnings
-            }
+            analysis_result = self._analyze_regimen(medications_found, conditions_found)
+            analysis_result["medications"] = medication_matches
+            if self.mode == "model":
+                self._apply_model_analysis(analysis_result, ocr_text, medications_found, conditions_found)
             
             logger.info("Successfully generated prescription analysis")
             return analysis_result
@@ -144,21 +160,58 @@ class SmolDoclingAnalyzer:
                 "diagnosis": f"Error: {str(e)}",
                 "routine": "Not available due to error",
                 "diet": "Not available due to error",
-                "warnings": "Not available due to error"
+                "warnings": "Not available due to error",
+                "interactions": [],
+                "medications": []
             }
     
-    def analyze_patient_details(self, ocr_text):
+    def analyze_patient_details(self, ocr_text, words=None):
         """
         Analyze patient details using rule-based approach
         
         Args:
             ocr_text (str): The OCR extracted text from patient details
+            words (WordTable): optional word table of ``ocr_text``
             
         Returns:
             dict: Analysis results including diagnosis, routine, diet, and warnings
         """
         # For now, use the same analysis as prescriptions
-        return self.analyze_prescription(ocr_text)
+        return self.analyze_prescription(ocr_text, words=words)
+    
+    def _analyze_regimen(self, medications, conditions):
+        """
+        Rule-based sections for a set of medications and conditions, memoized
+        in analysis_cache since a few regimens make up most prescriptions
+        """
+        key = (tuple(sorted(medications)), tuple(sorted(conditions)))
+        version = self.knowledge_base.content_id
+        sections = analysis_cache.get(key, version)
+        if sections is None:
+            interactions = self.knowledge_base.interactions(medications)
+            sections = {
+                "diagnosis": self._generate_diagnosis(medications, conditions),
+                "routine": self._generate_routine(medications, conditions),
+                "diet": self._generate_diet(medications, conditions),
+                "warnings": self._generate_warnings(medications, interactions),
+                "interactions": interactions
+            }
+            analysis_cache.put(key, version, sections)
+        # Callers own the result, so hand out copies of the mutable parts
+        return dict(sections, interactions=[dict(interaction) for interaction in sections["interactions"]])
+    
+    def _apply_model_analysis(self, analysis_result, ocr_text, medications, conditions):
+        """Replace the rule-based sections with the model's, keeping the rules on timeout or error"""
+        try:
+            sections = model_analyzer.analyze(ocr_text, medications, conditions, timeout=self.model_timeout)
+        except Exception as e:
+            logger.warning(f"Model analysis failed ({type(e).__name__}: {e}), using rule-based analysis")
+            analysis_result["analysis_source"] = "rules"
+            return
+        for section in model_analyzer.SECTIONS:
+            if sections.get(section):
+                analysis_result[section] = sections[section]
+        analysis_result["analysis_source"] = "model"
     
     def _generate_diagnosis(self, medications, conditions):
         """Generate likely diagnosis based on medications and conditions"""
@@ -170,8 +223,9 @@ class SmolDoclingAnalyzer:
         
         possible_conditions = []
         for med in medications:
-            if med in self.medications:
-                possible_conditions.extend(self.medications[med]["uses"])
+            record = self.knowledge_base.lookup(med, "medication")
+            if record:
+                possible_conditions.extend(record["uses"])
         
         if possible_conditions:
             return f"Based on medications, possible conditions include: {', '.join(set(possible_conditions)).title()}"
@@ -184,13 +238,15 @@ class SmolDoclingAnalyzer:
         
         # Add medication-specific routines
         for med in medications:
-            if med in self.medications:
-                routines.append(f"For {med}: {self.medications[med]['routine']}")
+            record = self.knowledge_base.lookup(med, "medication")
+            if record:
+                routines.append(f"For {med}: {record['routine']}")
         
         # Add condition-specific routines
         for condition in conditions:
-            if condition in self.conditions:
-                routines.append(f"For {condition}: {self.conditions[condition]['routine']}")
+            record = self.knowledge_base.lookup(condition, "condition")
+            if record:
+                routines.append(f"For {condition}: {record['routine']}")
         
         # Add general recommendations
         routines.append("General: Maintain regular sleep schedule and stay hydrated.")
@@ -203,30 +259,37 @@ class SmolDoclingAnalyzer:
         
         # Add medication-specific diets
         for med in medications:
-            if med in self.medications:
-                diets.append(f"For {med}: {self.medications[med]['diet']}")
+            record = self.knowledge_base.lookup(med, "medication")
+            if record:
+                diets.append(f"For {med}: {record['diet']}")
         
         # Add condition-specific diets
         for condition in conditions:
-            if condition in self.conditions:
-                diets.append(f"For {condition}: {self.conditions[condition]['diet']}")
+            record = self.knowledge_base.lookup(condition, "condition")
+            if record:
+                diets.append(f"For {condition}: {record['diet']}")
         
         # Add general recommendations
         diets.append("General: Balanced diet rich in fruits, vegetables, and whole grains.")
         
         return "\n".join(diets)
     
-    def _generate_warnings(self, medications):
-        """Generate warnings and side effects based on medications"""
+    def _generate_warnings(self, medications, interactions=()):
+        """Generate warnings, side effects and drug interactions based on medications"""
         if not medications:
             return "No specific warnings without medication information"
         
         warnings = []
         for med in medications:
-            if med in self.medications:
-                side_effects = self.medications[med]["side_effects"]
+            record = self.knowledge_base.lookup(med, "medication")
+            if record:
+                side_effects = record["side_effects"]
                 warnings.append(f"{med.title()} may cause: {', '.join(side_effects)}")
         
+        for interaction in interactions:
+            drugs = " + ".join(drug.title() for drug in interaction["drugs"])
+            warnings.append(f"Interaction ({interaction['severity']}): {drugs}. {interaction['description']}")
+        
         if warnings:
             warnings.append("\nConsult your doctor if you experience severe or persistent side effects.")
             return "\n".join(warnings)
@@ -0,0 +1,170 @@
+"""
+Tesseract vocabulary and character constraints for medical documents.
+
+Tesseract's LSTM decoder is guided by its word lists (dawgs). By default only
+the generic English dictionary is loaded, so medication names, field labels
+and formatted numbers all compete with the open vocabulary. This module
+writes a ``user-words`` file (every medication and condition name and synonym
+in the knowledge base plus the labels the parsers of every document type
+anchor on) and a ``user-patterns`` file (dates, phone numbers, doses), and
+adds them to the OCR configs.
+
+Every document type shares the one vocabulary, so a page OCRs the same (and
+hits the same OCR cache entries) whatever type it is submitted as. Files are
+named after a hash of their content, so a knowledge base update produces new
+files and new OCR cache keys. Lines that read as mostly digits
+are re-OCR'd with a digit-and-punctuation whitelist (NUMERIC_WHITELIST).
+
+Configured by RXTRACT_TESSERACT_VOCAB (set to 0 to disable) and
+RXTRACT_TESSERACT_VOCAB_DIR (default backend/cache/tesseract_vocab). On
+Windows, where config values cannot be quoted (see config_arg()), a directory
+with spaces in its path is replaced by %ProgramData%\\rxtract\\tesseract_vocab.
+"""
+import hashlib
+import os
+import re
+import shlex
+import tempfile
+import threading
+
+import knowledge_base
+
+DEFAULT_VOCAB_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "tesseract_vocab"
+)
+
+# Words the parsers of each document type anchor on
+FIELD_WORDS = {
+    "prescription": [
+        "Name", "Address", "Residence", "Patient", "Date", "Phone", "Medication", "Medicines", "Prescribed",
+        "Directions", "Instructions", "Refill", "Refills", "Taper", "Finish", "every", "daily", "twice",
+        "times", "days", "weeks", "month", "take", "tablet", "tablets", "pill", "pills", "capsule", "capsules",
+        "mg", "mcg", "gram", "grams", "ml",
+    ],
+    "patient_details": [
+        "Patient", "Medical", "Record", "Information", "Name", "Birth", "Date", "Phone", "Telephone", "Home",
+        "Work", "Weight", "Height", "Emergency", "General", "History", "Problems", "Immunizations",
+        "Vaccination", "Vaccinated", "Insurance", "Coverage", "Primary", "Secondary", "Surgeries",
+        "Allergies", "Yes", "No",
+    ],
+}
+
+# Tesseract user-patterns (\d digit, \c letter, \n letter or digit, \A capital)
+USER_PATTERNS = {
+    "prescription": [
+        r"\d/\d/\d\d\d\d", r"\d/\d\d/\d\d\d\d", r"\d\d/\d/\d\d\d\d", r"\d\d/\d\d/\d\d\d\d",
+        r"(\d\d\d)-\d\d\d-\d\d\d\d", r"\d\d\d-\d\d\d-\d\d\d\d",
+        r"\d.\d", r"\d\d.\d", r"\dmg", r"\d\dmg", r"\d\d\dmg",
+    ],
+    "patient_details": [
+        r"\d/\d/\d\d\d\d", r"\d/\d\d/\d\d\d\d", r"\d\d/\d/\d\d\d\d", r"\d\d/\d\d/\d\d\d\d",
+        r"(\d\d\d)", r"\d\d\d-\d\d\d\d", r"(\d\d\d)-\d\d\d-\d\d\d\d", r"\d\d\d-\d\d\d-\d\d\d\d",
+        r"\d'", r'\d"',
+    ],
+}
+
+# pytesseract splits config strings with shlex in POSIX mode except on Windows
+POSIX_CONFIG = os.name != "nt"
+
+# Characters allowed when re-OCR'ing a numeric line
+NUMERIC_WHITELIST = "0123456789()-./:,'\""
+# A line is numeric when at least this share of its non-space characters are in NUMERIC_WHITELIST
+NUMERIC_LINE_SHARE = 0.6
+
+
+def config_arg(value, posix=POSIX_CONFIG):
+    """
+    ``value`` as one argument of a config string that is split with
+    ``shlex.split(config, posix=posix)``. Without POSIX splitting quotes stay
+    in the arguments, so the value is passed as it is and must not contain
+    whitespace.
+    """
+    if posix:
+        return shlex.quote(value)
+    if re.search(r"\s", value):
+        raise ValueError(f"Cannot pass a value with whitespace to Tesseract: {value}")
+    return value
+
+
+def vocab_directory():
+    directory = os.environ.get("RXTRACT_TESSERACT_VOCAB_DIR", DEFAULT_VOCAB_DIR)
+    if not POSIX_CONFIG and re.search(r"\s", directory):
+        directory = os.path.join(os.environ.get("ProgramData", tempfile.gettempdir()), "rxtract", "tesseract_vocab")
+    return directory
+
+
+def user_words(kb):
+    """Sorted user-words: knowledge base names and the field labels of every document type"""
+    words = set(word for field_words in FIELD_WORDS.values() for word in field_words)
+    for kind in ("medication", "condition"):
+        for name, _ in kb.names(kind):
+            for word in re.findall(r"[a-z][a-z0-9\-]+", name):
+                words.update((word, word.capitalize()))
+    return sorted(words)
+
+
+def user_patterns():
+    """User-patterns of every document type, without duplicates"""
+    return list(dict.fromkeys(pattern for patterns in USER_PATTERNS.values() for pattern in patterns))
+
+
+def _write(directory, suffix, lines):
+    content = "\n".join(lines) + "\n"
+    digest = hashlib.blake2b(content.encode("utf-8"), digest_size=8).hexdigest()
+    path = os.path.join(directory, f"vocabulary-{digest}.{suffix}")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    return path
+
+
+_files = {}
+_files_lock = threading.Lock()
+
+
+def vocabulary_files(kb=None, directory=None):
+    """
+    Write (once per knowledge base content, see KnowledgeBase.content_id)
+    and return the user-words and user-patterns paths.
+    """
+    kb = kb or knowledge_base.get_knowledge_base()
+    directory = directory or vocab_directory()
+    key = (directory, kb.content_id)
+    with _files_lock:
+        if key not in _files:
+            _files[key] = (
+                _write(directory, "user-words", user_words(kb)),
+                _write(directory, "user-patterns", user_patterns()),
+            )
+        return _files[key]
+
+
+def ocr_config(config):
+    """
+    ``config`` with the user-words and user-patterns, or unchanged if
+    disabled or the files cannot be written
+    """
+    if os.environ.get("RXTRACT_TESSERACT_VOCAB", "1") == "0":
+        return config
+    try:
+        words_path, patterns_path = vocabulary_files()
+        return f"{config} --user-words {config_arg(words_path)} --user-patterns {config_arg(patterns_path)}"
+    except (OSError, ValueError) as e:
+        print(f"Could not use Tesseract vocabulary: {e}")
+        return config
+
+
+def is_numeric(text):
+    """True if ``text`` has digits and is mostly NUMERIC_WHITELIST characters"""
+    characters = [c for c in text if not c.isspace()]
+    if not characters or not any(c.isdigit() for c in characters):
+        return False
+    return sum(1 for c in characters if c in NUMERIC_WHITELIST) / len(characters) >= NUMERIC_LINE_SHARE
+
+
+def numeric_config(config):
+    """``config`` restricted to NUMERIC_WHITELIST"""
+    return f"{config} -c tessedit_char_whitelist={config_arg(NUMERIC_WHITELIST)}"
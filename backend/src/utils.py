@@ -1,22 +1,112 @@
+import threading
 import numpy as np
 import cv2
 
-def preprocess_image(img):
+def pgm_header(width, height):
+    """Header of a binary 8-bit grayscale PGM image"""
+    return b"P5\n%d %d\n255\n" % (width, height)
+
+class ImageBuffers:
+    """
+    Preallocated image buffers reused across pages.
+
+    A buffer is only reallocated when the requested shape changes, so pages of
+    the same size are processed without new pixel allocations.
+    """
+
+    def __init__(self):
+        self._buffers = {}
+
+    def get(self, name, shape, dtype=np.uint8):
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != tuple(shape) or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buffer
+        return buffer
+
+    def get_pgm(self, name, height, width):
+        """
+        Return a (height, width) uint8 buffer laid out right after a PGM header.
+
+        The header and pixels share one allocation, so pgm_buffer() can hand
+        the whole image to Tesseract without copying or encoding it.
+        """
+        header = pgm_header(width, height)
+        raw = self._buffers.get(name)
+        if raw is None or raw.size != len(header) + height * width or raw[:len(header)].tobytes() != header:
+            raw = np.empty(len(header) + height * width, dtype=np.uint8)
+            raw[:len(header)] = np.frombuffer(header, dtype=np.uint8)
+            self._buffers[name] = raw
+        return raw[len(header):].reshape(height, width)
+
+_thread_local = threading.local()
+
+def thread_buffers(name="default"):
+    """
+    ImageBuffers owned by the current thread (requests are processed on
+    several threads). Use distinct names for images that must stay alive at
+    the same time.
+    """
+    buffers_by_name = getattr(_thread_local, "buffers", None)
+    if buffers_by_name is None:
+        buffers_by_name = _thread_local.buffers = {}
+    buffers = buffers_by_name.get(name)
+    if buffers is None:
+        buffers = buffers_by_name[name] = ImageBuffers()
+    return buffers
+
+def pgm_buffer(img):
+    """
+    Return a 2D uint8 image as binary PGM bytes.
+
+    Images produced by preprocess_image already sit behind a PGM header, in
+    which case the underlying buffer is returned as a memoryview without
+    copying. Any other image is copied once behind a new header.
+    """
+    if img.ndim != 2 or img.dtype != np.uint8:
+        raise ValueError("pgm_buffer expects a 2D uint8 image")
+    height, width = img.shape
+    header = pgm_header(width, height)
+    base = img.base
+    if isinstance(base, np.ndarray) and base.ndim == 1 and img.flags.c_contiguous:
+        offset = img.__array_interface__["data"][0] - base.__array_interface__["data"][0]
+        if offset == len(header) and base.size == offset + img.size and base[:offset].tobytes() == header:
+            return memoryview(base)
+    return header + np.ascontiguousarray(img).tobytes()
+
+def preprocess_image(img, buffers=None, scale=1.5, denoise=9, block_size=65, constant=13):
     """
     Enhanced image preprocessing for Tesseract 5.5.0
     This function applies several image processing techniques to improve OCR accuracy
+
+    Every step writes into a preallocated buffer from ``buffers`` (the calling
+    thread's buffers by default). The returned image is one of those buffers
+    and is overwritten by the next call on the same thread; copy it to keep it.
+    ``scale`` is the resize factor applied before denoising, ``denoise`` the
+    bilateral filter diameter (0 skips it) and ``block_size`` / ``constant``
+    the adaptive threshold's neighbourhood and offset.
     """
-    # Convert to grayscale if needed
+    if buffers is None:
+        buffers = thread_buffers()
+    
+    # Convert to grayscale if needed. Pages are decoded by OpenCV as BGR
     if len(img.shape) == 3:
-        gray = cv2.cvtColor(np.array(img), cv2.COLOR_BGR2GRAY)
+        code = cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+        gray = cv2.cvtColor(img, code, dst=buffers.get("gray", img.shape[:2]))
     else:
         gray = img
     
     # Resize the image (larger images generally give better OCR results)
-    resized = cv2.resize(gray, None, fx=1.5, fy=1.5, interpolation=cv2.INTER_LINEAR)
+    height, width = gray.shape
+    size = (int(round(width * scale)), int(round(height * scale)))
+    resized = cv2.resize(gray, None, dst=buffers.get("resized", (size[1], size[0])),
+                         fx=scale, fy=scale, interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
     
     # Apply bilateral filter to remove noise while preserving edges
-    denoised = cv2.bilateralFilter(resized, 9, 75, 75)
+    if denoise:
+        denoised = cv2.bilateralFilter(resized, denoise, 75, 75, dst=buffers.get("denoised", resized.shape))
+    else:
+        denoised = resized
     
     # Apply adaptive thresholding to handle different lighting conditions
     processed_image = cv2.adaptiveThreshold(
@@ -24,13 +114,13 @@ def preprocess_image(img):
         255,
         cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
         cv2.THRESH_BINARY,
-        65,  # block size (optimized for medical documents)
-        13   # constant (optimized for medical documents)
+        block_size,  # 65 by default (optimized for medical documents)
+        constant,  # 13 by default (optimized for medical documents)
+        dst=buffers.get_pgm("processed", size[1], size[0])
     )
     
-    # Apply morphological operations to remove small noise
-    kernel = np.ones((1, 1), np.uint8)
-    processed_image = cv2.morphologyEx(processed_image, cv2.MORPH_CLOSE, kernel)
+    # A morphological close with a 1x1 kernel leaves the image unchanged, so
+    # the former cv2.morphologyEx(..., np.ones((1, 1))) step is not repeated here
     
     return processed_image
 
@@ -38,9 +128,9 @@ def enhance_image_for_display(img):
     """
     Enhance image for display purposes (not for OCR)
     """
-    # Convert to grayscale if needed
+    # Convert to grayscale if needed. Pages are decoded by OpenCV as BGR
     if len(img.shape) == 3:
-        gray = cv2.cvtColor(np.array(img), cv2.COLOR_BGR2GRAY)
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     else:
         gray = img
     
@@ -0,0 +1,170 @@
+"""
+Word-level OCR output shared by the extractor, parsers and analyzer.
+
+A WordTable holds every OCR'd word of a document as parallel numpy columns:
+page, block and line numbers, the word's box in original page pixels, its
+confidence, and its character span in the document text. The text itself is
+rebuilt from the words, one line per OCR line with a blank line between
+blocks, so a single ``image_to_data`` pass gives both the text the parsers
+read and the position and confidence of anything they find in it.
+"""
+import re
+
+import numpy as np
+
+INT_COLUMNS = ["page", "block", "line", "left", "top", "width", "height", "start", "end"]
+# Text placed after every page of a document
+PAGE_SEPARATOR = "\n\n"
+
+
+def group_lines(data):
+    """
+    Group ``image_to_data`` words into lines.
+
+    Returns:
+        list: dicts with block, words, confidences, word boxes (left, top,
+        width, height) and the line's bounding box (left, top, right, bottom)
+        in the OCR'd image's coordinates, in reading order
+    """
+    lines = {}
+    for i, text in enumerate(data["text"]):
+        if data["conf"][i] < 0 or not text.strip():
+            continue
+        key = (data["page_num"][i], data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        left, top, width, height = data["left"][i], data["top"][i], data["width"][i], data["height"][i]
+        line = lines.get(key)
+        if line is None:
+            line = lines[key] = {"block": key[:2], "words": [], "confs": [], "boxes": [],
+                                 "box": [left, top, left + width, top + height]}
+        line["words"].append(text)
+        line["confs"].append(data["conf"][i])
+        line["boxes"].append((left, top, width, height))
+        box = line["box"]
+        box[0], box[1] = min(box[0], left), min(box[1], top)
+        box[2], box[3] = max(box[2], left + width), max(box[3], top + height)
+    return [lines[key] for key in sorted(lines)]
+
+
+class WordTable:
+    """
+    Columnar table of the words in ``text``.
+
+    Columns are numpy arrays indexed by word, in reading order: INT_COLUMNS
+    as int32 plus ``conf`` as float32. ``start``/``end`` are the word's
+    character span in ``text``.
+    """
+
+    def __init__(self, text="", columns=None):
+        self.text = text
+        if columns is None:
+            columns = {name: np.zeros(0, dtype=np.int32) for name in INT_COLUMNS}
+            columns["conf"] = np.zeros(0, dtype=np.float32)
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns["start"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @classmethod
+    def from_lines(cls, lines, page=1, scale=1.0):
+        """
+        Table of one page from group_lines() output. Boxes are divided by
+        ``scale`` to map them from the OCR'd image back to the original page.
+        """
+        parts, rows, offset, previous_block = [], [], 0, None
+        for line_number, line in enumerate(lines, start=1):
+            if previous_block is not None and line["block"] != previous_block:
+                parts.append("\n")
+                offset += 1
+            previous_block = line["block"]
+            for index, (word, conf, box) in enumerate(zip(line["words"], line["confs"], line["boxes"])):
+                if index:
+                    parts.append(" ")
+                    offset += 1
+                left, top, width, height = [int(round(value / scale)) for value in box]
+                rows.append((page, line["block"][1], line_number, left, top, width, height,
+                             offset, offset + len(word), conf))
+                parts.append(word)
+                offset += len(word)
+            parts.append("\n")
+            offset += 1
+        columns = {name: np.array([row[i] for row in rows], dtype=np.int32) for i, name in enumerate(INT_COLUMNS)}
+        columns["conf"] = np.array([row[-1] for row in rows], dtype=np.float32)
+        return cls("".join(parts), columns)
+
+    @classmethod
+    def from_data(cls, data, page=1, scale=1.0):
+        """Table of one page from an ``image_to_data`` dict"""
+        return cls.from_lines(group_lines(data), page=page, scale=scale)
+
+    @classmethod
+    def concat(cls, tables):
+        """One table for a document, each page's text followed by PAGE_SEPARATOR"""
+        texts, shifted, offset = [], [], 0
+        for table in tables:
+            columns = dict(table.columns)
+            columns["start"] = columns["start"] + offset
+            columns["end"] = columns["end"] + offset
+            shifted.append(columns)
+            texts.append(table.text + PAGE_SEPARATOR)
+            offset += len(texts[-1])
+        if not shifted:
+            return cls()
+        columns = {name: np.concatenate([page[name] for page in shifted]) for name in shifted[0]}
+        return cls("".join(texts), columns)
+
+    def words(self, indices=None):
+        """Text of the words at ``indices`` (all words by default)"""
+        starts, ends = self.columns["start"], self.columns["end"]
+        if indices is None:
+            indices = range(len(self))
+        return [self.text[starts[i]:ends[i]] for i in indices]
+
+    def span_words(self, start, end):
+        """Indices of the words overlapping characters ``start:end`` of the text"""
+        first = int(np.searchsorted(self.columns["end"], start, side="right"))
+        last = int(np.searchsorted(self.columns["start"], end, side="left"))
+        return np.arange(first, max(first, last))
+
+    def describe(self, indices):
+        """
+        Confidence and position of a run of words.
+
+        Returns:
+            dict: mean and minimum ``confidence``, the ``page`` of the first
+            word and the ``box`` (left, top, right, bottom) around the words
+            on that page, or None for no words
+        """
+        if len(indices) == 0:
+            return None
+        conf = self.columns["conf"][indices]
+        page = int(self.columns["page"][indices[0]])
+        on_page = indices[self.columns["page"][indices] == page]
+        left, top = self.columns["left"][on_page], self.columns["top"][on_page]
+        right, bottom = left + self.columns["width"][on_page], top + self.columns["height"][on_page]
+        return {
+            "confidence": round(float(conf.mean()), 1),
+            "min_confidence": round(float(conf.min()), 1),
+            "page": page,
+            "box": [int(left.min()), int(top.min()), int(right.max()), int(bottom.max())],
+        }
+
+    def span_details(self, start, end):
+        """describe() the words overlapping characters ``start:end``"""
+        return self.describe(self.span_words(start, end))
+
+    def locate(self, phrase):
+        """
+        describe() the first occurrence of ``phrase``, matched case-insensitively
+        on its alphanumeric words, or None if it does not occur.
+        """
+        tokens = re.findall(r"[a-z0-9]+", phrase.lower())
+        if not tokens:
+            return None
+        pattern = r"(?<![a-z0-9])" + r"[^a-z0-9]+".join(map(re.escape, tokens)) + r"(?![a-z0-9])"
+        match = re.search(pattern, self.text, flags=re.IGNORECASE)
+        if match is None:
+            return None
+        return self.span_details(match.start(), match.end())
@@ -0,0 +1,20 @@
+import os
+import sys
+import tempfile
+
+# The backend modules import each other as top-level modules (see main.py), so
+# put backend/src and backend/benchmarks on the path the same way uvicorn does.
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for sub_dir in ("src", "benchmarks"):
+    path = os.path.join(BACKEND_DIR, sub_dir)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# Tests run offline: use the stub OCR engine and keep debug artifacts and
+# uploads out of the tree.
+os.environ.setdefault("RXTRACT_OCR_ENGINE", "stub")
+os.environ.setdefault("RXTRACT_DEBUG_ARTIFACTS", "0")
+os.environ.setdefault("RXTRACT_UPLOAD_DIR", tempfile.mkdtemp(prefix="rxtract_test_uploads_"))
+os.environ.setdefault("RXTRACT_OCR_CACHE_DIR", tempfile.mkdtemp(prefix="rxtract_test_ocr_cache_"))
+os.environ.setdefault("RXTRACT_TESSERACT_VOCAB_DIR", tempfile.mkdtemp(prefix="rxtract_test_vocab_"))
+os.environ.setdefault("RXTRACT_PROFILE_DIR", tempfile.mkdtemp(prefix="rxtract_test_profiles_"))
@@ -0,0 +1,46 @@
+import pytest
+
+import smoldocling_analyzer
+from smoldocling_analyzer import AnalysisCache, SmolDoclingAnalyzer
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = AnalysisCache(max_entries=2)
+    monkeypatch.setattr(smoldocling_analyzer, "analysis_cache", cache)
+    return cache
+
+
+def test_repeated_regimens_hit_the_cache(cache):
+    analyzer = SmolDoclingAnalyzer(mode="rules")
+    first = analyzer.analyze_prescription("Prednisone 20 mg\nLialda 2.4 gram")
+    # Same regimen, different text and order
+    second = analyzer.analyze_prescription("lialda then prednisone")
+    assert {k: v for k, v in first.items() if k != "medications"} == \
+        {k: v for k, v in second.items() if k != "medications"}
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.stats()["hit_rate"] == 0.5
+
+
+def test_cached_results_are_copies(cache):
+    analyzer = SmolDoclingAnalyzer(mode="rules")
+    analyzer.analyze_prescription("prednisone metformin")["interactions"][0]["severity"] = "edited"
+    assert analyzer.analyze_prescription("prednisone metformin")["interactions"][0]["severity"] == "moderate"
+
+
+def test_cache_is_bounded_and_cleared_on_version_change():
+    cache = AnalysisCache(max_entries=2)
+    for key in ("a", "b", "c"):
+        assert cache.get(key, 1) is None
+        cache.put(key, 1, {"diagnosis": key})
+    assert cache.get("a", 1) is None
+    assert cache.get("c", 1) == {"diagnosis": "c"}
+    assert cache.get("c", 2) is None
+    assert cache.stats()["entries"] == 0
+
+    # A caller with the previous version neither hits nor clears the cache
+    cache.put("d", 2, {"diagnosis": "d"})
+    assert cache.get("d", 1) is None
+    cache.put("d", 1, {"diagnosis": "stale"})
+    assert cache.get("d", 2) == {"diagnosis": "d"}
+    assert cache.stats()["version"] == 2
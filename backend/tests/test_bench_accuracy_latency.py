@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+pytest.importorskip("cv2")
+
+import bench_accuracy_latency as bench
+
+
+def test_pareto_frontier_keeps_only_undominated_settings():
+    results = [
+        {"name": "fast", "ms_per_page": 50.0, "accuracy": 0.6},
+        {"name": "slow_and_worse", "ms_per_page": 80.0, "accuracy": 0.5},
+        {"name": "balanced", "ms_per_page": 100.0, "accuracy": 0.9},
+        {"name": "tied_but_slower", "ms_per_page": 120.0, "accuracy": 0.9},
+        {"name": "best", "ms_per_page": 300.0, "accuracy": 0.95},
+    ]
+    frontier = bench.pareto_frontier(results)
+    assert [result["name"] for result in frontier] == ["fast", "balanced", "best"]
+    assert bench.recommend(frontier, 0.85)["name"] == "balanced"
+    assert bench.recommend(frontier, 0.99) is None
+
+
+def test_labels_cover_every_parsed_field():
+    with open(bench.LABELS_PATH, "r", encoding="utf-8") as f:
+        labels = json.load(f)
+    for entry in labels.values():
+        parsed = bench.PARSERS[entry["file_format"]]("").parse()
+        assert set(entry["fields"]) == set(parsed)
+
+
+def test_evaluate_scores_synthetic_documents():
+    documents = bench.load_corpus(labels_path=None, synthetic=1)
+    assert [document["file_format"] for document in documents] == ["prescription", "patient_details"]
+    setting = dict(bench.DEFAULT_SETTING, scale=1.0, psm="6")
+    result = bench.evaluate(documents, setting)
+    assert 0.0 <= result["accuracy"] <= result["similarity"] <= 1.0
+    assert result["ms_per_page"] > 0 and result["psm"] == "6"
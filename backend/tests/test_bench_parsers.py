@@ -0,0 +1,40 @@
+import logging
+
+import bench_parsers as bench
+
+
+def test_corpus_is_deterministic_and_covers_every_kind():
+    documents = bench.corpus(24, seed=3, scale=0.2)
+    assert documents == bench.corpus(24, seed=3, scale=0.2)
+    assert {doc["kind"] for doc in documents} == set(bench.KINDS)
+    assert {doc["file_format"] for doc in documents} == set(bench.FORMATS)
+
+
+def test_parsers_return_every_field_on_adversarial_text():
+    logging.disable(logging.INFO)
+    try:
+        documents = bench.corpus(36, seed=1, scale=0.2)
+        report = bench.run(documents, repeat=1)
+    finally:
+        logging.disable(logging.NOTSET)
+    assert set(report) == set(bench.TARGETS)
+    assert all(result["documents"] == 36 and result["worst_ms"] > 0 for result in report.values())
+
+    fields = {"prescription": bench.PrescriptionParser("").parse(),
+              "patient_details": bench.PatientDetailsParser("").parse()}
+    for doc in documents:
+        for file_format, parser_class in (("prescription", bench.PrescriptionParser),
+                                          ("patient_details", bench.PatientDetailsParser)):
+            parsed = parser_class(doc["text"]).parse()
+            assert set(parsed) == set(fields[file_format])
+            assert all(value is None or isinstance(value, str) for value in parsed.values())
+
+
+def test_compare_flags_regressions_beyond_the_threshold():
+    baseline = {"prescription": {"docs_per_sec": 1000.0, "worst_ms": 10.0}}
+    steady = {"prescription": {"docs_per_sec": 900.0, "worst_ms": 12.0, "worst_kind": "long"}}
+    assert bench.compare(steady, baseline, max_regression=0.25) == []
+
+    slower = {"prescription": {"docs_per_sec": 700.0, "worst_ms": 14.0, "worst_kind": "blank_runs"}}
+    assert len(bench.compare(slower, baseline, max_regression=0.25)) == 2
+    assert len(bench.compare(steady, None, max_worst_ms=5.0)) == 1
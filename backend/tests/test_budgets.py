@@ -0,0 +1,109 @@
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+
+import budgets
+from extractor import convert_pdf_to_images, extract
+from PIL import Image
+
+
+def write_pdf(path, pages):
+    images = [Image.fromarray(np.full((240, 210, 3), 255 - i, dtype=np.uint8)) for i in range(pages)]
+    images[0].save(path, save_all=True, append_images=images[1:])
+
+
+def test_page_limit_skips_trailing_pages(tmp_path):
+    pdf_path = str(tmp_path / "long.pdf")
+    write_pdf(pdf_path, 4)
+    budget = budgets.Budget(max_pages=2)
+    assert len(convert_pdf_to_images(pdf_path, budget)) == 2
+    assert budget.report()["skipped_pages"] == [{"page": 3, "reason": "page_limit"},
+                                                {"page": 4, "reason": "page_limit"}]
+
+
+def test_large_pages_are_downsampled_or_tiled():
+    img = np.full((4000, 3000), 255, dtype=np.uint8)
+
+    # 12 MP into 4 MP keeps 58% of the resolution: downsample
+    [small] = budgets.Budget(max_page_megapixels=4, min_scale=0.5).fit(img, 1)
+    assert small.shape[0] * small.shape[1] <= 4.04e6
+
+    # Below min_scale: scale to 90% and tile
+    budget = budgets.Budget(max_page_megapixels=4, min_scale=0.9)
+    tiles = budget.fit(img, 1)
+    assert len(tiles) > 1 and all(tile.shape[1] == 2700 for tile in tiles)
+    assert sum(tile.shape[0] for tile in tiles) >= 3600
+    assert budget.report()["degraded_pages"][0]["action"] == "tiled"
+
+
+def test_decode_reduction_never_goes_below_the_target_scale():
+    budget = budgets.Budget(max_page_megapixels=4, min_scale=0.1)
+    assert budget.decode_reduction((1000, 1000)) == 1
+    assert budget.decode_reduction((8000, 8000)) == 4
+    assert budgets.Budget(max_page_megapixels=4, min_scale=0.5).decode_reduction((8000, 8000)) == 2
+
+
+def test_exhausted_time_budget_returns_partial_result(tmp_path, monkeypatch):
+    pdf_path = str(tmp_path / "slow.pdf")
+    write_pdf(pdf_path, 2)
+    monkeypatch.setenv("RXTRACT_MAX_SECONDS", "0")
+
+    data = extract(pdf_path, "prescription")
+    assert "error" not in data and data["partial"] is True
+    report = data["processing_info"]["budget"]
+    assert report["pages_processed"] == 0
+    assert {skip["reason"] for skip in report["skipped_pages"]} == {"time_limit"}
+
+
+def test_image_size_reads_decompression_bombs_without_lifting_the_limit(monkeypatch):
+    buffer = io.BytesIO()
+    Image.new("L", (300, 200)).save(buffer, format="PNG")
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    assert budgets.image_size(buffer.getvalue()) == (300, 200)
+    assert Image.MAX_IMAGE_PIXELS == 1000
+    with pytest.raises(Image.DecompressionBombError):
+        Image.open(io.BytesIO(buffer.getvalue()))
+
+
+def test_decode_limit_skips_even_the_first_page_of_formats_decoded_in_full():
+    budget = budgets.Budget(max_page_megapixels=4, min_scale=0.1, max_decode_megapixels=16)
+    # A JPEG decoded at 1/4 size fits, the same page as a PNG does not
+    assert budget.decode_reduction((8000, 8000), reducible=False) == 1
+    assert not budget.admit(1, (8000, 8000), reducible=False)
+    assert budget.admit(2, (8000, 8000), reducible=True)
+    assert budget.report()["skipped_pages"] == [{"page": 1, "reason": "decode_limit"}]
+
+
+PEAK_MEMORY_SCRIPT = """
+import resource, sys
+import extractor
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+pages = extractor.load_image_file(sys.argv[1], extractor.budgets.Budget.from_env())
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(len(pages), (after - before) // 1024)
+"""
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="reads ru_maxrss in KiB, as on Linux")
+def test_oversized_png_is_skipped_before_it_is_decoded(tmp_path):
+    # 64 MP: 192 MB once decoded as BGR, a few hundred KB as a PNG
+    png_path = str(tmp_path / "huge.png")
+    cv2.imwrite(png_path, np.full((8000, 8000, 3), 255, dtype=np.uint8))
+
+    def peak_mb(max_decode_megapixels):
+        env = dict(os.environ, RXTRACT_MAX_DECODE_MEGAPIXELS=str(max_decode_megapixels),
+                   PYTHONPATH=os.pathsep.join(sys.path))
+        output = subprocess.run([sys.executable, "-c", PEAK_MEMORY_SCRIPT, png_path], env=env,
+                                capture_output=True, text=True, check=True).stdout.split()
+        return int(output[-2]), int(output[-1])
+
+    pages, decoded_mb = peak_mb(100)
+    assert pages == 1 and decoded_mb >= 100
+    pages, skipped_mb = peak_mb(50)
+    assert pages == 0 and skipped_mb < 20
@@ -0,0 +1,71 @@
+import json
+import os
+
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+
+import bulk_extract
+
+
+@pytest.fixture()
+def archive(tmp_path):
+    archive_dir = tmp_path / "archive"
+    (archive_dir / "2024" / "01").mkdir(parents=True)
+    img = np.full((120, 200), 255, dtype=np.uint8)
+    cv2.imwrite(str(archive_dir / "2024" / "01" / "a.png"), img)
+    cv2.imwrite(str(archive_dir / "2024" / "b.jpg"), img)
+    # A PNG saved without an extension is still detected by its content
+    (archive_dir / "c_scan").write_bytes(cv2.imencode(".png", img)[1].tobytes())
+    (archive_dir / "notes.txt").write_text("not a document")
+    return archive_dir
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_detect_file_type(archive):
+    assert bulk_extract.detect_file_type(archive / "2024" / "b.jpg") == ".jpg"
+    assert bulk_extract.detect_file_type(archive / "c_scan") == ".png"
+    assert bulk_extract.detect_file_type(archive / "notes.txt") is None
+
+
+def test_run_and_resume(archive, tmp_path):
+    output = str(tmp_path / "results.jsonl")
+    checkpoint = output + ".checkpoint"
+    # Pretend an earlier run finished one file before being interrupted
+    with open(checkpoint, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"path": os.path.join("2024", "b.jpg")}) + "\n")
+
+    summary = bulk_extract.run(str(archive), output, "prescription", workers=2)
+    assert summary == {"processed": 2, "failed": 0, "skipped": 1, "unsupported": 1}
+    records = read_jsonl(output)
+    assert sorted(record["path"] for record in records) == [os.path.join("2024", "01", "a.png"), "c_scan"]
+    assert all(record["data"]["refill"] == "3" for record in records)
+
+    summary = bulk_extract.run(str(archive), output, "prescription", workers=2)
+    assert summary["processed"] == 0 and summary["skipped"] == 3
+    assert len(read_jsonl(output)) == 2
+
+
+def crash_on_b(input_dir, rel_path, file_ext, file_format):
+    if rel_path.endswith("b.jpg"):
+        os._exit(1)
+    return {"path": rel_path, "file_type": file_ext.lstrip("."), "file_format": file_format, "data": {}}
+
+
+def test_dead_worker_fails_only_its_document(archive, tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk_extract, "_process", crash_on_b)
+    output = str(tmp_path / "results.jsonl")
+
+    summary = bulk_extract.run(str(archive), output, "prescription", workers=2)
+    assert summary == {"processed": 3, "failed": 1, "skipped": 0, "unsupported": 1}
+    records = {record["path"]: record for record in read_jsonl(output)}
+    assert "Worker process died" in records[os.path.join("2024", "b.jpg")]["error"]
+    assert "data" in records["c_scan"] and "data" in records[os.path.join("2024", "01", "a.png")]
+
+    # The crashing document is checkpointed and not resubmitted on resume
+    assert bulk_extract.run(str(archive), output, "prescription", workers=2)["skipped"] == 3
@@ -0,0 +1,77 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import coarse_to_fine
+import ocr_engine
+
+
+class FakeEngine:
+    """Reads "Lialda 2.4 gram" poorly on the coarse page and correctly on a line crop"""
+
+    def __init__(self):
+        self.calls = []
+
+    def image_to_data(self, img, lang="eng", config=""):
+        self.calls.append((img.shape, config))
+        if config == coarse_to_fine.LINE_CONFIG:
+            return words_to_data([(1, 1, "Lialda", 0, 91.0), (1, 1, "2.4", 60, 90.0), (1, 1, "gram", 90, 92.0)])
+        return words_to_data([
+            (1, 1, "Prednisone", 0, 96.0), (1, 1, "20", 60, 95.0), (1, 1, "mg", 80, 94.0),
+            (1, 2, "Lia1da", 0, 41.0), (1, 2, "2.4", 60, 88.0), (1, 2, "qram", 80, 52.0),
+            (2, 1, "Refill:", 0, 93.0), (2, 1, "3", 60, 97.0),
+        ])
+
+
+def words_to_data(words):
+    data = {column: [] for column in ocr_engine.TSV_COLUMNS}
+    for block, line, text, left, conf in words:
+        row = [5, 1, block, 1, line, 1, left, 20 * line + 40 * block, 18, 15, conf, text]
+        for column, value in zip(ocr_engine.TSV_COLUMNS, row):
+            data[column].append(value)
+    return data
+
+
+def test_parse_tsv_matches_pytesseract_dict_layout():
+    tsv = ("level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext\n"
+           "1\t1\t0\t0\t0\t0\t0\t0\t640\t480\t-1\t\n"
+           "5\t1\t1\t1\t1\t1\t36\t92\t60\t24\t96.51\tLialda\n")
+    data = ocr_engine.parse_tsv(tsv)
+    assert data["level"] == [1, 5]
+    assert data["conf"] == [-1.0, 96.51]
+    assert data["text"] == ["", "Lialda"]
+    assert data["left"][1] == 36
+
+
+def test_only_low_confidence_lines_are_refined():
+    engine = FakeEngine()
+    page = np.full((400, 300, 3), 255, dtype=np.uint8)
+    coarse = np.full((300, 225), 255, dtype=np.uint8)
+
+    words, stats = coarse_to_fine.coarse_to_fine_ocr(engine, page, coarse)
+
+    assert words.text == "Prednisone 20 mg\nLialda 2.4 gram\n\nRefill: 3\n"
+    # Word boxes are in original page pixels, refined words included
+    lialda = words.locate("Lialda")
+    assert lialda["confidence"] == 91.0 and lialda["page"] == 1
+    # Line crop starts at 80 / 0.75 - LINE_PADDING = 101; the word is 60 / FINE_SCALE below it
+    assert lialda["box"][:2] == [0, 141]
+    assert stats == {"lines": 3, "low_confidence_lines": 1, "refined_lines": 1}
+    # One coarse pass plus one line crop, taken from the full-resolution page
+    assert [config for _, config in engine.calls] == ["--psm 6 --oem 3", coarse_to_fine.LINE_CONFIG]
+
+
+def test_extract_with_coarse_to_fine_strategy(tmp_path):
+    cv2 = pytest.importorskip("cv2")
+    from extractor import extract
+
+    image_path = str(tmp_path / "scan.png")
+    cv2.imwrite(image_path, np.full((200, 160, 3), 255, dtype=np.uint8))
+
+    data = extract(image_path, "prescription", ocr_strategy="coarse_to_fine")
+    assert data.pop("processing_info")["coarse_to_fine"][0]["page"] == 1
+    # The stub engine reads the same text either way, so the fields must agree
+    full = extract(image_path, "prescription", ocr_strategy="full")
+    full.pop("processing_info", None)
+    assert data == full
+    assert "error" in extract(image_path, "prescription", ocr_strategy="bogus")
@@ -0,0 +1,71 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import doc_classifier
+import ocr_engine
+
+PATIENT_RECORD_TEXT = """17/12/2020
+
+Patient Medical Record
+
+Patient Information Birth Date
+Jerry Lucas May 2 1998
+(279) 920-8204 Weight:
+
+In Case of Emergency
+Joe Lucas
+
+General Medical History
+Chicken Pox (Varicella): Yes
+
+Immunizations
+Influenza: Yes
+"""
+
+
+def test_classify_text():
+    assert doc_classifier.classify_text(ocr_engine.STUB_OCR_TEXT)[0] == "prescription"
+    file_format, confidence, scores = doc_classifier.classify_text(PATIENT_RECORD_TEXT)
+    assert file_format == "patient_details"
+    assert confidence == 1.0 and scores["prescription"] == 0
+    # No evidence either way is inconclusive rather than a guess
+    assert doc_classifier.classify_text("lorem ipsum")[0] is None
+
+
+class HeaderEngine:
+    def __init__(self, text):
+        self.text = text
+        self.shapes = []
+
+    def image_to_string(self, img, lang="eng", config=""):
+        self.shapes.append(img.shape)
+        return self.text
+
+
+def test_classify_document_ocrs_a_downsampled_header():
+    engine = HeaderEngine("Patient Medical Record\nPatient Information Birth Date")
+    page = np.full((1000, 800, 3), 255, dtype=np.uint8)
+    result = doc_classifier.classify_document("scan.png", ".png", [page], engine=engine)
+    assert result["file_format"] == "patient_details"
+    assert result["method"] == "header_ocr"
+    assert result["seconds"] >= 0
+    # Top 35% of the page at half scale
+    assert engine.shapes == [(175, 400)]
+
+
+def test_extract_auto_routes_and_reports_classification(tmp_path):
+    cv2 = pytest.importorskip("cv2")
+    from extractor import extract
+
+    image_path = str(tmp_path / "scan.png")
+    cv2.imwrite(image_path, np.full((200, 160, 3), 255, dtype=np.uint8))
+
+    data = extract(image_path, "auto")
+    classification = data.pop("processing_info")["classification"]
+    assert classification["file_format"] == "prescription"
+    assert classification["method"] in ("header_ocr", "full_text")
+    assert 0 < classification["confidence"] <= 1
+    explicit = extract(image_path, "prescription")
+    explicit.pop("processing_info", None)
+    assert data == explicit
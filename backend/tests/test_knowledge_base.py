@@ -0,0 +1,153 @@
+import json
+import os
+
+import pytest
+
+import fuzzy_match
+import knowledge_base
+
+SOURCE = {
+    "version": 7,
+    "medications": {
+        "lialda": {"synonyms": ["mesalamine", "Asacol HD"], "uses": ["ulcerative colitis"]},
+        "prednisone": {"synonyms": ["deltasone"], "uses": ["inflammation"]},
+        "metformin": {"synonyms": [], "uses": ["type 2 diabetes"]},
+    },
+    "conditions": {
+        "ulcerative colitis": {"synonyms": [], "diet": "Low fiber during flares."},
+    },
+    "interactions": [
+        {"drugs": ["prednisone", "mesalamine"], "severity": "minor", "description": "Watch for GI upset."},
+        {"drugs": ["lialda", "metformin"], "severity": "major", "description": "Not a real interaction."},
+    ],
+}
+
+
+@pytest.fixture
+def kb(tmp_path):
+    source_path = tmp_path / "kb.json"
+    source_path.write_text(json.dumps(SOURCE))
+    index_path = knowledge_base.build_index(str(source_path), str(tmp_path / "kb.idx"))
+    kb = knowledge_base.KnowledgeBase(index_path)
+    yield kb
+    kb.close()
+
+
+def test_lookup_by_normalized_name_and_synonym(kb):
+    assert kb.version == 7
+    assert len(kb) == 4
+    assert kb.lookup("Lialda")["name"] == "lialda"
+    assert kb.lookup("  ASACOL-hd ")["name"] == "lialda"
+    assert kb.lookup("deltasone")["uses"] == ["inflammation"]
+    assert kb.lookup("ulcerative colitis", "condition")["diet"] == "Low fiber during flares."
+    assert kb.lookup("ulcerative colitis") is None
+    assert kb.lookup("metformin")["name"] == "metformin"
+    assert kb.lookup("losartan") is None
+
+
+def test_find_in_text_returns_canonical_names_in_kb_order(kb):
+    text = "Deltasone 20 mg\nMesalamine 2.4 gram for Ulcerative\nColitis; lialda again"
+    assert kb.find_in_text(text) == ["lialda", "prednisone"]
+    assert kb.find_in_text(text, "condition") == ["ulcerative colitis"]
+    assert sorted(name for name, _ in kb.names()) == ["asacol hd", "deltasone", "lialda", "mesalamine",
+                                                      "metformin", "prednisone"]
+
+
+def test_interactions_are_found_pairwise_by_any_name(kb):
+    assert kb.interaction_count == 2
+    assert kb.interactions(["Deltasone", "lialda"]) == [
+        {"drugs": ["prednisone", "lialda"], "severity": "minor", "description": "Watch for GI upset."}
+    ]
+    found = kb.interactions(["metformin", "prednisone", "unknown drug", "asacol hd"])
+    assert [(item["drugs"], item["severity"]) for item in found] == [
+        (["metformin", "lialda"], "major"), (["prednisone", "lialda"], "minor")
+    ]
+    assert kb.interactions(["metformin", "prednisone"]) == []
+
+
+def test_interactions_must_name_known_medications(tmp_path):
+    source_path = tmp_path / "kb.json"
+    source_path.write_text(json.dumps(dict(SOURCE, interactions=[{"drugs": ["lialda", "warfarin"], "severity": "major"}])))
+    with pytest.raises(ValueError, match="warfarin"):
+        knowledge_base.build_index(str(source_path), str(tmp_path / "kb.idx"))
+
+
+def test_index_is_rebuilt_when_source_changes(tmp_path, monkeypatch):
+    source_path = tmp_path / "kb.json"
+    index_path = tmp_path / "cache" / "kb.idx"
+    source_path.write_text(json.dumps(SOURCE))
+    monkeypatch.setenv("RXTRACT_KB_SOURCE", str(source_path))
+    monkeypatch.setenv("RXTRACT_KB_INDEX", str(index_path))
+    monkeypatch.setattr(knowledge_base, "_knowledge_base", None)
+
+    assert knowledge_base.get_knowledge_base().version == 7
+    assert knowledge_base._index_is_current(str(index_path), str(source_path))
+
+    source_path.write_text(json.dumps(dict(SOURCE, version=8)))
+    os.utime(source_path, ns=(1, 1))
+    assert not knowledge_base._index_is_current(str(index_path), str(source_path))
+    monkeypatch.setattr(knowledge_base, "_knowledge_base", None)
+    assert knowledge_base.get_knowledge_base().version == 8
+
+
+def test_edit_distance_counts_transpositions_and_stops_early():
+    assert fuzzy_match.edit_distance("lialda", "lia1da", 2) == 1
+    assert fuzzy_match.edit_distance("prednisone", "perdnisone", 2) == 1
+    assert fuzzy_match.edit_distance("metformin", "metfornim", 1) == 2
+    assert fuzzy_match.edit_distance("losartan", "lisinopril", 2) == 3
+
+
+def test_fuzzy_find_resolves_ocr_misreads_with_confidence(kb):
+    match = kb.fuzzy_find("Lia1da")
+    assert (match["name"], match["matched"], match["distance"], match["confidence"]) == ("lialda", "lialda", 1, 0.833)
+    assert kb.fuzzy_find("mesa1amlne")["name"] == "lialda"
+    assert kb.fuzzy_find("prednisone")["distance"] == 0
+    # Too short to be matched fuzzily, and too far from anything
+    assert kb.fuzzy_find("lial") is None
+    assert kb.fuzzy_find("directions") is None
+
+
+def test_match_text_falls_back_to_fuzzy_matches(kb):
+    text = "Prednisone 20 md\nLia1da 2.4 gram\nmetf0rmin"
+    assert kb.find_in_text(text) == ["prednisone"]
+    assert kb.match_text(text, fuzzy=True) == [
+        {"name": "lialda", "text": "lia1da", "confidence": 0.833},
+        {"name": "prednisone", "text": "prednisone", "confidence": 1.0},
+        {"name": "metformin", "text": "metf0rmin", "confidence": 0.889},
+    ]
+
+
+def test_running_process_picks_up_a_rebuilt_index(tmp_path, monkeypatch):
+    from smoldocling_analyzer import SmolDoclingAnalyzer, analysis_cache
+
+    source_path = tmp_path / "kb.json"
+    index_path = tmp_path / "kb.idx"
+    source_path.write_text(json.dumps(SOURCE))
+    monkeypatch.setenv("RXTRACT_KB_SOURCE", str(source_path))
+    monkeypatch.setenv("RXTRACT_KB_INDEX", str(index_path))
+    monkeypatch.setattr(knowledge_base, "_knowledge_base", None)
+    monkeypatch.setattr(knowledge_base, "CHECK_INTERVAL", 3600)
+
+    SmolDoclingAnalyzer(mode="rules")._analyze_regimen([], [])
+    assert analysis_cache.stats()["version"] == knowledge_base.get_knowledge_base().content_id
+
+    # Rebuilt by another process (e.g. knowledge_base.py build): seen after CHECK_INTERVAL
+    source_path.write_text(json.dumps(dict(SOURCE, version=8)))
+    knowledge_base.build_index(str(source_path), str(index_path))
+    assert knowledge_base.get_knowledge_base().version == 7
+    monkeypatch.setattr(knowledge_base, "CHECK_INTERVAL", 0)
+    assert knowledge_base.get_knowledge_base().version == 8
+
+    # An edited source is recompiled in-process
+    source_path.write_text(json.dumps(dict(SOURCE, version=9)))
+    os.utime(source_path, ns=(1, 1))
+    assert knowledge_base.get_knowledge_base().version == 9
+    SmolDoclingAnalyzer(mode="rules")._analyze_regimen([], [])
+    cached_version = analysis_cache.stats()["version"]
+    assert cached_version == (str(index_path), source_path.stat().st_size, 1)
+
+    # Edited without bumping the version: the cached analyses are still dropped
+    source_path.write_text(json.dumps(dict(SOURCE, version=9, edited=True)))
+    SmolDoclingAnalyzer(mode="rules")._analyze_regimen([], [])
+    assert knowledge_base.get_knowledge_base().version == 9
+    assert analysis_cache.stats()["version"] == knowledge_base.get_knowledge_base().content_id != cached_version
@@ -0,0 +1,37 @@
+import pytest
+
+pytest.importorskip("uvicorn")
+pytest.importorskip("fastapi")
+
+import loadtest
+
+
+def test_percentile_nearest_rank():
+    values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+    assert loadtest.percentile(values, 50) == 5
+    assert loadtest.percentile(values, 90) == 9
+    assert loadtest.percentile(values, 99) == 10
+    assert loadtest.percentile([], 50) is None
+
+
+def test_find_saturation_stops_when_throughput_flattens():
+    levels = [
+        {"level": 1, "throughput_rps": 10.0, "error_rate": 0.0},
+        {"level": 2, "throughput_rps": 19.0, "error_rate": 0.0},
+        {"level": 4, "throughput_rps": 20.0, "error_rate": 0.0},
+        {"level": 8, "throughput_rps": 40.0, "error_rate": 0.0},
+    ]
+    assert loadtest.find_saturation(levels)["level"] == 2
+
+
+def test_closed_loop_against_stub_server():
+    documents = loadtest.load_documents("prescription:1,patient_details:1")
+    with loadtest.ServerProcess(ocr_engine="stub", stub_latency_ms=5) as server:
+        report = loadtest.run(server.url, documents, "concurrency", [1, 2], duration=1.5, warmup=0.5)
+
+    assert [level["level"] for level in report["levels"]] == [1, 2]
+    for level in report["levels"]:
+        assert level["ok"] > 0
+        assert level["errors"] == 0, level["error_samples"]
+        assert level["latency_ms"]["p50"] is not None
+    assert report["saturation"] is not None
@@ -0,0 +1,122 @@
+import io
+import json
+
+import pytest
+
+pytest.importorskip("fastapi")
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import main
+
+
+@pytest.fixture()
+def client():
+    return TestClient(main.app)
+
+
+@pytest.fixture()
+def page_png():
+    img = np.full((200, 300), 255, dtype=np.uint8)
+    cv2.putText(img, "Refill: 3", (10, 100), cv2.FONT_HERSHEY_SIMPLEX, 1, 0, 2)
+    return cv2.imencode(".png", img)[1].tobytes()
+
+
+def parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_extract_from_doc(client, page_png):
+    response = client.post(
+        "/extract_from_doc",
+        files={"file": ("page.png", page_png, "image/png")},
+        data={"file_format": "prescription"}
+    )
+    assert response.status_code == 200
+    assert response.json()["refill"] == "3"
+
+
+def test_stream_reports_progress_then_result(client, page_png):
+    response = client.post(
+        "/extract_from_doc/stream",
+        files={"file": ("page.png", page_png, "image/png")},
+        data={"file_format": "prescription"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = parse_sse(response.text)
+    stages = [data["stage"] for event, data in events if event == "progress"]
+    assert stages == ["decoded", "ocr", "parsed", "analyzed"]
+    event, data = events[-1]
+    assert event == "result"
+    assert data["patient_name"].startswith("Marta Sharapova")
+
+
+def test_ndjson_streams_pages_then_merged_result(client, page_png):
+    pages = [Image.open(io.BytesIO(page_png)).convert("RGB") for _ in range(2)]
+    pdf = io.BytesIO()
+    pages[0].save(pdf, format="PDF", save_all=True, append_images=pages[1:])
+    response = client.post(
+        "/extract_from_doc",
+        files={"file": ("record.pdf", pdf.getvalue(), "application/pdf")},
+        data={"file_format": "prescription"},
+        headers={"Accept": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["event"] for line in lines] == ["page", "page", "result"]
+    assert [line["page"] for line in lines[:2]] == [1, 2]
+    assert lines[0]["fields"]["refill"] == "3"
+    assert "Refill" in lines[1]["text"]
+    assert lines[-1]["data"]["refill"] == "3"
+
+
+def test_stream_rejects_invalid_format(client, page_png):
+    response = client.post(
+        "/extract_from_doc/stream",
+        files={"file": ("page.png", page_png, "image/png")},
+        data={"file_format": "invoice"}
+    )
+    assert response.status_code == 400
+
+
+def test_profiling_requires_admin_token(client, page_png, monkeypatch):
+    monkeypatch.delenv("RXTRACT_ADMIN_TOKEN", raising=False)
+    response = client.post(
+        "/extract_from_doc",
+        files={"file": ("page.png", page_png, "image/png")},
+        data={"file_format": "prescription"},
+        headers={"X-Profile": "cprofile"}
+    )
+    assert response.status_code == 404
+    monkeypatch.setenv("RXTRACT_ADMIN_TOKEN", "secret")
+    assert client.get("/admin/profiles", headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+
+def test_profiled_request_can_be_downloaded(client, page_png, monkeypatch):
+    monkeypatch.setenv("RXTRACT_ADMIN_TOKEN", "secret")
+    admin = {"X-Admin-Token": "secret"}
+    response = client.post(
+        "/extract_from_doc",
+        files={"file": ("page.png", page_png, "image/png")},
+        data={"file_format": "prescription"},
+        headers=dict(admin, **{"X-Profile": "cprofile"})
+    )
+    assert response.status_code == 200
+    profile_id = response.headers["X-Profile-Id"]
+
+    summary = client.get(f"/admin/profiles/{profile_id}", headers=admin).json()
+    assert {row["stage"] for row in summary["stages"]} >= {"decoded", "ocr", "parsed", "analyzed"}
+    assert profile_id in [profile["id"] for profile in client.get("/admin/profiles", headers=admin).json()["profiles"]]
+    download = client.get(f"/admin/profiles/{profile_id}/cpu.prof", headers=admin)
+    assert download.status_code == 200 and download.content
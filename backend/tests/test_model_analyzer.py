@@ -0,0 +1,140 @@
+import threading
+import time
+
+import pytest
+
+import model_analyzer
+from smoldocling_analyzer import SmolDoclingAnalyzer
+from ocr_engine import STUB_OCR_TEXT
+
+
+class RecordingBackend:
+    def __init__(self, output="Hypertension\nRoutine: Walk daily.\nDiet: Low sodium.", delay=0.0):
+        self.output = output
+        self.delay = delay
+        self.batch_sizes = []
+
+    def __call__(self, prompts):
+        self.batch_sizes.append(len(prompts))
+        time.sleep(self.delay)
+        return [self.output] * len(prompts)
+
+
+@pytest.fixture
+def use_engine(monkeypatch):
+    def install(engine):
+        monkeypatch.setattr(model_analyzer, "_engine", engine)
+        return engine
+    return install
+
+
+def test_concurrent_requests_are_batched():
+    backend = RecordingBackend(delay=0.01)
+    engine = model_analyzer.BatchingEngine(backend, max_batch_size=4, max_wait_ms=200)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(engine.generate("prompt", timeout=5)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 8
+    assert sum(backend.batch_sizes) == 8
+    assert max(backend.batch_sizes) == 4
+    assert len(backend.batch_sizes) < 8
+
+
+def test_parse_sections_continues_the_diagnosis_prompt():
+    sections = model_analyzer.parse_sections(" Ulcerative colitis\nRoutine: Rest.\nmore rest\nDiet: Fiber.")
+    assert sections == {"diagnosis": "Ulcerative colitis", "routine": "Rest. more rest", "diet": "Fiber."}
+
+
+class WordTokenizer:
+    """One token per whitespace-separated word, plus a leading special token"""
+
+    def encode(self, text, add_special_tokens=True):
+        return (["<s>"] if add_special_tokens else []) + text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+def test_long_prompts_keep_the_instructions_and_the_cue():
+    tokenizer = WordTokenizer()
+    ocr_text = " ".join(f"word{i}" for i in range(2000))
+    prompt = model_analyzer.build_prompt(ocr_text, ["prednisone"], [], tokenizer=tokenizer, max_tokens=100)
+    assert len(tokenizer.encode(prompt)) <= 100
+    assert prompt.startswith("You are a clinical assistant.")
+    assert prompt.endswith("\n\nDiagnosis:")
+    assert "word0 word1" in prompt and "word1999" not in prompt
+
+    short = model_analyzer.build_prompt("Name: Marta", [], [], tokenizer=tokenizer, max_tokens=100)
+    assert short == model_analyzer.build_prompt("Name: Marta", [], [])
+
+
+class SingleThreadTokenizer(WordTokenizer):
+    """Records calls that overlap, as a fast tokenizer would fail on them"""
+
+    def __init__(self):
+        self.in_use = threading.Lock()
+        self.overlaps = 0
+
+    def encode(self, text, add_special_tokens=True):
+        if not self.in_use.acquire(blocking=False):
+            self.overlaps += 1
+            return super().encode(text, add_special_tokens)
+        try:
+            time.sleep(0.001)
+            return super().encode(text, add_special_tokens)
+        finally:
+            self.in_use.release()
+
+
+def test_backend_prompts_use_the_tokenizer_one_thread_at_a_time():
+    backend = model_analyzer.TransformersBackend("unused-checkpoint")
+    backend.tokenizer = SingleThreadTokenizer()
+    ocr_text = " ".join(f"word{i}" for i in range(1000))
+    threads = [threading.Thread(target=backend.build_prompt, args=(ocr_text, [], [])) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert backend.tokenizer.overlaps == 0
+
+
+def test_model_mode_uses_model_sections_and_knowledge_base_warnings(use_engine):
+    use_engine(model_analyzer.BatchingEngine(RecordingBackend(), max_wait_ms=1))
+    rules = SmolDoclingAnalyzer(mode="rules").analyze_prescription(STUB_OCR_TEXT)
+    result = SmolDoclingAnalyzer(mode="model", model_timeout=5).analyze_prescription(STUB_OCR_TEXT)
+    assert result["analysis_source"] == "model"
+    assert (result["diagnosis"], result["routine"], result["diet"]) == ("Hypertension", "Walk daily.", "Low sodium.")
+    assert result["warnings"] == rules["warnings"]
+
+
+def test_model_mode_falls_back_to_rules_on_timeout(use_engine):
+    use_engine(model_analyzer.BatchingEngine(RecordingBackend(delay=1.0), max_wait_ms=1))
+    rules = SmolDoclingAnalyzer(mode="rules").analyze_prescription(STUB_OCR_TEXT)
+    result = SmolDoclingAnalyzer(mode="model", model_timeout=0.05).analyze_prescription(STUB_OCR_TEXT)
+    assert result.pop("analysis_source") == "rules"
+    assert result == rules
+
+
+def test_tiny_random_model_generates_in_batches(tmp_path):
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    tokenizers = pytest.importorskip("tokenizers")
+
+    vocab = {token: i for i, token in enumerate(["[PAD]", "[UNK]", "[EOS]"] + list("abcdefghijklmnopqrstuvwxyz:,. \n"))}
+    tokenizer = tokenizers.Tokenizer(tokenizers.models.WordLevel(vocab, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = tokenizers.pre_tokenizers.Split("", "isolated")
+    fast_tokenizer = transformers.PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, pad_token="[PAD]", unk_token="[UNK]", eos_token="[EOS]"
+    )
+    fast_tokenizer.save_pretrained(tmp_path)
+    torch.manual_seed(0)
+    config = transformers.GPT2Config(vocab_size=len(vocab), n_positions=1024, n_embd=16, n_layer=1, n_head=2)
+    transformers.GPT2LMHeadModel(config).save_pretrained(tmp_path)
+
+    backend = model_analyzer.TransformersBackend(str(tmp_path), precision="int8", max_new_tokens=3)
+    outputs = backend(["diagnosis:", "a longer prompt, diagnosis:"])
+    assert len(outputs) == 2 and all(isinstance(output, str) for output in outputs)
@@ -0,0 +1,69 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+
+import extractor
+import ocr_cache
+import ocr_engine
+
+
+class CountingEngine(ocr_engine.StubEngine):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def image_to_string(self, img, lang="eng", config=""):
+        self.calls.append(("image_to_string", config))
+        return super().image_to_string(img, lang, config)
+
+    def image_to_data(self, img, lang="eng", config=""):
+        self.calls.append(("image_to_data", config))
+        return super().image_to_data(img, lang, config)
+
+
+def test_results_are_keyed_by_pixels_and_ocr_call(tmp_path):
+    engine = CountingEngine()
+    cached = ocr_cache.CachedEngine(engine, ocr_cache.OCRCache(str(tmp_path)))
+    page = np.full((40, 30), 255, dtype=np.uint8)
+
+    text = cached.image_to_string(page, config="--psm 6 --oem 3")
+    assert cached.image_to_string(page.copy(), config="--psm 6 --oem 3") == text
+    assert len(engine.calls) == 1
+
+    cached.image_to_string(page, config="--psm 4 --oem 3")
+    data = cached.image_to_data(page, config="--psm 6 --oem 3")
+    page[0, 0] = 0
+    cached.image_to_string(page, config="--psm 6 --oem 3")
+    assert len(engine.calls) == 4
+
+    assert cached.image_to_data(page.copy() * 0 + 255, config="--psm 6 --oem 3") == data
+    assert len(engine.calls) == 4
+    assert cached.cache.stats()["hits"] == 2
+    assert cached.name == "stub"
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ocr_cache.OCRCache(str(tmp_path), max_bytes=1000)
+    keys = [f"{i:02d}" + "0" * 38 for i in range(6)]
+    for key in keys:
+        cache.put(key, "stub", "x" * 300)
+    assert cache.stats()["bytes"] <= 1000
+    assert cache.get(keys[-1]) == "x" * 300
+    assert cache.get(keys[0]) is None
+
+
+def test_switching_format_reuses_ocr(tmp_path, monkeypatch):
+    # With the Tesseract vocabulary on (the default), shared by every document type
+    monkeypatch.delenv("RXTRACT_TESSERACT_VOCAB", raising=False)
+    engine = CountingEngine()
+    monkeypatch.setattr(extractor, "OCR_ENGINE", ocr_cache.CachedEngine(engine, ocr_cache.OCRCache(str(tmp_path))))
+    image_path = str(tmp_path / "scan.png")
+    cv2.imwrite(image_path, np.full((120, 100, 3), 255, dtype=np.uint8))
+
+    extractor.extract(image_path, "prescription")
+    ocr_calls = len(engine.calls)
+    assert ocr_calls == len(extractor.OCR_CONFIGS)
+    data = extractor.extract(image_path, "patient_details")
+    assert len(engine.calls) == ocr_calls
+    assert data["has_insurance"] == "Yes"
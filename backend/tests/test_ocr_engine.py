@@ -0,0 +1,79 @@
+import os
+import stat
+import sys
+
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+
+import ocr_engine
+import utils
+
+FAKE_TESSERACT = """#!{python}
+import sys
+data = sys.stdin.buffer.read()
+magic, size, maxval, pixels = data.split(b"\\n", 3)
+width, height = map(int, size.split())
+assert magic == b"P5" and len(pixels) == width * height, "bad PGM"
+print("args", " ".join(sys.argv[1:]))
+print("size", width, height)
+"""
+
+
+def legacy_preprocess(img):
+    gray = cv2.cvtColor(np.array(img), cv2.COLOR_BGR2GRAY)
+    resized = cv2.resize(gray, None, fx=1.5, fy=1.5, interpolation=cv2.INTER_LINEAR)
+    denoised = cv2.bilateralFilter(resized, 9, 75, 75)
+    processed = cv2.adaptiveThreshold(denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 65, 13)
+    return cv2.morphologyEx(processed, cv2.MORPH_CLOSE, np.ones((1, 1), np.uint8))
+
+
+def test_preprocess_matches_legacy_steps_and_reuses_buffers():
+    # Same steps on the same array; the decode before them changed (see below)
+    img = np.random.default_rng(0).integers(0, 255, (301, 211, 3), dtype=np.uint8)
+    buffers = utils.ImageBuffers()
+    processed = utils.preprocess_image(img, buffers)
+    assert np.array_equal(processed, legacy_preprocess(img))
+    again = utils.preprocess_image(img, buffers)
+    assert np.shares_memory(processed, again)
+
+
+def test_color_pages_are_converted_with_the_right_channel_order():
+    from extractor import decode_image_bytes, pil_to_gray
+    from PIL import Image
+
+    red = np.zeros((8, 8, 3), dtype=np.uint8)
+    red[..., 2] = 255
+    data = cv2.imencode(".png", red)[1].tobytes()
+    # Luma of pure red is 0.299 * 255; the PIL RGB decode read as BGR gave 0.114 * 255
+    gray = cv2.cvtColor(decode_image_bytes(data), cv2.COLOR_BGR2GRAY)
+    assert gray[0, 0] == 76
+    assert pil_to_gray(Image.new("RGB", (8, 8), (255, 0, 0)))[0, 0] == 76
+    assert cv2.cvtColor(np.asarray(Image.new("RGB", (8, 8), (255, 0, 0))), cv2.COLOR_BGR2GRAY)[0, 0] == 29
+
+
+def test_pgm_buffer_is_zero_copy_for_preprocessed_pages():
+    processed = utils.preprocess_image(np.full((40, 30), 200, dtype=np.uint8), utils.ImageBuffers())
+    buffer = utils.pgm_buffer(processed)
+    assert isinstance(buffer, memoryview)
+    assert np.shares_memory(np.frombuffer(buffer, dtype=np.uint8), processed)
+    decoded = cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    assert np.array_equal(decoded, processed)
+
+    # Arbitrary arrays get a copied header + pixels
+    other = np.zeros((5, 7), dtype=np.uint8)
+    assert bytes(utils.pgm_buffer(other)) == b"P5\n7 5\n255\n" + bytes(35)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="uses a shebang script as the Tesseract binary")
+def test_tesseract_engine_pipes_raw_pgm_to_stdin(tmp_path):
+    fake = tmp_path / "tesseract"
+    fake.write_text(FAKE_TESSERACT.format(python=sys.executable))
+    fake.chmod(fake.stat().st_mode | stat.S_IEXEC)
+
+    engine = ocr_engine.TesseractEngine(tesseract_path=str(fake))
+    processed = utils.preprocess_image(np.full((40, 30), 200, dtype=np.uint8), utils.ImageBuffers())
+    output = engine.image_to_string(processed, lang="eng", config="--psm 6 --oem 3")
+    assert "args stdin stdout -l eng --psm 6 --oem 3" in output
+    assert "size 45 60" in output
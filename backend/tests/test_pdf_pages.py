@@ -0,0 +1,137 @@
+import io
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+import extractor
+from PyPDF2 import PdfWriter
+
+
+def text_pdf(lines):
+    """A one-page PDF whose only content is ``lines`` of text"""
+    stream = "BT /F1 12 Tf 72 720 Td 14 TL " + " ".join(f"({line}) '" for line in lines) + " ET"
+    return one_page_pdf(stream, "/Font << /F1 5 0 R >>",
+                        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+
+def image_pdf(data, image_filter):
+    """A one-page PDF showing a 600x800 grayscale image stored as ``data`` with ``image_filter``"""
+    return one_page_pdf("q 612 0 0 792 0 0 cm /Im1 Do Q", "/XObject << /Im1 5 0 R >>",
+                        f"<< /Type /XObject /Subtype /Image /Width 600 /Height 800 /ColorSpace /DeviceGray "
+                        f"/BitsPerComponent 8 /Filter {image_filter} /Length {len(data)} >>\n"
+                        f"stream\n{data.decode('latin-1')}\nendstream")
+
+
+def one_page_pdf(content, resources, resource_object):
+    """A one-page PDF drawing ``content`` with ``resources``, whose single object is ``resource_object``"""
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        f"/Resources << {resources} >> >>",
+        f"<< /Length {len(content)} >>\nstream\n{content}\nendstream",
+        resource_object,
+    ]
+    out, offsets = io.BytesIO(), []
+    out.write(b"%PDF-1.4\n")
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1"))
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode("latin-1"))
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1"))
+    return out.getvalue()
+
+
+def test_text_layer_pages_are_not_ocrd(tmp_path):
+    pdf_path = tmp_path / "typed.pdf"
+    pdf_path.write_bytes(text_pdf(["Name: Grace Okafor", "Address: 4 Elm Street, Boston", "Refill: 7 times"]))
+
+    [entry] = extractor.load_pdf_pages(str(pdf_path))
+    assert entry["source"] == "text_layer" and "Grace Okafor" in entry["text"]
+
+    data = extractor.extract(str(pdf_path), "prescription")
+    # The stub OCR engine would have read "Refill: 3"
+    assert data["refill"] == "7"
+    assert data["processing_info"]["pdf_pages"] == [{"page": 1, "pdf_page": 1, "source": "text_layer"}]
+
+
+def test_pages_without_images_or_text_are_rendered_at_ocr_dpi(tmp_path, monkeypatch):
+    writer = PdfWriter()
+    for _ in range(4):
+        writer.add_blank_page(width=612, height=792)
+    pdf_path = str(tmp_path / "vector.pdf")
+    with open(pdf_path, "wb") as f:
+        writer.write(f)
+
+    calls = []
+
+    def rasterize_page(file_path, page_number, dpi):
+        calls.append((page_number, dpi))
+        return np.full((int(11 * dpi), int(8.5 * dpi)), 255, dtype=np.uint8)
+
+    monkeypatch.setattr(extractor, "rasterize_page", rasterize_page)
+    entries = extractor.load_pdf_pages(pdf_path, page_range=(2, 3))
+    assert sorted(calls) == [(2, extractor.OCR_DPI), (3, extractor.OCR_DPI)]
+    assert [(entry["pdf_page"], entry["source"]) for entry in entries] == [(2, "rendered"), (3, "rendered")]
+    assert entries[0]["image"].shape == (11 * extractor.OCR_DPI, int(8.5 * extractor.OCR_DPI))
+
+    data = extractor.extract(pdf_path, "prescription", page_range=(4, 4))
+    assert data["processing_info"]["pdf_pages"] == [{"page": 1, "pdf_page": 4, "source": "rendered"}]
+    assert data["field_confidence"]["refill"]["page"] == 1
+
+
+@pytest.mark.parametrize("data, image_filter", [
+    (b"\xff\xd8 not a JPEG " * 50, "/DCTDecode"),  # read, but neither OpenCV nor PIL can decode it
+    (b"\x97JB2" + b"\x01" * 200, "/JBIG2Decode"),  # PyPDF2 cannot read it
+])
+def test_pages_with_undecodable_images_are_rendered(tmp_path, monkeypatch, data, image_filter):
+    pdf_path = tmp_path / "scan.pdf"
+    pdf_path.write_bytes(image_pdf(data, image_filter))
+    monkeypatch.setattr(extractor, "rasterize_page",
+                        lambda file_path, page_number, dpi: np.full((110, 85), 255, dtype=np.uint8))
+
+    [entry] = extractor.load_pdf_pages(str(pdf_path))
+    assert (entry["number"], entry["pdf_page"], entry["source"]) == (1, 1, "rendered")
+    assert entry["image"].shape == (110, 85)
+
+
+def test_early_stop_skips_pages_after_all_fields_are_found(tmp_path, monkeypatch):
+    pdf_path = tmp_path / "typed.pdf"
+    writer = PdfWriter()
+    for page in range(3):
+        writer.append(io.BytesIO(text_pdf([f"Name: Grace Okafor Page {page + 1}", "Refill: 7 times"])))
+    with open(pdf_path, "wb") as f:
+        writer.write(f)
+
+    assert "early_stop" not in extractor.extract(str(pdf_path), "prescription", early_stop=True)["processing_info"]
+    assert "early_stop" not in extractor.extract(str(pdf_path), "prescription")["processing_info"]
+
+    # Typed PDFs lose the blank lines the prescription parser needs: test the
+    # stopping logic itself here and the completeness check below
+    monkeypatch.setattr(extractor, "fields_complete", lambda parser, min_confidence: True)
+    data = extractor.extract(str(pdf_path), "prescription", early_stop=True)
+    assert data["refill"] == "7"
+    assert data["processing_info"]["early_stop"] == {"after_page": 1, "skipped_pages": [2, 3]}
+
+
+def test_fields_complete_requires_every_field():
+    from parser_prescription import PrescriptionParser
+    text = """Name: Grace Okafor Date: 5/11/2022
+
+Address: 4 Elm Street, Boston
+
+Prednisone 20 mg
+Lialda 2.4 gram
+
+Directions:
+
+Prednisone, take 1 tablet daily
+
+Refill: 7 times"""
+    assert extractor.fields_complete(PrescriptionParser(text))
+    assert not extractor.fields_complete(PrescriptionParser(text.replace("Refill: 7 times", "")))
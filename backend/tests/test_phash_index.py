@@ -0,0 +1,100 @@
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+
+import phash_index
+import utils
+
+
+def render_page(lines, noise_seed=None):
+    img = np.full((600, 450), 255, dtype=np.uint8)
+    for i, line in enumerate(lines):
+        cv2.putText(img, line, (20, 60 + 40 * i), cv2.FONT_HERSHEY_SIMPLEX, 0.8, 0, 2)
+    if noise_seed is not None:
+        # Simulate a re-scan: speckle noise and a one-pixel shift
+        rng = np.random.default_rng(noise_seed)
+        img[rng.random(img.shape) < 0.01] = 0
+        img = np.roll(img, 1, axis=1)
+    return img
+
+
+PRESCRIPTION = ["Name: Marta Sharapova", "Address: 9 tennis court", "Prednisone 20 mg", "Directions:", "Refill: 3"]
+OTHER = ["Patient Medical Record", "Jerry Lucas", "(279) 920-8204", "Medical Problems", "Hypertension"]
+
+
+def test_rescan_is_near_and_different_page_is_far():
+    original = phash_index.page_hash(render_page(PRESCRIPTION))
+    rescan = phash_index.page_hash(render_page(PRESCRIPTION, noise_seed=1))
+    other = phash_index.page_hash(render_page(OTHER))
+    assert phash_index.hamming_distance(original, rescan) <= 20
+    assert phash_index.hamming_distance(original, other) > 40
+
+
+def test_bk_tree_returns_matches_within_distance():
+    tree = phash_index.BKTree()
+    for key in [0b0000, 0b0001, 0b0011, 0b1111, 0b11100000]:
+        tree.add(key, key)
+    assert [value for _, value in tree.search(0b0000, 1)] == [0b0000, 0b0001]
+    assert sorted(value for _, value in tree.search(0b0111, 1)) == [0b0011, 0b1111]
+
+
+def test_index_persists_and_respects_threshold_and_config(tmp_path):
+    path = str(tmp_path / "index.jsonl")
+    index = phash_index.PageHashIndex(path=path, threshold=20)
+    page = render_page(PRESCRIPTION)
+    index.add(index.hash(page), page, "page text", ocr_config="tesseract:eng")
+
+    reloaded = phash_index.PageHashIndex(path=path, threshold=20)
+    assert len(reloaded) == 1
+    rescan = render_page(PRESCRIPTION, noise_seed=2)
+    distance, record = reloaded.lookup(reloaded.hash(rescan), rescan, ocr_config="tesseract:eng")
+    assert record["text"] == "page text"
+    assert reloaded.lookup(reloaded.hash(rescan), rescan, ocr_config="stub:eng") is None
+    other = render_page(OTHER)
+    assert reloaded.lookup(reloaded.hash(other), other, ocr_config="tesseract:eng") is None
+
+
+def test_same_template_with_a_different_dose_is_not_reused():
+    index = phash_index.PageHashIndex(threshold=20)
+    page = utils.preprocess_image(render_page(PRESCRIPTION)).copy()
+    index.add(index.hash(page), page, "page text")
+
+    rescan = utils.preprocess_image(render_page(PRESCRIPTION, noise_seed=4)).copy()
+    assert index.lookup(index.hash(rescan), rescan) is not None
+    for old, new in (("20 mg", "40 mg"), ("Refill: 3", "Refill: 5")):
+        changed = utils.preprocess_image(render_page([line.replace(old, new) for line in PRESCRIPTION])).copy()
+        # As close as a re-scan by hash, but the thumbnails show different text
+        assert phash_index.hamming_distance(index.hash(page), index.hash(changed)) <= 20
+        assert index.lookup(index.hash(changed), changed) is None
+
+
+def test_extract_reuses_ocr_for_duplicate_pages(tmp_path, monkeypatch):
+    import extractor
+
+    monkeypatch.setattr(phash_index, "_index", phash_index.PageHashIndex(threshold=20))
+    monkeypatch.setenv("RXTRACT_PHASH_THRESHOLD", "20")
+    calls = []
+    original_ocr = extractor.OCR_ENGINE.image_to_data
+    monkeypatch.setattr(extractor.OCR_ENGINE, "image_to_data",
+                        lambda *args, **kwargs: calls.append(1) or original_ocr(*args, **kwargs))
+
+    first, second = tmp_path / "first.png", tmp_path / "second.png"
+    cv2.imwrite(str(first), render_page(PRESCRIPTION))
+    cv2.imwrite(str(second), render_page(PRESCRIPTION, noise_seed=3))
+
+    data = extractor.extract(str(first), "prescription")
+    ocr_calls = len(calls)
+    assert ocr_calls > 0
+    assert data["processing_info"]["reused_ocr_pages"] == []
+
+    data = extractor.extract(str(second), "prescription")
+    assert len(calls) == ocr_calls
+    assert data["processing_info"]["reused_ocr_pages"][0]["page"] == 1
+    assert data["refill"] == "3"
+
+    third = tmp_path / "third.png"
+    cv2.imwrite(str(third), render_page([line.replace("20 mg", "40 mg") for line in PRESCRIPTION]))
+    data = extractor.extract(str(third), "prescription")
+    assert len(calls) > ocr_calls
+    assert data["processing_info"]["reused_ocr_pages"] == []
@@ -1,6 +1,5 @@
-from backend.src.parser_prescription import PrescriptionParser
+from parser_prescription import PrescriptionParser
 import pytest
-# Tests only work in PyCharm. In vs-code I get ModuleNotFoundError.
 
 @pytest.fixture()
 def doc_1_maria():
@@ -30,6 +29,11 @@ def test_get_name(doc_1_maria):
 def test_get_address(doc_1_maria):
     assert doc_1_maria.get_field("patient_address") == "9 tennis court, new Russia, DC"
 
+def test_get_medicines(doc_1_maria):
+    assert doc_1_maria.get_field("medicines") == "Prednisone 20 md\nLialda 2.4 gram"
+    text = doc_1_maria.text.replace("Directions:", "Dlrections:")
+    assert PrescriptionParser(text + "\n" * 5000).get_field("medicines") is None
+
 
 
 
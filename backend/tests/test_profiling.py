@@ -0,0 +1,63 @@
+import pstats
+import time
+import tracemalloc
+
+import pytest
+
+import profiling
+
+
+def work(progress):
+    progress({"stage": "decoded"})
+    buffers = [bytearray(100000) for _ in range(20)]
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+    progress({"stage": "ocr"})
+    return len(buffers)
+
+
+@pytest.mark.parametrize("mode, cpu_artifact", [("cprofile", "cpu.prof"), ("sampling", "cpu.folded")])
+def test_profiled_run_saves_summary_and_artifacts(tmp_path, mode, cpu_artifact):
+    store = profiling.ProfileStore(str(tmp_path))
+    events = []
+    result, profile_id = profiling.Profiler(store, interval=0.002).run(work, mode, label="test", progress=events.append)
+
+    assert result == 20
+    assert [event["stage"] for event in events] == ["decoded", "ocr"]
+    summary = store.summary(profile_id)
+    assert summary["mode"] == mode and summary["label"] == "test"
+    assert summary["stages"][0]["stage"] == "ocr"
+    assert any("work" in row["function"] for row in summary["functions"])
+    assert summary["allocations"]["peak_bytes"] >= 20 * 100000
+    assert summary["allocations"]["scope"] == "process"
+    assert summary["artifacts"] == [cpu_artifact, "allocations.snapshot", "summary.json"]
+    if mode == "cprofile":
+        pstats.Stats(store.artifact_path(profile_id, cpu_artifact))
+    tracemalloc.Snapshot.load(store.artifact_path(profile_id, "allocations.snapshot"))
+    assert not tracemalloc.is_tracing()
+
+
+def test_unprofiled_and_sampled_runs(tmp_path):
+    profiler = profiling.Profiler(profiling.ProfileStore(str(tmp_path)))
+    assert profiler.choose_mode() is None
+    assert profiler.run(lambda progress: progress, None) == (None, None)
+    assert profiler.choose_mode("1") == "sampling"
+    profiler.sample_rate = 1.0
+    assert profiler.choose_mode() == "sampling"
+    with pytest.raises(ValueError):
+        profiler.choose_mode("perf")
+
+
+def test_store_keeps_newest_profiles(tmp_path):
+    store = profiling.ProfileStore(str(tmp_path), max_profiles=2)
+    ids = []
+    for i in range(3):
+        profile_id, _ = store.create()
+        store.commit(profile_id, {"id": profile_id, "label": str(i), "mode": "sampling", "started_at": "",
+                                  "wall_seconds": 0, "artifacts": ["summary.json"]})
+        ids.append(profile_id)
+    assert [summary["label"] for summary in store.list()] == ["2", "1"]
+    assert store.summary(ids[0]) is None
+    assert store.artifact_path(ids[2], "summary.json").endswith("summary.json")
+    assert store.artifact_path(ids[2], "../../etc/passwd") is None
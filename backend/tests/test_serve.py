@@ -0,0 +1,78 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import pytest
+
+pytest.importorskip("uvicorn")
+pytest.importorskip("fastapi")
+if not hasattr(os, "fork"):
+    pytest.skip("serve.py needs fork()", allow_module_level=True)
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def health(port):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=2) as response:
+            return json.loads(response.read())
+    except OSError:
+        return None
+
+
+def test_workers_are_replaced_and_restarted(tmp_path):
+    port = free_port()
+    env = dict(os.environ, RXTRACT_OCR_ENGINE="stub", RXTRACT_UPLOAD_DIR=str(tmp_path))
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(SRC_DIR, "serve.py"), "--workers", "2", "--port", str(port),
+         "--graceful-timeout", "5", "--log-level", "warning"],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env,
+    )
+    started = []
+
+    def read_output():
+        for line in process.stdout:
+            if line.startswith("Started worker"):
+                started.append(int(line.split()[-1]))
+
+    threading.Thread(target=read_output, daemon=True).start()
+    try:
+        assert wait_for(lambda: health(port) is not None and len(started) == 2)
+        assert health(port)["pid"] in started
+
+        # A crashed worker is replaced
+        os.kill(started[0], signal.SIGKILL)
+        assert wait_for(lambda: len(started) == 3)
+
+        # SIGHUP replaces every worker
+        process.send_signal(signal.SIGHUP)
+        assert wait_for(lambda: len(started) == 5)
+        assert wait_for(lambda: health(port) is not None and health(port)["pid"] in started[3:])
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            assert process.wait(timeout=20) == 0
+        finally:
+            if process.poll() is None:
+                process.kill()
@@ -0,0 +1,56 @@
+import shlex
+
+import pytest
+
+import knowledge_base
+import tesseract_vocab
+
+
+def test_ocr_config_adds_the_vocabulary(monkeypatch):
+    config = tesseract_vocab.ocr_config("--psm 6 --oem 3")
+    args = shlex.split(config)
+    assert args[:4] == ["--psm", "6", "--oem", "3"]
+    with open(args[args.index("--user-words") + 1], encoding="utf-8") as f:
+        words = f.read().split()
+    # Names from the knowledge base and the labels of both document types
+    assert {"Prednisone", "prednisone", "Mesalamine", "Hypertension", "Directions", "Immunizations"} <= set(words)
+    with open(args[args.index("--user-patterns") + 1], encoding="utf-8") as f:
+        assert r"\d\d\d-\d\d\d-\d\d\d\d" in f.read().split()
+
+    # Same vocabulary, same files (and so the same OCR cache keys)
+    assert tesseract_vocab.ocr_config("--psm 6 --oem 3") == config
+    monkeypatch.setenv("RXTRACT_TESSERACT_VOCAB", "0")
+    assert tesseract_vocab.ocr_config("--psm 6 --oem 3") == "--psm 6 --oem 3"
+
+
+def test_vocabulary_files_follow_the_knowledge_base_content(tmp_path, monkeypatch):
+    kb = knowledge_base.get_knowledge_base()
+    words_path, _ = tesseract_vocab.vocabulary_files(kb, str(tmp_path))
+    assert tesseract_vocab.vocabulary_files(kb, str(tmp_path))[0] == words_path
+
+    # A source edited without bumping the version still gets its own files
+    monkeypatch.setattr(kb, "content_id", kb.content_id[:2] + (kb.content_id[2] + 1,))
+    monkeypatch.setattr(tesseract_vocab, "user_words", lambda kb: ["Edited"])
+    assert tesseract_vocab.vocabulary_files(kb, str(tmp_path))[0] != words_path
+
+
+@pytest.mark.parametrize("text, numeric", [
+    ("(279) 920-8204", True), ("17/12/2020", True), ("Refill: 3 times", False), ("Lialda", False), ("--", False),
+])
+def test_is_numeric(text, numeric):
+    assert tesseract_vocab.is_numeric(text) == numeric
+
+
+def test_numeric_config_whitelists_digits():
+    args = shlex.split(tesseract_vocab.numeric_config("--psm 7 --oem 3"))
+    assert args[-2:] == ["-c", "tessedit_char_whitelist=" + tesseract_vocab.NUMERIC_WHITELIST]
+
+
+@pytest.mark.parametrize("posix", [True, False])
+def test_config_args_survive_pytesseract_splitting(posix):
+    # pytesseract splits with posix=False on Windows, where quotes would stay in the value
+    for value in (tesseract_vocab.NUMERIC_WHITELIST, r"C:\rxtract\cache\prescription-1a2b.user-words"):
+        config = f"--psm 7 -c tessedit_char_whitelist={tesseract_vocab.config_arg(value, posix)}"
+        assert shlex.split(config, posix=posix)[-1] == "tessedit_char_whitelist=" + value
+    with pytest.raises(ValueError):
+        tesseract_vocab.config_arg(r"C:\Users\Jo Doe\user-words", posix=False)
@@ -0,0 +1,51 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import ocr_engine
+from parser_prescription import PrescriptionParser
+from word_table import WordTable
+
+
+def page_table(text, page=1, scale=1.0):
+    engine = ocr_engine.StubEngine(text=text, conf=90.0)
+    return WordTable.from_data(engine.image_to_data(np.zeros((300, 400), dtype=np.uint8)), page=page, scale=scale)
+
+
+def test_text_and_spans_line_up():
+    words = WordTable.concat([page_table("Name: Marta Sharapova\nRefill: 3"), page_table("Lialda 2.4 gram", page=2)])
+    assert words.text == "Name: Marta Sharapova\nRefill: 3\n\n\nLialda 2.4 gram\n\n\n"
+    assert words.words() == ["Name:", "Marta", "Sharapova", "Refill:", "3", "Lialda", "2.4", "gram"]
+    assert list(words["page"]) == [1, 1, 1, 1, 1, 2, 2, 2]
+    assert words.words(words.span_words(6, 21)) == ["Marta", "Sharapova"]
+
+
+def test_locate_maps_boxes_back_to_the_page():
+    words = page_table("Prednisone 20 mg\nLialda 2.4 gram", scale=2.0)
+    lialda = words.locate("LIALDA 2.4")
+    # The stub lays words out on a grid: line 2 of 2, first two of three columns
+    assert lialda == {"confidence": 90.0, "min_confidence": 90.0, "page": 1, "box": [0, 75, 132, 150]}
+    assert words.locate("metformin") is None
+
+
+def test_parser_reports_field_confidence():
+    parser = PrescriptionParser.from_words(page_table(ocr_engine.STUB_OCR_TEXT))
+    data = parser.parse()
+    assert data == PrescriptionParser(ocr_engine.STUB_OCR_TEXT).parse()
+    confidence = parser.field_confidence()
+    assert confidence["refill"]["confidence"] == 90.0
+    assert parser.text[slice(*parser.spans["refill"])] == data["refill"] == "3"
+    assert PrescriptionParser(ocr_engine.STUB_OCR_TEXT).field_confidence() == {}
+
+
+def test_extract_returns_field_confidence_and_medication_positions(tmp_path):
+    cv2 = pytest.importorskip("cv2")
+    from extractor import extract
+
+    image_path = str(tmp_path / "scan.png")
+    cv2.imwrite(image_path, np.full((200, 160, 3), 255, dtype=np.uint8))
+
+    data = extract(image_path, "prescription")
+    assert data["field_confidence"]["patient_name"]["page"] == 1
+    medications = data["ai_analysis"]["medications"]
+    assert medications and all(medication["ocr"]["confidence"] == 95.0 for medication in medications)
@@ -8,7 +8,13 @@ from PIL import Image
 import numpy as np
 from PyPDF2 import PdfReader
 import base64
+import hashlib
+import threading
 import time
+import csv
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 
 # Set page config must be the first Streamlit command
 st.set_page_config(
@@ -21,6 +27,13 @@ st.set_page_config(
 # Backend URL
 BACKEND_URL = "http://127.0.0.1:8000/extract_from_doc"
 
+# Limits for the extraction result cache shared by all sessions
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RXTRACT_RESULT_CACHE_ENTRIES", "128"))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RXTRACT_RESULT_CACHE_MB", "16")) * 1024 * 1024
+
+# Number of decoded previews kept across reruns
+PREVIEW_CACHE_MAX_ENTRIES = 32
+
 def is_venv():
     """Check if running in a virtual environment"""
     return (hasattr(sys, 'real_prefix') or
@@ -64,6 +77,254 @@ def convert_pdf_to_image(pdf_bytes):
         st.info("If you're seeing this error, the PDF might be in a format that's difficult to process.")
         return None
 
+@st.cache_resource
+def get_http_session():
+    """Shared keep-alive HTTP session to the backend"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+class ResultCache:
+    """Thread-safe LRU of extraction responses bounded by entry count and total JSON size"""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return json.loads(self._entries[key])
+
+    def put(self, key, data):
+        encoded = json.dumps(data)
+        if len(encoded) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key))
+            self._entries[key] = encoded
+            self._bytes += len(encoded)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+@st.cache_resource
+def get_result_cache():
+    """Extraction responses keyed by (content hash, doc type), shared across sessions"""
+    return ResultCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MAX_BYTES)
+
+def file_content_hash(file_bytes):
+    return hashlib.sha256(file_bytes).hexdigest()
+
+@st.cache_data(max_entries=PREVIEW_CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_preview(file_hash, file_ext, _file_bytes):
+    """
+    Decode the preview image once per file content.
+
+    Only ``file_hash`` and ``file_ext`` form the cache key; the bytes are
+    passed with a leading underscore so Streamlit does not hash them again.
+    """
+    if file_ext == '.pdf':
+        return convert_pdf_to_image(_file_bytes)
+    image = Image.open(io.BytesIO(_file_bytes))
+    image.load()
+    return image
+
+def iter_sse_events(response):
+    """Yield (event, data) pairs from a Server-Sent Events response"""
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
+def progress_fraction(event):
+    """Map a backend progress event to a (fraction, message) pair for the progress bar"""
+    stage = event.get("stage")
+    if stage == "decoded":
+        return 0.1, f"Decoded {event.get('pages', 0)} page(s)"
+    if stage == "ocr":
+        pages = max(event.get("pages", 1), 1)
+        return 0.1 + 0.7 * event.get("page", 0) / pages, f"OCR page {event.get('page')} of {pages}"
+    if stage == "parsed":
+        return 0.85, "Parsed extracted text"
+    if stage == "analyzed":
+        return 0.95, "Analysis complete"
+    return None, None
+
+def extract_with_progress(files, form_data, progress_bar):
+    """
+    Call the streaming extraction endpoint and update ``progress_bar`` as
+    progress events arrive.
+
+    Returns:
+        tuple: (status_code, data) where data is the extraction result or error detail
+    """
+    with get_http_session().post(f"{BACKEND_URL}/stream", files=files, data=form_data, stream=True) as response:
+        if response.status_code != 200:
+            try:
+                return response.status_code, response.json()
+            except ValueError:
+                return response.status_code, {}
+        
+        for event, data in iter_sse_events(response):
+            if event == "progress":
+                fraction, message = progress_fraction(data)
+                if fraction is not None:
+                    progress_bar.progress(fraction, text=message)
+            elif event == "result":
+                progress_bar.progress(1.0, text="Done")
+                return 200, data
+            elif event == "error":
+                return 500, data
+    return 500, {"detail": "Connection closed before the result was received"}
+
+def mime_type(file_name):
+    file_ext = os.path.splitext(file_name)[1].lower()
+    return f"application/{file_ext[1:]}" if file_ext == '.pdf' else f"image/{file_ext[1:]}"
+
+def extract_document(file_name, file_bytes, doc_type, session, result_cache):
+    """
+    Extract one document without progress reporting, using the result cache.
+
+    Safe to call from worker threads: it makes no Streamlit calls, so the
+    session and cache are fetched on the script thread and passed in.
+
+    Returns:
+        dict: file name, status, elapsed seconds, whether it was cached, and the data or error
+    """
+    start = time.perf_counter()
+    cache_key = (file_content_hash(file_bytes), doc_type)
+    cached_result = result_cache.get(cache_key)
+    if cached_result is not None:
+        return {"file": file_name, "status": "ok", "cached": True,
+                "seconds": time.perf_counter() - start, "data": cached_result}
+    
+    try:
+        response = session.post(
+            BACKEND_URL,
+            files={"file": (file_name, file_bytes, mime_type(file_name))},
+            data={"file_format": doc_type}
+        )
+        if response.status_code == 200:
+            data = response.json()
+            if "error" in data:
+                return {"file": file_name, "status": "error", "cached": False,
+                        "seconds": time.perf_counter() - start, "error": data["error"]}
+            result_cache.put(cache_key, data)
+            return {"file": file_name, "status": "ok", "cached": False,
+                    "seconds": time.perf_counter() - start, "data": data}
+        try:
+            detail = response.json().get("detail", "Unknown error")
+        except ValueError:
+            detail = "Unknown error"
+        error = f"Server returned status code {response.status_code} - {detail}"
+    except requests.exceptions.ConnectionError:
+        error = "Could not connect to the backend server"
+    except Exception as e:
+        error = str(e)
+    return {"file": file_name, "status": "error", "cached": False,
+            "seconds": time.perf_counter() - start, "error": error}
+
+def batch_table_rows(results):
+    """Flatten batch results into table rows, one per file"""
+    rows = []
+    for result in results:
+        row = {
+            "file": result["file"],
+            "status": result["status"],
+            "seconds": round(result["seconds"], 2),
+            "cached": result["cached"],
+        }
+        if result["status"] == "ok":
+            for key, value in result["data"].items():
+                if key != "ai_analysis" and not isinstance(value, (dict, list)):
+                    row[key] = value
+        else:
+            row["error"] = result.get("error", "")
+        rows.append(row)
+    return rows
+
+def rows_to_csv(rows):
+    columns = []
+    for row in rows:
+        for key in row:
+            if key not in columns:
+                columns.append(key)
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=columns)
+    writer.writeheader()
+    writer.writerows(rows)
+    return output.getvalue()
+
+def batch_mode(doc_type):
+    """Upload many documents and extract them concurrently"""
+    st.subheader("Batch Upload")
+    
+    files = st.file_uploader(
+        "Choose files",
+        type=["pdf", "jpg", "jpeg", "png", "bmp", "tif", "tiff"],
+        accept_multiple_files=True
+    )
+    max_in_flight = st.slider("Maximum concurrent requests", min_value=1, max_value=16, value=4)
+    
+    if files and st.button(f"Process {len(files)} Documents", type="primary"):
+        documents = [(file.name, file.getvalue()) for file in files]
+        session, result_cache = get_http_session(), get_result_cache()
+        results = []
+        progress_bar = st.progress(0.0, text=f"0 of {len(documents)} documents processed")
+        summary, table = st.empty(), st.empty()
+        
+        # Requests run on worker threads; the table is only updated here on the script thread
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            futures = [pool.submit(extract_document, name, content, doc_type, session, result_cache) for name, content in documents]
+            for future in as_completed(futures):
+                results.append(future.result())
+                progress_bar.progress(len(results) / len(documents),
+                                      text=f"{len(results)} of {len(documents)} documents processed")
+                table.dataframe(batch_table_rows(results), use_container_width=True)
+        
+        st.session_state["batch_results"] = results
+        st.session_state["batch_doc_type"] = doc_type
+    else:
+        # The final table replaces the live one when a batch was just processed
+        summary, table = st.empty(), st.empty()
+    
+    results = st.session_state.get("batch_results")
+    if not results:
+        return
+    
+    rows = batch_table_rows(results)
+    failed = sum(1 for result in results if result["status"] != "ok")
+    summary.write(f"**{len(results) - failed}** succeeded, **{failed}** failed "
+                  f"({st.session_state.get('batch_doc_type')})")
+    table.dataframe(rows, use_container_width=True)
+    
+    col_csv, col_json = st.columns(2)
+    with col_csv:
+        st.download_button("Download CSV", rows_to_csv(rows), file_name="extraction_results.csv", mime="text/csv")
+    with col_json:
+        full_results = [
+            {"file": result["file"], "status": result["status"],
+             "data": result.get("data"), "error": result.get("error")}
+            for result in results
+        ]
+        st.download_button("Download JSON", json.dumps(full_results, indent=2),
+                           file_name="extraction_results.json", mime="application/json")
+
 def check_tesseract():
     """Check if Tesseract is available and return its path"""
     tesseract_path = os.environ.get("TESSERACT_PATH", "C:/Program Files/Tesseract-OCR/tesseract.exe")
@@ -71,6 +332,13 @@ def check_tesseract():
         return True, tesseract_path
     return False, tesseract_path
 
+def detected_doc_type(doc_type, data):
+    """Document type to display: the backend's detection for "auto" requests"""
+    if doc_type != "auto":
+        return doc_type
+    classification = data.get("processing_info", {}).get("classification", {})
+    return classification.get("file_format", "prescription")
+
 def display_prescription_data(data):
     st.subheader("Extracted Prescription Information")
     
@@ -196,6 +464,12 @@ def main():
            ```
         """)
     
+    mode = st.sidebar.radio("Mode", ["Single document", "Batch"])
+    if mode == "Batch":
+        batch_doc_type = st.selectbox("Select Document Type", ["auto", "prescription", "patient_details"])
+        batch_mode(batch_doc_type)
+        return
+    
     # File upload
     st.subheader("Upload Document")
     
@@ -209,7 +483,8 @@ def main():
         # Document type selection
         doc_type = st.selectbox(
             "Select Document Type",
-            ["prescription", "patient_details"]
+            ["auto", "prescription", "patient_details"],
+            help="auto detects whether the document is a prescription or patient details"
         )
     
     if file:
@@ -222,55 +497,60 @@ def main():
                 
                 # Handle different file types
                 file_ext = os.path.splitext(file.name)[1].lower()
+                file_bytes = file.getvalue()
+                file_hash = file_content_hash(file_bytes)
                 
-                if file_ext == '.pdf':
-                    # For PDFs, try to convert to image for display
-                    image = convert_pdf_to_image(file.getvalue())
-                    if image:
-                        st.image(image, use_container_width=True)
-                    else:
-                        st.info("PDF preview not available. You can still process the document.")
-                else:
-                    # For images, display directly
-                    image = Image.open(file)
+                # Decoded previews are cached by content hash across reruns
+                image = cached_preview(file_hash, file_ext, file_bytes)
+                if image:
                     st.image(image, use_container_width=True)
+                elif file_ext == '.pdf':
+                    st.info("PDF preview not available. You can still process the document.")
             
             # Process document button
             process_button = st.button("Process Document", type="primary")
             
-            if process_button:
+            cache_key = (file_hash, doc_type)
+            cached_result = get_result_cache().get(cache_key)
+            
+            if process_button and cached_result is not None:
+                # This file was already extracted as this document type
+                with col_results:
+                    shown_type = detected_doc_type(doc_type, cached_result)
+                    if shown_type == "prescription":
+                        display_prescription_data(cached_result)
+                    elif shown_type == "patient_details":
+                        display_patient_details(cached_result)
+                    st.success("✅ Loaded previously extracted result")
+            elif process_button:
                 with st.spinner("Processing document..."):
-                    # Show progress
-                    progress_bar = st.progress(0)
-                    for i in range(100):
-                        # Update progress bar
-                        progress_bar.progress(i + 1)
-                        time.sleep(0.01)
+                    # Show real progress reported by the backend
+                    progress_bar = st.progress(0.0, text="Uploading document")
                     
                     # Prepare the file for the API request
-                    files = {"file": (file.name, file.getvalue(), f"application/{file_ext[1:]}" if file_ext == '.pdf' else f"image/{file_ext[1:]}")}
+                    files = {"file": (file.name, file_bytes, f"application/{file_ext[1:]}" if file_ext == '.pdf' else f"image/{file_ext[1:]}")}
                     form_data = {"file_format": doc_type}
                     
                     try:
                         # Make API request to backend
-                        response = requests.post(BACKEND_URL, files=files, data=form_data)
+                        status_code, response_data = extract_with_progress(files, form_data, progress_bar)
                         
                         # Handle response
-                        if response.status_code == 200:
+                        if status_code == 200:
+                            if "error" not in response_data:
+                                get_result_cache().put(cache_key, response_data)
                             with col_results:
-                                extracted_data = response.json()
-                                if doc_type == "prescription":
+                                extracted_data = response_data
+                                shown_type = detected_doc_type(doc_type, extracted_data)
+                                if shown_type == "prescription":
                                     display_prescription_data(extracted_data)
-                                elif doc_type == "patient_details":
+                                elif shown_type == "patient_details":
                                     display_patient_details(extracted_data)
                                 st.success("✅ Document processed successfully!")
                         else:
-                            error_msg = f"Server returned status code {response.status_code}"
-                            try:
-                                error_detail = response.json().get("detail", "Unknown error")
-                                error_msg += f" - {error_detail}"
-                            except:
-                                pass
+                            error_msg = f"Server returned status code {status_code}"
+                            if isinstance(response_data, dict):
+                                error_msg += f" - {response_data.get('detail', 'Unknown error')}"
                             st.error(error_msg)
                             
                             # Provide helpful guidance for common errors